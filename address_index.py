@@ -0,0 +1,249 @@
+"""
+Подсказки адресов из прошлых заявок.
+
+Пользователи снова и снова вводят одни и те же адреса домов, причём
+по-разному: "Красноярск ул. Тельмана д. 1" и "красноярск, тельмана 1".
+Индекс хранит нормализованные адреса (нижний регистр, ё -> е, без
+знаков препинания и слов "ул.", "д." и т.п.) отдельно по районам и
+ищет их по началу любого слова, так что "тельм" находит адрес выше.
+
+Для каждого района хранится отсортированный список хвостов адресов
+с начала каждого слова: поиск двоичный, а из совпадений просматривается
+не больше MAX_SCAN, плюс самые частые адреса района. Поэтому поиск
+занимает доли миллисекунды даже на сотнях тысяч адресов.
+
+Индекс строится из kgm_requests и quality_complaints при запуске и
+пополняется при каждой сохранённой заявке. В режиме шардов у каждого
+процесса свой индекс, и заявки, сохранённые другими процессами,
+попадают в него после перезапуска.
+"""
+import re
+import sqlite3
+from bisect import bisect_left
+from heapq import nlargest
+from typing import Iterator
+
+# Слова, которые пишут по-разному или пропускают
+ADDRESS_STOP_WORDS = frozenset((
+    'г', 'гор', 'город', 'ул', 'улица', 'д', 'дом', 'пр', 'т', 'пркт',
+    'просп', 'проспект', 'пер', 'переулок',
+))
+# Короче этого подсказки бесполезны: совпадёт половина адресов
+MIN_QUERY_LENGTH = 3
+# Сколько совпадений просматривать в районе, чтобы выбрать частые
+MAX_SCAN = 100
+# Сколько самых частых адресов района держать для коротких запросов
+POPULAR_SIZE = 300
+
+_WORD = re.compile(r'[0-9a-zа-я]+')
+
+
+def normalize_address(address: str) -> str:
+    """Приводит адрес к виду, в котором сравниваются адреса."""
+    words = _WORD.findall(address.lower().replace('ё', 'е'))
+    return ' '.join(word for word in words if word not in ADDRESS_STOP_WORDS)
+
+
+def fetch_addresses(conn: sqlite3.Connection) -> list[tuple]:
+    """
+    Читает адреса прошлых заявок и обращений.
+
+    Returns:
+        list: Строки (район, адрес, количество заявок).
+    """
+    return conn.execute(
+        'SELECT district, adress, COUNT(*) FROM kgm_requests '
+        'GROUP BY district, adress '
+        'UNION ALL '
+        'SELECT district, address, COUNT(*) FROM quality_complaints '
+        'GROUP BY district, address').fetchall()
+
+
+def load_address_index(conn: sqlite3.Connection,
+                       index: 'AddressIndex') -> int:
+    """
+    Строит индекс по адресам прошлых заявок и обращений.
+
+    Returns:
+        int: Количество различных адресов в индексе.
+    """
+    return index.build(fetch_addresses(conn))
+
+
+class DistrictAddresses:
+    """Адреса одного района."""
+
+    def __init__(self):
+        # Нормализованный адрес -> адрес, как его ввели впервые
+        self.titles: dict[str, str] = {}
+        # Нормализованный адрес -> количество заявок
+        self.counts: dict[str, int] = {}
+        # Хвосты адресов с начала каждого слова по алфавиту и
+        # нормализованные адреса, которым они принадлежат
+        self._suffixes: list[str] = []
+        self._keys: list[str] = []
+        # Самые частые адреса, от частых к редким
+        self._popular: list[str] = []
+
+    @staticmethod
+    def _word_suffixes(key: str) -> Iterator[str]:
+        yield key
+        position = key.find(' ')
+        while position >= 0:
+            yield key[position + 1:]
+            position = key.find(' ', position + 1)
+
+    def add(self, key: str, address: str, count: int = 1) -> None:
+        """Учитывает count заявок по адресу с нормализованным видом key."""
+        if key in self.counts:
+            self.counts[key] += count
+        else:
+            self.titles[key] = address.strip()
+            self.counts[key] = count
+            for suffix in self._word_suffixes(key):
+                position = bisect_left(self._suffixes, suffix)
+                self._suffixes.insert(position, suffix)
+                self._keys.insert(position, key)
+        self._promote(key)
+
+    def _promote(self, key: str) -> None:
+        popular = self._popular
+        if key not in popular:
+            if (len(popular) >= POPULAR_SIZE
+                    and self.counts[key] <= self.counts[popular[-1]]):
+                return
+            popular.append(key)
+        popular.sort(key=self.counts.__getitem__, reverse=True)
+        del popular[POPULAR_SIZE:]
+
+    def load(self, titles: dict[str, str], counts: dict[str, int]) -> None:
+        """Заменяет адреса района, сортируя хвосты один раз."""
+        suffixes, keys = [], []
+        for key in titles:
+            for suffix in self._word_suffixes(key):
+                suffixes.append(suffix)
+                keys.append(key)
+        order = sorted(range(len(suffixes)), key=suffixes.__getitem__)
+        self._suffixes = [suffixes[i] for i in order]
+        self._keys = [keys[i] for i in order]
+        self._popular = nlargest(POPULAR_SIZE, counts, key=counts.__getitem__)
+        self.titles = titles
+        self.counts = counts
+
+    def matches(self, query: str, limit: int) -> set[str]:
+        """
+        Нормализованные адреса, в которых слово начинается с query.
+
+        Если совпадений больше MAX_SCAN, просматриваются первые MAX_SCAN
+        из них и самые частые адреса района, чтобы короткий запрос
+        не перебирал весь район.
+        """
+        start = bisect_left(self._suffixes, query)
+        # Символы нормализованного адреса меньше '\uffff'
+        end = bisect_left(self._suffixes, query + '\uffff', start)
+        if end - start <= MAX_SCAN:
+            return set(self._keys[start:end])
+        found = set(self._keys[start:start + MAX_SCAN])
+        word = ' ' + query
+        for key in self._popular:
+            if key.startswith(query) or word in key:
+                found.add(key)
+                limit -= 1
+                if not limit:
+                    break
+        return found
+
+
+class AddressIndex:
+    """Адреса прошлых заявок по районам с поиском по началу слов."""
+
+    def __init__(self):
+        self._districts: dict[str, DistrictAddresses] = {}
+
+    def __len__(self) -> int:
+        return sum(len(district.counts)
+                   for district in self._districts.values())
+
+    def _district(self, district: str | None) -> DistrictAddresses:
+        name = district or ''
+        if name not in self._districts:
+            self._districts[name] = DistrictAddresses()
+        return self._districts[name]
+
+    def build(self, rows: list[tuple]) -> int:
+        """
+        Строит индекс заново.
+
+        Args:
+            rows (list): Строки (район, адрес, количество заявок),
+                как их возвращает fetch_addresses.
+
+        Returns:
+            int: Количество различных адресов в индексе.
+        """
+        titles: dict[str, dict[str, str]] = {}
+        counts: dict[str, dict[str, int]] = {}
+        for district, address, count in rows:
+            key = normalize_address(address or '')
+            if not key:
+                continue
+            district = district or ''
+            district_counts = counts.setdefault(district, {})
+            if key in district_counts:
+                district_counts[key] += count
+            else:
+                titles.setdefault(district, {})[key] = address.strip()
+                district_counts[key] = count
+        districts = {}
+        for name in counts:
+            districts[name] = DistrictAddresses()
+            districts[name].load(titles[name], counts[name])
+        self._districts = districts
+        return len(self)
+
+    def add(self, district: str | None, address: str | None) -> None:
+        """Учитывает адрес сохранённой заявки."""
+        key = normalize_address(address or '')
+        if key:
+            self._district(district).add(key, address)
+
+    def lookup(self, text: str, district: str | None = None,
+               limit: int = 5) -> list[str]:
+        """
+        Ищет адреса, похожие на введённый текст.
+
+        Args:
+            text (str): Начало адреса, которое ввёл пользователь.
+            district (str): Район, None - все районы.
+            limit (int): Сколько адресов вернуть.
+
+        Returns:
+            list: Адреса в том виде, в каком их ввели впервые, сначала
+                самые частые.
+        """
+        query = normalize_address(text)
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+        if district is None:
+            districts = list(self._districts.values())
+        elif district in self._districts:
+            districts = [self._districts[district]]
+        else:
+            return []
+        counts: dict[str, int] = {}
+        titles: dict[str, str] = {}
+        for addresses in districts:
+            for key in addresses.matches(query, limit):
+                counts[key] = counts.get(key, 0) + addresses.counts[key]
+                titles.setdefault(key, addresses.titles[key])
+        return [titles[key]
+                for key in nlargest(limit, counts, key=counts.__getitem__)]
+
+    def is_known(self, text: str, district: str | None = None) -> bool:
+        """Такой адрес уже был в заявках (с точностью до написания)."""
+        key = normalize_address(text)
+        if district is not None:
+            addresses = self._districts.get(district)
+            return addresses is not None and key in addresses.counts
+        return any(key in addresses.counts
+                   for addresses in self._districts.values())
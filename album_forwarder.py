@@ -0,0 +1,62 @@
+"""
+Пересылка заявок в группу сотрудников альбомами.
+
+Без окна каждая заявка отправляется отдельным send_photo. С окном
+window фото с подписями, пришедшие в один чат за window секунд,
+собираются в альбомы send_media_group до 10 фото; у каждого фото
+остаётся своя подпись. Так утром вместо десятков сообщений и запросов
+к Bot API в группу приходит несколько альбомов, а задержку одной
+заявки ограничивает window.
+"""
+from aiogram import Bot
+from aiogram.types import InputMediaPhoto
+
+from batching import BatchQueue
+
+# Больше фото Telegram в один альбом не принимает
+MAX_ALBUM_SIZE = 10
+
+
+class AlbumForwarder:
+    """Отправляет фото с подписями по одному или альбомами."""
+
+    def __init__(self, bot: Bot, window: float = 0,
+                 max_size: int = MAX_ALBUM_SIZE):
+        """
+        Args:
+            bot (Bot): Бот, от имени которого отправляются фото.
+            window (float): Сколько секунд копить фото для альбома,
+                0 - отправлять сразу по одному.
+            max_size (int): Фото в одном альбоме, не больше 10.
+        """
+        self.bot = bot
+        self.window = window
+        self._queue = BatchQueue(self._flush, min(max_size, MAX_ALBUM_SIZE),
+                                 window)
+
+    async def send_photo(self, chat_id, photo: str, caption: str) -> None:
+        """
+        Отправляет фото в чат и ждёт отправки.
+
+        При ошибке отправки альбома она пробрасывается каждой заявке
+        из альбома, и каждая повторит отправку сама.
+        """
+        if self.window <= 0:
+            await self.bot.send_photo(chat_id=chat_id, photo=photo,
+                                      caption=caption)
+            return
+        await self._queue.add(chat_id, (photo, caption))
+
+    async def close(self) -> None:
+        """Отправляет накопленные фото."""
+        await self._queue.close()
+
+    async def _flush(self, chat_id, items: list) -> None:
+        if len(items) == 1:
+            photo, caption = items[0]
+            await self.bot.send_photo(chat_id=chat_id, photo=photo,
+                                      caption=caption)
+            return
+        await self.bot.send_media_group(chat_id=chat_id, media=[
+            InputMediaPhoto(media=photo, caption=caption)
+            for photo, caption in items])
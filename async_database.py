@@ -0,0 +1,215 @@
+"""
+Асинхронный слой доступа к базе данных.
+
+Держит долгоживущие соединения SQLite: одно для записи и несколько для
+чтения. Запросы выполняются в потоках, поэтому цикл событий aiogram
+не блокируется на открытии файла и fsync.
+"""
+import asyncio
+import os
+import sqlite3
+from typing import Any, Callable
+
+from address_index import AddressIndex
+from executors import BlockingExecutor
+from database_functions import (connect, fetch_user, fetch_users, init_db,
+                                insert_user, insert_kgm_request,
+                                insert_quality_complaint, update_photo_link)
+from stats import fetch_rollup
+from user_cache import UserCache
+
+
+class AsyncDatabase:
+    """Пул соединений SQLite с асинхронным интерфейсом."""
+
+    def __init__(self, db_path: str, readers: int = 3,
+                 user_cache: UserCache | None = None,
+                 executor: BlockingExecutor | None = None,
+                 address_index: AddressIndex | None = None):
+        """
+        Args:
+            db_path (str): Путь к файлу базы данных.
+            readers (int): Количество соединений для чтения.
+            user_cache (UserCache): Кэш профилей пользователей.
+            executor (BlockingExecutor): Пул потоков с лимитом бэкенда
+                sqlite. Без него используется пул цикла событий.
+            address_index (AddressIndex): Индекс адресов для подсказок,
+                пополняется сохранёнными заявками.
+        """
+        self.db_path = db_path
+        self.user_cache = user_cache
+        self.executor = executor
+        self.address_index = address_index
+        self._readers_count = max(1, readers)
+        self._writer: sqlite3.Connection | None = None
+        self._writer_lock = asyncio.Lock()
+        self._readers: asyncio.Queue | None = None
+        self._open_lock = asyncio.Lock()
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = connect(self.db_path, timeout=30, check_same_thread=False)
+        if read_only:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    async def _run(self, func: Callable, *args,
+                   interrupt: Callable | None = None,
+                   operation: str | None = None) -> Any:
+        if self.executor is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, func, *args)
+        # При таймауте прерываем запрос, чтобы соединение освободилось
+        return await self.executor.run('sqlite', func, *args,
+                                       on_timeout=interrupt,
+                                       operation=operation)
+
+    async def open(self) -> None:
+        """Создаёт таблицы и открывает соединения, если они ещё не открыты."""
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            folder, name = os.path.split(self.db_path)
+            await self._run(init_db, folder or '.', name)
+            readers = asyncio.Queue()
+            for _ in range(self._readers_count):
+                readers.put_nowait(await self._run(self._connect, True))
+            self._writer = await self._run(self._connect)
+            self._readers = readers
+
+    async def close(self) -> None:
+        """Закрывает все соединения пула."""
+        if self._writer is None:
+            return
+        async with self._writer_lock:
+            await self._run(self._writer.close)
+            self._writer = None
+        while not self._readers.empty():
+            conn = self._readers.get_nowait()
+            await self._run(conn.close)
+        self._readers = None
+
+    async def read(self, func: Callable, *args) -> Any:
+        """
+        Выполняет func(conn, *args) на свободном соединении для чтения.
+        """
+        if self._writer is None:
+            await self.open()
+        conn = await self._readers.get()
+        try:
+            return await self._run(func, conn, *args,
+                                   interrupt=conn.interrupt,
+                                   operation=func.__name__)
+        finally:
+            self._readers.put_nowait(conn)
+
+    async def write(self, func: Callable, *args) -> Any:
+        """
+        Выполняет func(conn, *args) в транзакции на соединении для записи.
+
+        При ошибке транзакция откатывается, исключение пробрасывается.
+        """
+        if self._writer is None:
+            await self.open()
+        async with self._writer_lock:
+            return await self._run(self._in_transaction, func, *args,
+                                   interrupt=self._writer.interrupt,
+                                   operation=func.__name__)
+
+    def _in_transaction(self, func: Callable, *args) -> Any:
+        with self._writer:
+            return func(self._writer, *args)
+
+    async def is_user_registered(self, user_id: int) -> bool:
+        """Проверка пользователя на наличие в базе данных."""
+        return bool(await self.get_user_by_id(user_id))
+
+    async def get_user_by_id(self, user_id: int) -> dict:
+        """
+        Получает информацию о пользователе по user_id.
+
+        Сначала ищет профиль в кэше, при промахе читает базу данных.
+        Отсутствующие пользователи не кэшируются, чтобы регистрация
+        становилась видна сразу.
+
+        Returns:
+            dict: Профиль пользователя или пустой словарь.
+        """
+        if self.user_cache is not None:
+            profile = self.user_cache.get(user_id)
+            if profile is not None:
+                return profile
+        profile = await self.read(fetch_user, user_id)
+        if profile and self.user_cache is not None:
+            self.user_cache.put(user_id, profile)
+        return profile
+
+    async def register_user(self, user_id: int, full_name: str,
+                            phone_number: str, workplace: str,
+                            username: str) -> None:
+        """Сохранение пользователя в базе данных."""
+        if self.user_cache is not None:
+            # Старый профиль не должен пережить запись, даже неудачную
+            self.user_cache.invalidate(user_id)
+        await self.write(insert_user, user_id, full_name, phone_number,
+                         workplace, username)
+        if self.user_cache is not None:
+            self.user_cache.put(user_id, {
+                "id": user_id,
+                "full_name": full_name,
+                "phone_number": phone_number,
+                "workplace": workplace,
+                "username": username,
+            })
+
+    async def warm_user_cache(self) -> int:
+        """
+        Заполняет кэш профилями из таблицы users.
+
+        Returns:
+            int: Количество загруженных профилей.
+        """
+        if self.user_cache is None:
+            return 0
+        profiles = await self.read(fetch_users, self.user_cache.maxsize)
+        # Загружаем от старых к новым, чтобы новые были последними в LRU
+        for profile in reversed(profiles):
+            self.user_cache.put(profile["id"], profile)
+        return len(profiles)
+
+    async def save_kgm_request(self, *args) -> None:
+        """
+        Сохраняет заявку на вывоз КГМ.
+
+        Аргументы совпадают с database_functions.insert_kgm_request
+        без соединения.
+        """
+        if await self.write(insert_kgm_request, *args):
+            self._index_address(*args[3:5])
+
+    async def save_quality_complaint(self, *args) -> None:
+        """
+        Сохраняет жалобу на качество услуг.
+
+        Аргументы совпадают с database_functions.insert_quality_complaint
+        без соединения.
+        """
+        if await self.write(insert_quality_complaint, *args):
+            self._index_address(*args[3:5])
+
+    async def set_photo_link(self, kind: str, outbox_id: int,
+                             photo_link: str) -> None:
+        """Записывает ссылку на фото в заявку, сохранённую задачей outbox."""
+        await self.write(update_photo_link, kind, outbox_id, photo_link)
+
+    def _index_address(self, address: str, district: str) -> None:
+        if self.address_index is not None:
+            self.address_index.add(district, address)
+
+    async def get_stats(self, starts: tuple[int, ...]) -> list[tuple]:
+        """
+        Читает статистику заявок из сводной таблицы.
+
+        Аргументы и результат совпадают с stats.fetch_rollup
+        без соединения.
+        """
+        return await self.read(fetch_rollup, starts)
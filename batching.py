@@ -0,0 +1,116 @@
+"""
+Вспомогательные классы для пакетной отправки данных во внешние сервисы.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+FlushFunc = Callable[[Hashable, list], Awaitable[None]]
+
+
+class BatchQueue:
+    """
+    Буфер элементов, сгруппированных по ключу.
+
+    Элементы ключа сбрасываются одним вызовом flush, когда их набралось
+    max_size или с момента первого элемента прошло max_delay секунд.
+    Вызов add завершается после сброса пакета, в который попал элемент,
+    а ошибка сброса пробрасывается каждому вызывающему. Элементы, чьё
+    ожидание было отменено, в пакет не попадают.
+    """
+
+    def __init__(self, flush: FlushFunc, max_size: int = 20,
+                 max_delay: float = 5.0):
+        """
+        Args:
+            flush (FlushFunc): Корутина flush(key, items) для отправки пакета.
+            max_size (int): Размер пакета, при котором он сбрасывается сразу.
+            max_delay (float): Максимальное время ожидания пакета, сек.
+        """
+        self._flush_func = flush
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: dict[Hashable, list[tuple[Any, asyncio.Future]]] = {}
+        self._timers: dict[Hashable, asyncio.Task] = {}
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+
+    async def add(self, key: Hashable, item: Any) -> None:
+        """Добавляет элемент и ждёт сброса его пакета."""
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future))
+        if len(batch) >= self.max_size:
+            asyncio.create_task(self.flush(key))
+        elif key not in self._timers:
+            self._timers[key] = asyncio.create_task(self._flush_later(key))
+        await future
+
+    async def _flush_later(self, key: Hashable) -> None:
+        await asyncio.sleep(self.max_delay)
+        self._timers.pop(key, None)
+        await self.flush(key)
+
+    async def flush(self, key: Hashable) -> None:
+        """Сбрасывает накопленные элементы ключа пакетами по max_size."""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            timer = self._timers.pop(key, None)
+            if timer is not None and timer is not asyncio.current_task():
+                timer.cancel()
+            batch = [(item, future)
+                     for item, future in self._pending.pop(key, [])
+                     if not future.done()]
+            for start in range(0, len(batch), self.max_size):
+                chunk = batch[start:start + self.max_size]
+                try:
+                    await self._flush_func(key, [item for item, _ in chunk])
+                except Exception as e:
+                    for _, future in chunk:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for _, future in chunk:
+                        if not future.done():
+                            future.set_result(None)
+
+    async def close(self) -> None:
+        """Сбрасывает все ключи и останавливает таймеры."""
+        for key in list(self._pending):
+            await self.flush(key)
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов со скользящим окном.
+
+    Не пропускает больше limit запросов за period секунд и умеет
+    приостанавливать запросы после ответа о превышении квоты.
+    """
+
+    def __init__(self, limit: int, period: float = 60):
+        self.limit = limit
+        self.period = period
+        self._calls: deque[float] = deque()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Запрещает запросы на seconds секунд."""
+        self._paused_until = max(self._paused_until,
+                                 time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        """Ждёт, пока запрос можно будет выполнить без превышения квоты."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and self._calls[0] <= now - self.period:
+                    self._calls.popleft()
+                wait = self._paused_until - now
+                if len(self._calls) >= self.limit:
+                    wait = max(wait, self._calls[0] + self.period - now)
+                if wait <= 0:
+                    self._calls.append(now)
+                    return
+                await asyncio.sleep(wait)
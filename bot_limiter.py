@@ -0,0 +1,196 @@
+"""
+Ограничение частоты исходящих запросов к Bot API.
+
+Telegram допускает около 30 сообщений в секунду на бота, около одного
+сообщения в секунду в личный чат и 20 сообщений в минуту в группу, а при
+превышении отвечает 429 с retry_after. ThrottledBot пропускает каждый
+запрос с chat_id через корзины токенов: сначала корзину чата, затем
+общую. Лишние запросы ждут своей очереди, а не падают.
+
+Корзины живут в памяти процесса. При SHARD_WORKERS > 1 личный чат
+обслуживает всегда один процесс, а общий лимит и лимит группы делятся
+между процессами: каждый получает 1/shards от них.
+
+Корзина выдаёт токены в долг: запрос сразу резервирует место и спит
+до своего времени, поэтому очередь справедлива (FIFO) и не требует
+блокировок. Ответ 429 приостанавливает корзину чата на retry_after,
+после чего запрос повторяется.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+
+from metrics import BOT_API_QUEUE_WAIT, BOT_API_RETRY_AFTER
+
+
+class TokenBucket:
+    """Корзина токенов с резервированием в долг."""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate (float): Токенов в секунду.
+            capacity (float): Размер корзины (допустимая пачка запросов).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Сколько секунд ждать следующему запросу."""
+        self._refill(time.monotonic())
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def reserve(self) -> float:
+        """Резервирует токен и возвращает, сколько секунд его ждать."""
+        delay = self.delay()
+        self._tokens -= 1
+        return delay
+
+    def pause(self, seconds: float) -> None:
+        """Не выдаёт токены ближайшие seconds секунд."""
+        self._refill(time.monotonic())
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+    @property
+    def idle(self) -> bool:
+        """Корзина полна: её можно удалить без потери ограничений."""
+        self._refill(time.monotonic())
+        return self._tokens >= self.capacity
+
+
+def is_group(chat_id) -> bool:
+    """Группы и каналы имеют отрицательный id или @username."""
+    return str(chat_id).startswith(('-', '@'))
+
+
+class BotRateLimiter:
+    """Корзины токенов: общая на бота и по одной на каждый чат."""
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1,
+                 chat_burst: float = 3, group_per_minute: float = 20,
+                 max_wait: float = 60, max_chats: int = 10000,
+                 shards: int = 1):
+        """
+        Args:
+            global_rate (float): Запросов в секунду на бота.
+            chat_rate (float): Запросов в секунду в личный чат.
+            chat_burst (float): Пачка запросов в личный чат без ожидания.
+            group_per_minute (float): Запросов в минуту в группу.
+            max_wait (float): Дольше этого запрос не ждёт в очереди,
+                а сразу получает RetryAfter, сек.
+            max_chats (int): Сколько корзин чатов хранить; самые давние
+                удаляются.
+            shards (int): Сколько процессов отправляют запросы от имени
+                бота; global_rate и group_per_minute делятся между ними.
+        """
+        global_rate /= shards
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute / shards
+        self.max_wait = max_wait
+        self.max_chats = max_chats
+        self.waiting = 0
+        self._chats: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if is_group(chat_id):
+                rate = self.group_per_minute / 60
+                bucket = TokenBucket(rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[key] = bucket
+            if len(self._chats) > self.max_chats:
+                self._evict()
+        else:
+            self._chats.move_to_end(key)
+        return bucket
+
+    def _evict(self) -> None:
+        # Корзину с долгом удалять нельзя: её ждут запросы
+        excess = len(self._chats) - self.max_chats
+        for key in list(islice(self._chats, excess)):
+            if self._chats[key].idle:
+                del self._chats[key]
+
+    async def acquire(self, method: str, chat_id) -> None:
+        """
+        Ждёт, пока запрос method в чат chat_id можно отправить.
+
+        Raises:
+            RetryAfter: Очередь чата длиннее max_wait.
+        """
+        scope = 'group' if is_group(chat_id) else 'private'
+        bucket = self._bucket(chat_id)
+        delay = bucket.delay()
+        if delay > self.max_wait:
+            raise RetryAfter(int(delay) + 1)
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.sleep(bucket.reserve())
+            # Общий токен берём, только когда дошла очередь в чате
+            await asyncio.sleep(self.global_bucket.reserve())
+        finally:
+            self.waiting -= 1
+        BOT_API_QUEUE_WAIT.observe(time.monotonic() - start, method=method,
+                                   scope=scope)
+
+    def stats(self) -> dict:
+        """Возвращает размер очереди и число корзин чатов для метрик."""
+        return {"waiting": self.waiting, "chats": len(self._chats)}
+
+    def pause(self, chat_id, seconds: float) -> None:
+        """Приостанавливает отправку в чат после ответа 429."""
+        if chat_id is None:
+            self.global_bucket.pause(seconds)
+        else:
+            self._bucket(chat_id).pause(seconds)
+
+
+class ThrottledBot(Bot):
+    """Bot, который отправляет запросы к чатам через BotRateLimiter."""
+
+    def __init__(self, *args, limiter: BotRateLimiter | None = None,
+                 max_retries: int = 3, **kwargs):
+        """
+        Args:
+            limiter (BotRateLimiter): Ограничитель запросов.
+            max_retries (int): Сколько раз повторять запрос после 429.
+            *args, **kwargs: Аргументы aiogram.Bot.
+        """
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter or BotRateLimiter()
+        self.max_retries = max_retries
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        chat_id = data.get('chat_id') if data else None
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                await self.limiter.acquire(method, chat_id)
+            try:
+                return await super().request(method, data, files, **kwargs)
+            except RetryAfter as e:
+                BOT_API_RETRY_AFTER.inc(method=method)
+                self.limiter.pause(chat_id, e.timeout)
+                # Файл уже прочитан, повторить отправку нельзя
+                if files or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                if chat_id is None:
+                    await asyncio.sleep(e.timeout)
@@ -1,180 +1,152 @@
 """
 
-В модуле собраны функция формирующие клавиатуры для работы бота.
-
-Также функция для отправки почты.
+В модуле собраны клавиатуры для работы бота. Они собираются один раз
+при импорте и отдаются функциями get_* в готовом виде.
 
 """
 
-import os
 import re
-import smtplib
-from datetime import datetime
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from functools import lru_cache
 
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from dotenv import load_dotenv
 
+from rendering import FrozenKeyboard
+
 load_dotenv()
 
 
-async def download_photo(file_id: str, bot) -> bytes:
-    """Получает file_id, возвращает от телеграмм файл в bytes."""
-    file = await bot.get_file(file_id)
-    file_path = file.file_path
-    # Загружаем файл в bytes
-    photo_bytes = await bot.download_file(file_path)
-    return photo_bytes
+CANCEL_BUTTON = ('Отмена', 'cancel')
+
+# Статические клавиатуры собираются один раз при импорте
+CANCEL_KEYBOARD = FrozenKeyboard.column(CANCEL_BUTTON)
+MAIN_MENU_KEYBOARD = FrozenKeyboard.column(
+    ("Заявка на вывоз КГМ", "kgm_request"),
+    ("Обращение по качеству услуг", "quality_complaint"))
+REGISTRATION_CONFIRM_KEYBOARD = CANCEL_KEYBOARD.with_rows(
+    (('ВСЕ ВЕРНО!', 'Верно'),))
 
 
-def get_cancel() -> InlineKeyboardMarkup:
-    """Формирует и возвращает Inline клавиатуру с одной кнопкой Отмена."""
-    keyboard = InlineKeyboardMarkup()
-    button = InlineKeyboardButton(text='Отмена', callback_data='cancel')
-    keyboard.add(button)
-    return keyboard
+def get_cancel() -> FrozenKeyboard:
+    """Возвращает Inline клавиатуру с одной кнопкой Отмена."""
+    return CANCEL_KEYBOARD
 
 
-def get_main_menu() -> InlineKeyboardMarkup:
-    """Формирует и возвращает Inline клавиатуру, главное меню.
+def get_main_menu() -> FrozenKeyboard:
+    """Возвращает Inline клавиатуру, главное меню.
 
     Направить обращение
     """
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("Заявка на вывоз КГМ",
-                                      callback_data="kgm_request"))
-    keyboard.add(InlineKeyboardButton("Обращение по качеству услуг",
-                                      callback_data="quality_complaint"))
-    return keyboard
+    return MAIN_MENU_KEYBOARD
 
 
-def get_waste_type_keyboard(waste_types: list) -> InlineKeyboardMarkup:
-    """Формирует и возвращает Inline клавиатуру с типами отходов."""
-    keyboard = InlineKeyboardMarkup()
-    for waste_type in waste_types:
-        keyboard.add(InlineKeyboardButton(text=waste_type,
-                                          callback_data=f"waste_type:{waste_type}"))
-    return keyboard
+@lru_cache(maxsize=None)
+def _prefixed_keyboard(prefix: str, names: tuple[str, ...]) -> FrozenKeyboard:
+    return FrozenKeyboard.column(*((name, f"{prefix}:{name}")
+                                   for name in names))
 
 
-def get_district_name(district_names: list) -> InlineKeyboardMarkup:
-    """Формирует и возвращает Inline клавиатуру с именами районов."""
-    keyboard = InlineKeyboardMarkup()
-    for district in district_names:
-        keyboard.add(InlineKeyboardButton(text=district,
-                                          callback_data=f"district:{district}"))
-    return keyboard
+def get_waste_type_keyboard(waste_types: list) -> FrozenKeyboard:
+    """Возвращает Inline клавиатуру с типами отходов."""
+    return _prefixed_keyboard('waste_type', tuple(waste_types))
 
 
-def get_coast_name(districts: dict[str: str], district_name) -> str:
-    return districts.get(district_name)
-
+def get_district_name(district_names: list) -> FrozenKeyboard:
+    """Возвращает Inline клавиатуру с именами районов."""
+    return _prefixed_keyboard('district', tuple(district_names))
 
-async def send_email(message_text, target_email):
-    """Отправляет письмо на заданную почту."""
-    email = os.getenv("EMAIL")
-    password = os.getenv("PASSWORD_EMAIL")
-    time = datetime.now()
 
-    msg = MIMEMultipart()
-    msg['From'] = email
-    msg['To'] = target_email
-    msg[
-        'Subject'] = (f"Новое обращение принято ботом "
-                      f"{time.strftime('%Y-%m-%d %H:%M')}")
-    msg.attach(MIMEText(message_text))
-    try:
-        mailserver = smtplib.SMTP('smtp.yandex.ru', 587)
+def get_address_keyboard(addresses: list[str],
+                         with_typed: bool = True) -> FrozenKeyboard:
+    """
+    Возвращает Inline клавиатуру с подсказками адресов.
 
-        mailserver.ehlo()
-        # Защищаем соединение с помощью шифрования tls
-        mailserver.starttls()
-        # Повторно идентифицируем себя как зашифрованное соединение
-        # перед аутентификацией.
-        mailserver.ehlo()
-        mailserver.login(email, password)
+    В данных кнопки - номер адреса в списке: сам адрес может не
+    поместиться в 64 байта callback_data.
+    """
+    buttons = [(address, f"address:{number}")
+               for number, address in enumerate(addresses)]
+    if with_typed:
+        buttons.append(("Оставить как написано", "address:typed"))
+    return FrozenKeyboard.column(*buttons, CANCEL_BUTTON)
 
-        mailserver.sendmail(email, target_email, msg.as_string())
 
-        mailserver.quit()
-    except smtplib.SMTPException:
-        print("Ошибка: Невозможно отправить сообщение")
+def get_coast_name(districts: dict[str: str], district_name) -> str:
+    return districts.get(district_name)
 
 
 # Клавиатуры для FSM этапов
-async def get_quality_complaint_keyboard():
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("Сообщить о невывозе",
-                                      callback_data="Невывоз"))
-    keyboard.add(InlineKeyboardButton("Замечания по качеству услуг",
-                                      callback_data="Замечания"))
-    keyboard.add(InlineKeyboardButton("Отмена", callback_data="cancel"))
-    return keyboard
-
-
-async def get_no_collection_days_keyboard():
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("Сегодня", callback_data="today"))
-    keyboard.add(InlineKeyboardButton("Невывоз 1 день", callback_data="1 день"))
-    keyboard.add(InlineKeyboardButton("Невывоз 2 дня",
-                                      callback_data="2 дня"))
-    keyboard.add(
-        InlineKeyboardButton("Невывоз более 2 дней", callback_data="Больше 2 дней"))
-    keyboard.add(InlineKeyboardButton("Отмена", callback_data="cancel"))
-    return keyboard
-
-
-async def get_quality_issue_keyboard():
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("Не вернули бак на место",
-                                      callback_data="Не вернули бак"))
-    keyboard.add(
-        InlineKeyboardButton("Повредили бак", callback_data="Повредили бак"))
-    keyboard.add(InlineKeyboardButton("Не подобрали россыпь",
-                                      callback_data="Россыпь"))
-    keyboard.add(InlineKeyboardButton("Неполная отгрузка",
-                                      callback_data="Неполная отгрузка"))
-    keyboard.add(InlineKeyboardButton("Отмена", callback_data="cancel"))
-    return keyboard
-
-
-async def get_cancel_keyboard():
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("Отмена", callback_data="cancel"))
-    return keyboard
-
-
-async def get_confirmation_keyboard():
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(
-        InlineKeyboardButton("Подтвердить", callback_data="confirm_data"))
-    keyboard.add(InlineKeyboardButton("Отмена", callback_data="cancel"))
-    return keyboard
-
-
-async def get_contact_method_keyboard():
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("Обратная связь не нужна",
-                                      callback_data="Не нужна"))
-    keyboard.add(InlineKeyboardButton("Телефон", callback_data="Телефон"))
-    #keyboard.add(InlineKeyboardButton("Электронная почта", callback_data="email"))
-    keyboard.add(InlineKeyboardButton("Отмена", callback_data="cancel"))
-    return keyboard
-
-
-async def get_no_comment_keyboard():
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(
-        InlineKeyboardButton("Нет комментария", callback_data="Нет комментария"))
-    keyboard.add(InlineKeyboardButton("Отмена", callback_data="cancel"))
-    return keyboard
-
-
-async def get_registration_keyboard():
-    keyboard = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("Зарегистрироваться", callback_data="register"))
-    return keyboard
+QUALITY_COMPLAINT_KEYBOARD = FrozenKeyboard.column(
+    ("Сообщить о невывозе", "Невывоз"),
+    ("Замечания по качеству услуг", "Замечания"),
+    CANCEL_BUTTON)
+NO_COLLECTION_DAYS_KEYBOARD = FrozenKeyboard.column(
+    ("Сегодня", "today"),
+    ("Невывоз 1 день", "1 день"),
+    ("Невывоз 2 дня", "2 дня"),
+    ("Невывоз более 2 дней", "Больше 2 дней"),
+    CANCEL_BUTTON)
+QUALITY_ISSUE_KEYBOARD = FrozenKeyboard.column(
+    ("Не вернули бак на место", "Не вернули бак"),
+    ("Повредили бак", "Повредили бак"),
+    ("Не подобрали россыпь", "Россыпь"),
+    ("Неполная отгрузка", "Неполная отгрузка"),
+    CANCEL_BUTTON)
+CONFIRMATION_KEYBOARD = FrozenKeyboard.column(
+    ("Подтвердить", "confirm_data"), CANCEL_BUTTON)
+CONTACT_METHOD_KEYBOARD = FrozenKeyboard.column(
+    ("Обратная связь не нужна", "Не нужна"),
+    ("Телефон", "Телефон"),
+    # ("Электронная почта", "email"),
+    CANCEL_BUTTON)
+# Для пользователей с username связь возможна и через Телеграм
+TELEGRAM_BUTTON = ("Телеграм", "Телеграм")
+CONTACT_METHOD_TELEGRAM_KEYBOARD = CONTACT_METHOD_KEYBOARD.with_rows(
+    (TELEGRAM_BUTTON,), at=1)
+CONFIRMATION_TELEGRAM_KEYBOARD = CONFIRMATION_KEYBOARD.with_rows(
+    (TELEGRAM_BUTTON,))
+NO_COMMENT_KEYBOARD = FrozenKeyboard.column(
+    ("Нет комментария", "Нет комментария"), CANCEL_BUTTON)
+REGISTRATION_KEYBOARD = FrozenKeyboard.column(
+    ("Зарегистрироваться", "register"))
+
+
+async def get_quality_complaint_keyboard() -> FrozenKeyboard:
+    return QUALITY_COMPLAINT_KEYBOARD
+
+
+async def get_no_collection_days_keyboard() -> FrozenKeyboard:
+    return NO_COLLECTION_DAYS_KEYBOARD
+
+
+async def get_quality_issue_keyboard() -> FrozenKeyboard:
+    return QUALITY_ISSUE_KEYBOARD
+
+
+async def get_cancel_keyboard() -> FrozenKeyboard:
+    return CANCEL_KEYBOARD
+
+
+async def get_confirmation_keyboard(with_telegram: bool = False
+                                    ) -> FrozenKeyboard:
+    if with_telegram:
+        return CONFIRMATION_TELEGRAM_KEYBOARD
+    return CONFIRMATION_KEYBOARD
+
+
+async def get_contact_method_keyboard(with_telegram: bool = False
+                                      ) -> FrozenKeyboard:
+    """Клавиатура способа связи; with_telegram добавляет кнопку Телеграм."""
+    if with_telegram:
+        return CONTACT_METHOD_TELEGRAM_KEYBOARD
+    return CONTACT_METHOD_KEYBOARD
+
+
+async def get_no_comment_keyboard() -> FrozenKeyboard:
+    return NO_COMMENT_KEYBOARD
+
+
+async def get_registration_keyboard() -> FrozenKeyboard:
+    return REGISTRATION_KEYBOARD
 
 
 # Функция для валидации email
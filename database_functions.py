@@ -5,10 +5,18 @@ import os
 import sqlite3
 import time
 
+from migrations import configure_connection, migrate
+from stats import add_to_rollup
+
+
+def connect(db_path: str, **kwargs) -> sqlite3.Connection:
+    """Открывает соединение с базой с настройками CONNECTION_PRAGMAS."""
+    return configure_connection(sqlite3.connect(db_path, **kwargs))
+
 
 def init_db(database_folder: str, database_name: str) -> str:
     """
-    Инициализирует базу данных.
+    Инициализирует базу данных и приводит схему к последней версии.
 
     Args:
         database_folder (str): Путь к папке, где будет размещена база данных.
@@ -24,198 +32,130 @@ def init_db(database_folder: str, database_name: str) -> str:
         # Формируем полный путь к базе данных
         db_path = os.path.join(database_folder, database_name)
 
-        # Подключаемся к базе и создаём таблицы
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                full_name TEXT,
-                phone_number TEXT,
-                workplace TEXT,
-                username TEXT
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kgm_requests (
-                id INTEGER PRIMARY KEY,
-                timestamp INTEGER,
-                full_name TEXT,
-                phone_number TEXT,
-                management_company TEXT,
-                adress TEXT,
-                district TEXT,
-                waste_type TEXT,
-                comment TEXT,
-                photo_link TEXT,
-                username TEXT
-            )
-        ''')
-        # Таблица жалоб на качество услуг
-        cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS quality_complaints (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp INTEGER,
-                        full_name TEXT,
-                        phone_number TEXT,
-                        management_company TEXT,
-                        address TEXT,
-                        district TEXT,
-                        complaint_type TEXT,
-                        trouble TEXT,
-                        comment TEXT,
-                        contact_method TEXT,
-                        email TEXT,
-                        photo_link TEXT,
-                        username TEXT
-                    )
-                ''')
-        conn.commit()
-        conn.close()
+        # Подключаемся к базе и применяем недостающие миграции
+        conn = connect(db_path)
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
         return db_path
     except Exception as e:
         print(f"Ошибка при инициализации базы данных: {e}")
         raise
 
 
-def is_user_registered(db_path: str, user_id: int):
+def fetch_user(conn: sqlite3.Connection, user_id: int) -> dict:
     """
-    Проверка пользователя на наличие в базе данных.
-    """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE id = ?", (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
-
+    Читает профиль пользователя через переданное соединение.
 
-def register_user(db_path: str, user_id: int, full_name: str,
-                  phone_number: str, workplace: str, username: str):
-    """
-    Сохранение пользователя в базе данных.
+    Returns:
+        dict: Словарь с информацией о пользователе или пустой словарь.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(
+    row = conn.execute(
+        'SELECT id, full_name, phone_number, workplace, username '
+        'FROM users WHERE id = ?', (user_id,)).fetchone()
+    if not row:
+        return {}
+    return {
+        "id": row[0],
+        "full_name": row[1],
+        "phone_number": row[2],
+        "workplace": row[3],
+        "username": row[4],
+    }
+
+
+def fetch_users(conn: sqlite3.Connection, limit: int) -> list[dict]:
+    """Читает профили последних зарегистрированных пользователей."""
+    rows = conn.execute(
+        'SELECT id, full_name, phone_number, workplace, username '
+        'FROM users ORDER BY rowid DESC LIMIT ?', (limit,)).fetchall()
+    return [{"id": row[0], "full_name": row[1], "phone_number": row[2],
+             "workplace": row[3], "username": row[4]} for row in rows]
+
+
+def insert_user(conn: sqlite3.Connection, user_id: int, full_name: str,
+                phone_number: str, workplace: str, username: str) -> None:
+    """Добавляет пользователя через переданное соединение."""
+    conn.execute(
         "INSERT INTO users (id, full_name, phone_number, workplace, username) VALUES (?, ?, ?, ?, ?)",
         (user_id, full_name, phone_number, workplace, username))
-    conn.commit()
-    conn.close()
 
 
-def save_kgm_request(db_path: str, full_name: str, phone_number: str,
-                     management_company: str, address: str, district: str,
-                     waste_type: str, comment: str, photo_link: str,
-                     username: str):
+def insert_kgm_request(conn: sqlite3.Connection, full_name: str,
+                       phone_number: str, management_company: str,
+                       address: str, district: str, waste_type: str,
+                       comment: str, photo_link: str, username: str,
+                       outbox_id: int | None = None) -> bool:
     """
-    Сохраняет заявку на вывоз КГМ в базу данных.
+    Добавляет заявку на вывоз КГМ через переданное соединение.
 
-    Args:
-        db_path (str): Имя файла базы данных.
-        full_name (str): ФИО пользователя.
-        phone_number (str): Номер телефона пользователя.
-        management_company (str): Название управляющей компании.
-        address (str): Адрес дома.
-        district (str): Адрес дома.
-        waste_type (str): Тип отходов.
-        comment: (str): Комментарий пользователя.
-        photo_link (str): Ссылка на фото отходов.
-        username (str): Username пользователя в Telegram.
-    """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    try:
-        timestamp = int(time.time())  # Текущее время в формате UNIX
-        cursor.execute('''
-            INSERT INTO kgm_requests (
-                timestamp, full_name, phone_number, management_company, 
-                adress, district, waste_type, comment, photo_link, username
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (timestamp, full_name, phone_number, management_company,
-              address, district, waste_type, comment, photo_link, username))
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"Ошибка при сохранении заявки: {e}")
-    finally:
-        conn.close()
-
-
-def get_user_by_id(user_id: int, db_path: str) -> dict:
-    """
-    Получает информацию о пользователе из базы данных по user_id.
-
-    Args:
-        user_id (int): Идентификатор пользователя.
-        db_path (str): Путь к базе данных SQLite.
+    Счётчики статистики обновляются в той же транзакции. Заявка с уже
+    сохранённым outbox_id (повтор шага outbox) не добавляется.
 
     Returns:
-        dict: Словарь с информацией о пользователе. Если пользователь не найден, возвращается пустой словарь.
+        bool: Заявка добавлена.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute(
-            'SELECT id, full_name, phone_number, workplace, username FROM users WHERE id = ?',
-            (user_id,))
-        row = cursor.fetchone()
-
-        if row:
-            user_data = {
-                "id": row[0],
-                "full_name": row[1],
-                "phone_number": row[2],
-                "workplace": row[3],
-                "username": row[4],
-            }
-        else:
-            user_data = {}  # Возвращаем пустой словарь, если пользователь не найден
-
-    finally:
-        conn.close()
-
-    return user_data
-
-
-def save_quality_complaint(db_path: str, full_name: str, phone_number: str,
-                           management_company: str, address: str, district: str,
-                           complaint_type: str, trouble: str, comment: str,
-                           contact_method: str, email: str, photo_link: str,
-                           username: str):
+    timestamp = int(time.time())  # Текущее время в формате UNIX
+    cursor = conn.execute('''
+        INSERT INTO kgm_requests (
+            timestamp, full_name, phone_number, management_company, 
+            adress, district, waste_type, comment, photo_link, username,
+            outbox_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (outbox_id) DO NOTHING
+    ''', (timestamp, full_name, phone_number, management_company,
+          address, district, waste_type, comment, photo_link, username,
+          outbox_id))
+    if not cursor.rowcount:
+        return False
+    add_to_rollup(conn, 'kgm', timestamp,
+                  {'district': district, 'waste_type': waste_type})
+    return True
+
+
+def insert_quality_complaint(conn: sqlite3.Connection, full_name: str,
+                             phone_number: str, management_company: str,
+                             address: str, district: str,
+                             complaint_type: str, trouble: str, comment: str,
+                             contact_method: str, email: str,
+                             photo_link: str, username: str,
+                             outbox_id: int | None = None) -> bool:
     """
-    Сохраняет жалобу на качество услуг в базу данных.
+    Добавляет жалобу на качество услуг через переданное соединение.
 
-    Args:
-        db_path (str): Имя файла базы данных.
-        full_name (str): ФИО пользователя.
-        phone_number (str): Номер телефона пользователя.
-        management_company (str): Название управляющей компании.
-        address (str): Адрес дома.
-        district (str): Район.
-        complaint_type (str): Тип жалобы.
-        trouble (str): Конкретная проблема.
-        comment (str): Комментарий пользователя.
-        contact_method (str): Способ связи (телефон, email, Telegram).
-        email (str):  email.
-        photo_link (str): Ссылка на фото.
-        username (str): Username пользователя в Telegram.
+    Счётчики статистики обновляются в той же транзакции. Жалоба с уже
+    сохранённым outbox_id (повтор шага outbox) не добавляется.
+
+    Returns:
+        bool: Жалоба добавлена.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    try:
-        timestamp = int(time.time())  # Текущее время в формате UNIX
-        cursor.execute('''
-            INSERT INTO quality_complaints (
-                timestamp, full_name, phone_number, management_company, 
-                address, district, complaint_type, trouble, comment, 
-                contact_method, email, photo_link, username
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (timestamp, full_name, phone_number, management_company,
-              address, district, complaint_type, trouble, comment,
-              contact_method, email, photo_link, username))
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"Ошибка при сохранении жалобы: {e}")
-    finally:
-        conn.close()
\ No newline at end of file
+    timestamp = int(time.time())  # Текущее время в формате UNIX
+    cursor = conn.execute('''
+        INSERT INTO quality_complaints (
+            timestamp, full_name, phone_number, management_company, 
+            address, district, complaint_type, trouble, comment, 
+            contact_method, email, photo_link, username, outbox_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (outbox_id) DO NOTHING
+    ''', (timestamp, full_name, phone_number, management_company,
+          address, district, complaint_type, trouble, comment,
+          contact_method, email, photo_link, username, outbox_id))
+    if not cursor.rowcount:
+        return False
+    add_to_rollup(conn, 'complaint', timestamp,
+                  {'district': district, 'complaint_type': complaint_type,
+                   'trouble': trouble})
+    return True
+
+
+# Таблицы заявок по виду задачи outbox
+REQUEST_TABLES = {'kgm': 'kgm_requests', 'complaint': 'quality_complaints'}
+
+
+def update_photo_link(conn: sqlite3.Connection, kind: str, outbox_id: int,
+                      photo_link: str) -> None:
+    """Записывает ссылку на фото в заявку, сохранённую задачей outbox."""
+    conn.execute(
+        f'UPDATE {REQUEST_TABLES[kind]} SET photo_link = ? '
+        f'WHERE outbox_id = ?', (photo_link, outbox_id))
@@ -0,0 +1,234 @@
+"""
+Журнал заявок в файлах Excel.
+
+Фоновая задача раз в flush_interval секунд читает из базы заявки и
+обращения, сохранённые после прошлой записи, и дописывает их в XLSX
+одним пакетом: дописать строку в XLSX можно только перезаписав файл
+целиком, поэтому писать по одной заявке слишком дорого. Номер последней
+записанной строки хранится в таблице journal_progress, так что после
+перезапуска журнал продолжается с того же места, а шаги outbox не ждут
+записи файлов.
+
+На каждый месяц заводится свой файл, а когда файл вырастает до max_rows
+строк или max_bytes байт, начинается следующая часть того же месяца:
+
+    journal/kgm_2025-01.xlsx
+    journal/kgm_2025-01_2.xlsx
+    journal/complaint_2025-01.xlsx
+
+Дописывание всё равно перезаписывает текущую часть целиком, поэтому
+части держатся небольшими: по умолчанию max_rows 1000 строк и max_bytes
+1 МБ. Тогда запись пакета занимает доли секунды, а файлов выходит
+несколько на месяц. Чем больше части, тем дороже каждая запись.
+
+Файл сохраняется во временный и подменяется атомарно, так что сбой
+во время записи не портит уже записанный журнал. Прогресс в базе
+сохраняется после подмены файла, и сбой между ними (или таймаут
+пула потоков) приводит к повторной записи тех же строк. Поэтому перед
+записью отбрасываются строки с номером не больше последнего
+записанного в файл.
+
+Журнал пишет только один процесс: при SHARD_WORKERS > 1 его запускает
+процесс с SHARD_INDEX 0, иначе процессы дублировали бы строки, а
+подмена файла одним затирала бы дописанное другим.
+"""
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from openpyxl import Workbook, load_workbook
+
+from async_database import AsyncDatabase
+from executors import BlockingExecutor
+from export import EXPORT_TABLES, localize_rows
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_journal_progress(conn: sqlite3.Connection, kind: str) -> int:
+    """Номер последней строки вида kind, записанной в журнал."""
+    row = conn.execute('SELECT last_id FROM journal_progress WHERE kind = ?',
+                       (kind,)).fetchone()
+    return row[0] if row else 0
+
+
+def save_journal_progress(conn: sqlite3.Connection, kind: str,
+                          last_id: int) -> None:
+    """Запоминает номер последней строки, записанной в журнал."""
+    conn.execute(
+        'INSERT INTO journal_progress (kind, last_id) VALUES (?, ?) '
+        'ON CONFLICT (kind) DO UPDATE SET last_id = excluded.last_id',
+        (kind, last_id))
+
+
+def fetch_new_rows(conn: sqlite3.Connection, kind: str, after_id: int,
+                   limit: int) -> list[tuple]:
+    """Читает до limit строк вида kind с номером больше after_id."""
+    table, columns = EXPORT_TABLES[kind]
+    return conn.execute(
+        f'SELECT {", ".join(columns)} FROM {table} WHERE id > ? '
+        f'ORDER BY id LIMIT ?', (after_id, limit)).fetchall()
+
+
+class ExcelJournal:
+    """Дописывает новые заявки из базы в помесячные файлы XLSX."""
+
+    def __init__(self, db: AsyncDatabase, folder: str,
+                 executor: BlockingExecutor, batch_size: int = 500,
+                 flush_interval: float = 10, max_rows: int = 1000,
+                 max_bytes: int = 1024 * 1024, hours_offset: int = 0):
+        """
+        Args:
+            db (AsyncDatabase): База данных с заявками.
+            folder (str): Папка журнала.
+            executor (BlockingExecutor): Пул потоков с лимитом бэкенда
+                excel.
+            batch_size (int): Сколько строк читать и записывать за раз.
+            flush_interval (float): Период записи журнала, сек.
+            max_rows (int): Строк в одном файле, не считая заголовка.
+            max_bytes (int): Размер файла, после которого начинается
+                следующая часть.
+            hours_offset (int): Сдвиг местного времени относительно
+                времени сервера, часов (TIMEDELTA).
+        """
+        self.db = db
+        self.folder = folder
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.hours_offset = hours_offset
+        self._executor = executor
+        # (вид, месяц) -> номер текущей части
+        self._parts: dict[tuple[str, str], int] = {}
+        # (вид, месяц) -> последний номер заявки, записанный в файл
+        self._last_numbers: dict[tuple[str, str], int] = {}
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    def start(self) -> None:
+        """Запускает фоновую запись журнала."""
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self) -> None:
+        """Останавливает фоновую запись и дописывает оставшиеся заявки."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def _worker(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                # Строки не потеряются: прогресс не сдвинулся
+                logger.error(f"Ошибка при записи журнала Excel: {e}")
+
+    async def flush(self) -> int:
+        """
+        Дописывает в журнал все заявки, сохранённые после прошлой записи.
+
+        Returns:
+            int: Количество записанных строк.
+        """
+        written = 0
+        async with self._lock:
+            for kind in EXPORT_TABLES:
+                last_id = await self.db.read(fetch_journal_progress, kind)
+                while True:
+                    rows = await self.db.read(fetch_new_rows, kind, last_id,
+                                              self.batch_size)
+                    if not rows:
+                        break
+                    await self._executor.run('excel', self._append, kind,
+                                             rows, operation='append_rows')
+                    last_id = rows[-1][0]
+                    await self.db.write(save_journal_progress, kind, last_id)
+                    written += len(rows)
+                    if len(rows) < self.batch_size:
+                        break
+        return written
+
+    def _month(self, row: tuple) -> str:
+        # Вторая колонка - время заявки в формате UNIX
+        if row[1] is None:
+            return 'undated'
+        return (datetime.fromtimestamp(row[1])
+                + timedelta(hours=self.hours_offset)).strftime('%Y-%m')
+
+    def _path(self, kind: str, month: str, part: int) -> str:
+        suffix = f'_{part}' if part > 1 else ''
+        return os.path.join(self.folder, f'{kind}_{month}{suffix}.xlsx')
+
+    def _last_part(self, kind: str, month: str) -> int:
+        pattern = re.compile(
+            rf'{re.escape(kind)}_{month}(?:_(\d+))?\.xlsx$')
+        parts = [int(match.group(1) or 1)
+                 for match in map(pattern.match, os.listdir(self.folder))
+                 if match]
+        return max(parts, default=1)
+
+    def _append(self, kind: str, rows: list[tuple]) -> None:
+        os.makedirs(self.folder, exist_ok=True)
+        for month, month_rows in groupby(rows, key=self._month):
+            self._append_month(kind, month, list(localize_rows(
+                month_rows, self.hours_offset)))
+
+    def _last_number(self, path: str) -> int:
+        """Номер последней заявки в файле журнала, 0 для нового файла."""
+        if not os.path.exists(path):
+            return 0
+        workbook = load_workbook(path, read_only=True)
+        try:
+            last = 0
+            for row in workbook.active.iter_rows(min_row=2, max_col=1,
+                                                 values_only=True):
+                if isinstance(row[0], int):
+                    last = row[0]
+            return last
+        finally:
+            workbook.close()
+
+    def _append_month(self, kind: str, month: str, rows: list[list]) -> None:
+        key = (kind, month)
+        part = self._parts.get(key) or self._last_part(kind, month)
+        if key not in self._last_numbers:
+            self._last_numbers[key] = self._last_number(
+                self._path(kind, month, part))
+        # Первая колонка - номер заявки, строки идут по возрастанию
+        rows = [row for row in rows if row[0] > self._last_numbers[key]]
+        while rows:
+            path = self._path(kind, month, part)
+            if os.path.exists(path):
+                if os.path.getsize(path) >= self.max_bytes:
+                    part += 1
+                    continue
+                workbook = load_workbook(path)
+                sheet = workbook.active
+            else:
+                workbook = Workbook()
+                sheet = workbook.active
+                sheet.append(list(EXPORT_TABLES[kind][1].values()))
+            free = self.max_rows - (sheet.max_row - 1)
+            if free <= 0:
+                part += 1
+                continue
+            for row in rows[:free]:
+                sheet.append(row)
+            temporary = path + '.tmp'
+            workbook.save(temporary)
+            os.replace(temporary, path)
+            self._last_numbers[key] = rows[:free][-1][0]
+            self._parts[key] = part
+            logger.info("В журнал %s добавлено строк: %s",
+                        os.path.basename(path), len(rows[:free]))
+            rows = rows[free:]
+        self._parts[key] = part
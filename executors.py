@@ -0,0 +1,111 @@
+"""
+Выполнение блокирующих вызовов сторонних библиотек вне цикла событий.
+
+Все синхронные клиенты (yadisk, gspread, smtplib, sqlite3) работают в
+общем пуле потоков. У каждого бэкенда свой лимит одновременных вызовов
+и свой таймаут, поэтому медленный сервис не занимает весь пул и не
+мешает опросу Telegram.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from metrics import BACKEND_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BackendLimit:
+    """Ограничения для одного бэкенда."""
+    concurrency: int
+    # Таймаут одного вызова в секундах, None - без таймаута
+    timeout: float | None
+
+
+class BlockingExecutor:
+    """Общий пул потоков с лимитами по бэкендам."""
+
+    def __init__(self, limits: dict[str, BackendLimit]):
+        """
+        Args:
+            limits (dict): Ограничения по именам бэкендов.
+        """
+        self.limits = limits
+        self._semaphores = {name: asyncio.Semaphore(limit.concurrency)
+                            for name, limit in limits.items()}
+        # Потоков хватает, чтобы все бэкенды работали на своём лимите
+        self._pool = ThreadPoolExecutor(
+            max_workers=sum(limit.concurrency for limit in limits.values()),
+            thread_name_prefix='backend')
+
+    async def run(self, backend: str, func: Callable, *args,
+                  on_timeout: Callable[[], Any] | None = None,
+                  operation: str | None = None, **kwargs) -> Any:
+        """
+        Выполняет func(*args, **kwargs) в пуле потоков.
+
+        Слот бэкенда освобождается только после фактического завершения
+        потока, даже если вызывающий уже получил таймаут.
+
+        Args:
+            backend (str): Имя бэкенда из limits.
+            func (Callable): Блокирующая функция.
+            on_timeout (Callable): Вызывается при таймауте, чтобы прервать
+                операцию (например, sqlite3.Connection.interrupt). Если
+                задан, run дожидается завершения потока перед ошибкой.
+            operation (str): Имя операции для метрик, по умолчанию имя
+                функции.
+
+        Raises:
+            asyncio.TimeoutError: Вызов не уложился в таймаут бэкенда.
+        """
+        limit = self.limits[backend]
+        semaphore = self._semaphores[backend]
+        await semaphore.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(
+                self._pool, functools.partial(func, *args, **kwargs))
+        except BaseException:
+            semaphore.release()
+            raise
+        future.add_done_callback(lambda _: semaphore.release())
+        operation = operation or getattr(func, '__name__', 'call')
+        try:
+            with BACKEND_LATENCY.time(backend=backend, operation=operation):
+                return await asyncio.wait_for(asyncio.shield(future),
+                                              limit.timeout)
+        except asyncio.TimeoutError:
+            logger.error("Таймаут вызова %s (%s сек)", backend, limit.timeout)
+            if on_timeout is not None:
+                on_timeout()
+                await asyncio.wait([future])
+            raise
+
+    async def run_coroutine(self, backend: str, coro: Awaitable) -> Any:
+        """
+        Выполняет корутину асинхронного клиента с лимитом и таймаутом
+        бэкенда.
+
+        Raises:
+            asyncio.TimeoutError: Вызов не уложился в таймаут бэкенда.
+        """
+        limit = self.limits[backend]
+        operation = getattr(coro, '__qualname__', 'call')
+        async with self._semaphores[backend]:
+            try:
+                with BACKEND_LATENCY.time(backend=backend,
+                                          operation=operation):
+                    return await asyncio.wait_for(coro, limit.timeout)
+            except asyncio.TimeoutError:
+                logger.error("Таймаут вызова %s (%s сек)", backend,
+                             limit.timeout)
+                raise
+
+    def shutdown(self) -> None:
+        """Останавливает пул, не дожидаясь зависших вызовов."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,275 @@
+"""
+Выгрузка заявок и обращений в CSV или XLSX.
+
+Строки читаются курсором порциями по chunk_size и сразу пишутся в файл:
+CSV - построчно, XLSX - книгой openpyxl в режиме write_only, которая
+тоже не держит лист в памяти. Поэтому память не зависит от числа
+выгружаемых строк.
+
+Используется командой /export бота и из командной строки:
+    python export.py kgm --since 2024-01-01 --until 2024-01-31 \
+        --district Ленинский --format xlsx --output kgm.xlsx
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Iterator
+
+from openpyxl import Workbook
+
+from database_functions import connect
+from stats import day_start
+
+# Колонки выгрузки: имя в таблице -> заголовок в файле
+EXPORT_TABLES = {
+    'kgm': ('kgm_requests', {
+        'id': 'Номер',
+        'timestamp': 'Дата',
+        'full_name': 'ФИО',
+        'phone_number': 'Телефон',
+        'management_company': 'Управляющая компания',
+        'adress': 'Адрес',
+        'district': 'Район',
+        'waste_type': 'Тип отходов',
+        'comment': 'Комментарий',
+        'photo_link': 'Фото',
+        'username': 'Telegram',
+    }),
+    'complaint': ('quality_complaints', {
+        'id': 'Номер',
+        'timestamp': 'Дата',
+        'full_name': 'ФИО',
+        'phone_number': 'Телефон',
+        'management_company': 'Управляющая компания',
+        'address': 'Адрес',
+        'district': 'Район',
+        'complaint_type': 'Тип обращения',
+        'trouble': 'Проблема',
+        'comment': 'Комментарий',
+        'contact_method': 'Способ связи',
+        'email': 'Email',
+        'photo_link': 'Фото',
+        'username': 'Telegram',
+    }),
+}
+EXPORT_FORMATS = ('xlsx', 'csv')
+EXPORT_USAGE = ('Формат: /export kgm|complaint [с ДД.ММ.ГГГГ] '
+                '[по ДД.ММ.ГГГГ] [район] [xlsx|csv]\n'
+                'По умолчанию - с начала месяца по сегодня, все районы, xlsx.')
+# Больше Bot API не принимает документы от ботов
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+
+
+def iter_requests(conn: sqlite3.Connection, kind: str, since: int,
+                  until: int, district: str | None = None,
+                  chunk_size: int = 1000) -> Iterator[tuple]:
+    """
+    Читает заявки за период порциями.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой.
+        kind (str): Вид заявок, ключ EXPORT_TABLES.
+        since (int): Начало периода в формате UNIX, включительно.
+        until (int): Конец периода в формате UNIX, не включительно.
+        district (str): Район, None - все районы.
+        chunk_size (int): Сколько строк читать за раз.
+
+    Yields:
+        tuple: Строка таблицы в порядке колонок EXPORT_TABLES.
+    """
+    table, columns = EXPORT_TABLES[kind]
+    query = (f'SELECT {", ".join(columns)} FROM {table} '
+             f'WHERE timestamp >= ? AND timestamp < ?')
+    params = [since, until]
+    if district:
+        query += ' AND district = ?'
+        params.append(district)
+    cursor = conn.execute(query + ' ORDER BY timestamp, id', params)
+    try:
+        while rows := cursor.fetchmany(chunk_size):
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def localize_rows(rows: Iterator[tuple],
+                  hours_offset: int = 0) -> Iterator[list]:
+    """Заменяет время заявки (вторая колонка) местными датой и временем."""
+    offset = timedelta(hours=hours_offset)
+    for row in rows:
+        row = list(row)
+        if row[1] is not None:
+            row[1] = (datetime.fromtimestamp(row[1]) + offset).strftime(
+                '%d.%m.%Y %H:%M')
+        yield row
+
+
+def stop_on(rows: Iterator[list],
+            cancel: threading.Event | None) -> Iterator[list]:
+    """Прекращает выдачу строк, как только выставлен флаг cancel."""
+    for row in rows:
+        if cancel is not None and cancel.is_set():
+            return
+        yield row
+
+
+def write_csv(path: str, headers: list[str], rows: Iterator[list]) -> int:
+    """Пишет строки в CSV, который открывается в Excel без настройки."""
+    count = 0
+    # utf-8-sig и точка с запятой - то, что ожидает русский Excel
+    with open(path, 'w', newline='', encoding='utf-8-sig') as file:
+        writer = csv.writer(file, delimiter=';')
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_xlsx(path: str, headers: list[str], rows: Iterator[list],
+               title: str = 'Выгрузка') -> int:
+    """Пишет строки в XLSX без загрузки листа в память."""
+    count = 0
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(path)
+    return count
+
+
+def export_requests(db_path: str, kind: str, path: str, since: date,
+                    until: date, district: str | None = None,
+                    file_format: str = 'xlsx', hours_offset: int = 0,
+                    chunk_size: int = 1000,
+                    cancel: threading.Event | None = None) -> int:
+    """
+    Выгружает заявки за период в файл.
+
+    Открывает собственное соединение только для чтения, чтобы долгая
+    выгрузка не занимала соединения пула бота.
+
+    Args:
+        db_path (str): Путь к базе данных.
+        kind (str): Вид заявок, ключ EXPORT_TABLES.
+        path (str): Путь к создаваемому файлу.
+        since (date): Первый день периода (местное время).
+        until (date): Последний день периода включительно.
+        district (str): Район, None - все районы.
+        file_format (str): 'xlsx' или 'csv'.
+        hours_offset (int): Сдвиг местного времени, часов (TIMEDELTA).
+        chunk_size (int): Сколько строк читать за раз.
+        cancel (threading.Event): Флаг отмены: выгрузка прекращается
+            на следующей строке, файл остаётся неполным.
+
+    Returns:
+        int: Количество выгруженных строк.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {file_format}")
+    conn = connect(db_path)
+    try:
+        conn.execute('PRAGMA query_only = ON')
+        rows = stop_on(localize_rows(iter_requests(
+            conn, kind, day_start(since, hours_offset),
+            day_start(until + timedelta(days=1), hours_offset),
+            district, chunk_size), hours_offset), cancel)
+        headers = list(EXPORT_TABLES[kind][1].values())
+        if file_format == 'csv':
+            return write_csv(path, headers, rows)
+        return write_xlsx(path, headers, rows)
+    finally:
+        conn.close()
+
+
+def parse_date(text: str) -> date:
+    """Разбирает дату в формате ДД.ММ.ГГГГ или ГГГГ-ММ-ДД."""
+    for date_format in ('%d.%m.%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Неверная дата: {text}")
+
+
+def parse_export_command(args: str, districts: list[str],
+                         today: date) -> dict:
+    """
+    Разбирает аргументы команды /export.
+
+    Args:
+        args (str): Текст после команды.
+        districts (list): Допустимые названия районов.
+        today (date): Текущая местная дата.
+
+    Returns:
+        dict: Аргументы export_requests: kind, since, until, district,
+            file_format.
+
+    Raises:
+        ValueError: Аргументы не распознаны.
+    """
+    words = args.split()
+    if not words or words[0].lower() not in EXPORT_TABLES:
+        raise ValueError("Укажите, что выгрузить: kgm или complaint")
+    params = {'kind': words[0].lower(), 'district': None,
+              'file_format': 'xlsx'}
+    dates = []
+    by_name = {district.lower(): district for district in districts}
+    for word in words[1:]:
+        if word.lower() in EXPORT_FORMATS:
+            params['file_format'] = word.lower()
+        elif word.lower() in by_name:
+            params['district'] = by_name[word.lower()]
+        else:
+            dates.append(parse_date(word))
+    if len(dates) > 2:
+        raise ValueError("Укажите не больше двух дат")
+    params['since'] = dates[0] if dates else today.replace(day=1)
+    params['until'] = dates[1] if len(dates) > 1 else today
+    if params['since'] > params['until']:
+        raise ValueError("Начало периода позже конца")
+    return params
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    today = date.today()
+    parser = argparse.ArgumentParser(
+        description='Выгрузка заявок и обращений в CSV или XLSX')
+    parser.add_argument('kind', choices=list(EXPORT_TABLES),
+                        help='kgm - заявки на вывоз КГМ, '
+                             'complaint - обращения по качеству')
+    parser.add_argument('--since', type=parse_date,
+                        default=today.replace(day=1),
+                        help='Первый день, по умолчанию начало месяца')
+    parser.add_argument('--until', type=parse_date, default=today,
+                        help='Последний день включительно, '
+                             'по умолчанию сегодня')
+    parser.add_argument('--district', help='Район, по умолчанию все')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='xlsx')
+    parser.add_argument('--output', help='Файл, по умолчанию '
+                                         '<kind>_<since>_<until>.<format>')
+    parser.add_argument('--db', default=os.path.join('database', 'users.db'))
+    parser.add_argument('--hours-offset', type=int,
+                        default=int(os.getenv('TIMEDELTA', 0)),
+                        help='Сдвиг местного времени, по умолчанию TIMEDELTA')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+    output = args.output or (f'{args.kind}_{args.since:%Y%m%d}_'
+                             f'{args.until:%Y%m%d}.{args.format}')
+    count = export_requests(args.db, args.kind, output, args.since,
+                            args.until, args.district, args.format,
+                            args.hours_offset, args.chunk_size)
+    print(f'Выгружено строк: {count}, файл: {output}')
+
+
+if __name__ == '__main__':
+    main()
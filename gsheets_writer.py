@@ -0,0 +1,294 @@
+"""
+Пакетная запись строк в Google Таблицы.
+
+Вместо client.open + sheet1 + append_row на каждую заявку писатель
+кэширует лист каждой таблицы, копит строки и отправляет их одним
+append_rows на таблицу, соблюдая поминутную квоту Sheets API.
+
+Строка сначала сохраняется в таблицу sheet_queue в базе, и шаг outbox
+на этом завершается: он не ждёт отправки пакета, поэтому в пакет
+попадают строки от любого числа воркеров. Фоновая задача отправляет
+очередь, когда в ней набралось batch_size строк или прошло
+flush_interval секунд, и удаляет строки только после успешной
+отправки. При шардах очередь отправляет один процесс.
+
+Ошибка одной таблицы не задерживает остальные: её строки откладываются
+с растущей паузой, а после max_attempts неудачных попыток передаются
+в on_failure (разработчику) и удаляются из очереди. Ответ 429 общий для
+всех таблиц, поэтому он прерывает отправку без учёта попытки.
+
+Клиент gspread создаётся при первой записи, поэтому недоступность
+Google не мешает запуску бота.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable
+
+from gspread import Client as GClient
+from gspread.exceptions import APIError
+
+from async_database import AsyncDatabase
+from batching import RateLimiter
+from executors import BlockingExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def queue_rows(conn: sqlite3.Connection, sheet_name: str,
+               rows: list[list]) -> None:
+    """Ставит строки в очередь на отправку в таблицу sheet_name."""
+    now = int(time.time())
+    conn.executemany(
+        'INSERT INTO sheet_queue (sheet_name, row, created_at) '
+        'VALUES (?, ?, ?)',
+        [(sheet_name, json.dumps(row, ensure_ascii=False), now)
+         for row in rows])
+
+
+def fetch_queued_rows(conn: sqlite3.Connection, limit: int,
+                      after_id: int = 0) -> list[tuple]:
+    """
+    Читает до limit строк очереди, которые пора отправлять.
+
+    Returns:
+        list: Строки (id, таблица, строка) с id больше after_id.
+    """
+    return conn.execute(
+        'SELECT id, sheet_name, row FROM sheet_queue '
+        'WHERE id > ? AND retry_at <= ? ORDER BY id LIMIT ?',
+        (after_id, int(time.time()), limit)).fetchall()
+
+
+def delete_queued_rows(conn: sqlite3.Connection, ids: list[int]) -> None:
+    """Удаляет отправленные строки из очереди."""
+    conn.executemany('DELETE FROM sheet_queue WHERE id = ?',
+                     [(row_id,) for row_id in ids])
+
+
+def postpone_queued_rows(conn: sqlite3.Connection, ids: list[int],
+                        retry_delay: float, max_retry_delay: float,
+                        max_attempts: int) -> list[int]:
+    """
+    Учитывает неудачную попытку отправки строк и откладывает их.
+
+    Пауза перед следующей попыткой удваивается с каждой неудачей.
+
+    Returns:
+        list: id строк, исчерпавших max_attempts попыток.
+    """
+    now = int(time.time())
+    marks = ', '.join('?' * len(ids))
+    attempts = conn.execute(
+        f'SELECT id, attempts + 1 FROM sheet_queue WHERE id IN ({marks})',
+        ids).fetchall()
+    conn.executemany(
+        'UPDATE sheet_queue SET attempts = ?, retry_at = ? WHERE id = ?',
+        [(count, now + min(retry_delay * 2 ** (count - 1), max_retry_delay),
+          row_id) for row_id, count in attempts])
+    return [row_id for row_id, count in attempts if count >= max_attempts]
+
+
+def is_quota_error(error: Exception) -> bool:
+    """Ответ 429: превышена квота Sheets API."""
+    return (isinstance(error, APIError)
+            and getattr(error.response, 'status_code', None) == 429)
+
+
+class SheetWriter:
+    """Буферизующий писатель строк в первые листы Google Таблиц."""
+
+    def __init__(self, client_factory: Callable[[], GClient],
+                 executor: BlockingExecutor, db: AsyncDatabase,
+                 batch_size: int = 20, flush_interval: float = 5.0,
+                 requests_per_minute: int = 50, quota_pause: float = 60,
+                 max_rows: int = 500, max_attempts: int = 10,
+                 retry_delay: float = 30, max_retry_delay: float = 3600):
+        """
+        Args:
+            client_factory (Callable): Создаёт авторизованный клиент
+                gspread; вызывается в пуле потоков при первом обращении.
+            executor (BlockingExecutor): Пул потоков с лимитом бэкенда
+                google.
+            db (AsyncDatabase): База данных с очередью строк.
+            batch_size (int): Количество строк в очереди, при котором
+                она отправляется сразу.
+            flush_interval (float): Максимальное время ожидания строки
+                в очереди, сек.
+            requests_per_minute (int): Допустимое число запросов к API
+                в минуту.
+            quota_pause (float): Пауза после ответа 429, сек.
+            max_rows (int): Сколько строк очереди читать за раз.
+            max_attempts (int): Сколько раз пытаться отправить строку,
+                прежде чем отдать её в on_failure и удалить.
+            retry_delay (float): Пауза после первой неудачи, сек.
+            max_retry_delay (float): Наибольшая пауза между попытками,
+                сек.
+        """
+        self._client_factory = client_factory
+        self._client: GClient | None = None
+        self._client_lock = asyncio.Lock()
+        self._executor = executor
+        self._worksheets: dict[str, Any] = {}
+        self._limiter = RateLimiter(requests_per_minute, 60)
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.quota_pause = quota_pause
+        self.max_rows = max_rows
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        # Вызывается для строк, исчерпавших попытки:
+        # (таблица, строки, последняя ошибка)
+        self.on_failure: Callable[[str, list, Exception],
+                                  Awaitable[None]] | None = None
+        self._queued = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    async def append_row(self, sheet_name: str, row: list) -> None:
+        """
+        Ставит строку в очередь на отправку в таблицу sheet_name.
+
+        Завершается, когда строка сохранена в базе, не дожидаясь
+        отправки.
+        """
+        await self.db.write(queue_rows, sheet_name, [row])
+        self._queued += 1
+        if self._queued >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """Запускает фоновую отправку очереди."""
+        self._task = asyncio.create_task(self._worker())
+
+    async def close(self) -> None:
+        """Останавливает фоновую отправку и отправляет оставшиеся строки."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Строки Google Таблиц остались в очереди: {e}")
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Строки не потеряются: они удаляются после отправки
+                logger.error(f"Ошибка при записи в Google Таблицы: {e}")
+
+    async def flush(self) -> int:
+        """
+        Отправляет очередь: по одному append_rows на таблицу.
+
+        Строки таблицы, запись в которую не удалась, откладываются,
+        остальные таблицы отправляются как обычно.
+
+        Returns:
+            int: Количество отправленных строк.
+
+        Raises:
+            APIError: Превышена квота Sheets API; строки остались в очереди.
+        """
+        sent = 0
+        async with self._flush_lock:
+            self._queued = 0
+            after_id = 0
+            while True:
+                queued = await self.db.read(fetch_queued_rows, self.max_rows,
+                                            after_id)
+                by_sheet: dict[str, tuple[list, list]] = {}
+                for row_id, sheet_name, row in queued:
+                    ids, rows = by_sheet.setdefault(sheet_name, ([], []))
+                    ids.append(row_id)
+                    rows.append(json.loads(row))
+                for sheet_name, (ids, rows) in by_sheet.items():
+                    try:
+                        await self._flush(sheet_name, rows)
+                    except Exception as e:
+                        if is_quota_error(e):
+                            raise
+                        await self._postpone(sheet_name, ids, rows, e)
+                        continue
+                    await self.db.write(delete_queued_rows, ids)
+                    sent += len(rows)
+                if len(queued) < self.max_rows:
+                    return sent
+                after_id = queued[-1][0]
+
+    async def _postpone(self, sheet_name: str, ids: list[int], rows: list,
+                        error: Exception) -> None:
+        logger.error(f"Ошибка при записи в таблицу {sheet_name}, строк "
+                     f"отложено: {len(rows)}: {error}")
+        expired = await self.db.write(
+            postpone_queued_rows, ids, self.retry_delay,
+            self.max_retry_delay, self.max_attempts)
+        if not expired:
+            return
+        if self.on_failure is not None:
+            by_id = dict(zip(ids, rows))
+            await self.on_failure(sheet_name,
+                                  [by_id[row_id] for row_id in expired], error)
+        await self.db.write(delete_queued_rows, expired)
+
+    async def warm_up(self, sheet_names: list[str]) -> None:
+        """Заранее создаёт клиент и открывает листы таблиц."""
+        for sheet_name in sheet_names:
+            await self._worksheet(sheet_name)
+
+    async def _get_client(self) -> GClient:
+        async with self._client_lock:
+            if self._client is None:
+                # Ошибку не запоминаем: при следующей записи попробуем снова
+                self._client = await self._executor.run(
+                    'google', self._client_factory)
+            return self._client
+
+    async def _call(self, operation: str, func: Callable,
+                    *args, **kwargs) -> Any:
+        await self._limiter.acquire()
+        try:
+            return await self._executor.run('google', func, *args,
+                                            operation=operation, **kwargs)
+        except APIError as e:
+            if is_quota_error(e):
+                logger.warning("Превышена квота Google Sheets, пауза %s сек",
+                               self.quota_pause)
+                self._limiter.pause(self.quota_pause)
+            raise
+
+    async def _worksheet(self, sheet_name: str):
+        worksheet = self._worksheets.get(sheet_name)
+        if worksheet is None:
+            client = await self._get_client()
+            spreadsheet = await self._call('open', client.open, sheet_name)
+            # sheet1 тоже делает запрос к API
+            worksheet = await self._call('sheet1',
+                                        lambda: spreadsheet.sheet1)
+            self._worksheets[sheet_name] = worksheet
+        return worksheet
+
+    async def _flush(self, sheet_name: str, rows: list) -> None:
+        worksheet = await self._worksheet(sheet_name)
+        try:
+            await self._call('append_rows', worksheet.append_rows, rows)
+        except Exception:
+            # Лист могли удалить или переименовать, откроем заново
+            self._worksheets.pop(sheet_name, None)
+            raise
+        logger.info("В таблицу %s добавлено строк: %s", sheet_name, len(rows))
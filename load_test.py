@@ -0,0 +1,583 @@
+"""
+Нагрузочное тестирование бота.
+
+Синтетические пользователи проходят регистрацию, подачу заявки на вывоз
+КГМ и обращение по качеству через настоящий Dispatcher из main.py.
+Запросы бота к Telegram уходят в локальный aiohttp-сервер, который
+имитирует Bot API, а Яндекс.Диск, Google Таблицы и SMTP заменены
+заглушками внутри процесса с настраиваемой задержкой.
+
+По каждому сценарию и шагу выводятся p50/p95/p99 задержки обработки
+обновления и пропускная способность, по шагам outbox - время их
+выполнения в фоне.
+
+Пример запуска:
+    python load_test.py --users 200 --rounds 2 --api-latency 0.03
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import math
+import os
+import smtplib
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from itertools import count
+
+from aiohttp import web
+
+TOKEN = '123456:LOAD-TEST-TOKEN'
+GROUP_ID = -1000000000001
+FIRST_USER_ID = 10_000_000
+
+REGISTRATION = 'registration'
+KGM = 'kgm'
+COMPLAINT = 'complaint'
+
+# Шаги сценариев: (шаг, тип обновления, значение, ожидаемое состояние FSM
+# после обработки). В значениях подставляются {n} и {district}.
+FLOWS = {
+    REGISTRATION: (
+        ('start', 'message', '/start', None),
+        ('register', 'callback', 'register',
+         'RegistrationStates:waiting_for_full_name'),
+        ('full_name', 'message', 'Иванов Иван Иванович {n}',
+         'RegistrationStates:waiting_for_phone_number'),
+        ('phone_number', 'message', '89231234567',
+         'RegistrationStates:waiting_for_workplace'),
+        ('workplace', 'message', 'ООО "Управляющая компания {n}"',
+         'RegistrationStates:confirmation_application'),
+        ('confirm', 'callback', 'Верно', None),
+    ),
+    KGM: (
+        ('start', 'callback', 'kgm_request',
+         'KGMPickupStates:waiting_for_management_company'),
+        ('management_company', 'message', 'ООО "ЖКХ {n}"',
+         'KGMPickupStates:waiting_for_district'),
+        ('district', 'callback', 'district:{district}',
+         'KGMPickupStates:waiting_for_address'),
+        ('address', 'message', 'Красноярск, ул. Тельмана, д. {n}',
+         'KGMPickupStates:waiting_for_waste_type'),
+        ('waste_type', 'callback', 'waste_type:КГМ',
+         'KGMPickupStates:waiting_for_comment'),
+        ('comment', 'message', 'Нагрузочный тест',
+         'KGMPickupStates:waiting_for_photo'),
+        ('photo', 'photo', None, 'KGMPickupStates:waiting_for_confirmation'),
+        ('confirm', 'callback', 'confirm_data', None),
+    ),
+    COMPLAINT: (
+        ('start', 'callback', 'quality_complaint',
+         'ComplaintFSM:waiting_complaint_type'),
+        ('complaint_type', 'callback', 'Невывоз',
+         'ComplaintFSM:waiting_trouble'),
+        ('trouble', 'callback', '1 день', 'ComplaintFSM:waiting_address'),
+        ('address', 'message', 'Красноярск, ул. Ленина, д. {n}',
+         'ComplaintFSM:waiting_for_management_company'),
+        ('management_company', 'message', 'ТСЖ "Дом {n}"',
+         'ComplaintFSM:waiting_for_district'),
+        ('district', 'callback', 'district:{district}',
+         'ComplaintFSM:waiting_photo'),
+        ('photo', 'photo', None, 'ComplaintFSM:waiting_comment'),
+        ('comment', 'message', 'Нагрузочный тест',
+         'ComplaintFSM:waiting_contact_method'),
+        ('contact_method', 'callback', 'Телефон',
+         'ComplaintFSM:waiting_for_confirmation'),
+        ('confirm', 'callback', 'confirm_data', None),
+    ),
+}
+TOTAL = '(весь сценарий)'
+
+
+##############################################################################
+############################ Заглушки сервисов ###############################
+##############################################################################
+
+class FakeBotAPI:
+    """Локальный сервер, отвечающий на запросы бота вместо Telegram."""
+
+    def __init__(self, latency: float, photo_size: int):
+        self.latency = latency
+        self.photo = os.urandom(photo_size)
+        self.calls: dict[str, int] = defaultdict(int)
+        self._message_ids = count(1)
+        self._runner: web.AppRunner | None = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Запускает сервер и возвращает его адрес."""
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._method)
+        app.router.add_get('/file/bot{token}/{path:.+}', self._file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        host, port = self._runner.addresses[0][:2]
+        return f'http://{host}:{port}'
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({'ok': True,
+                                  'result': self._result(method, data)})
+
+    def _result(self, method: str, data) -> dict | bool:
+        method = method.lower()
+        if method == 'getfile':
+            file_id = data['file_id']
+            return {'file_id': file_id, 'file_unique_id': file_id,
+                    'file_size': len(self.photo),
+                    'file_path': f'photos/{file_id}.jpg'}
+        if method == 'sendmediagroup':
+            return [self._message(data)
+                    for _ in json.loads(data['media'])]
+        if method.startswith('send') or method in ('forwardmessage',
+                                                   'copymessage'):
+            return self._message(data)
+        return True
+
+    def _message(self, data) -> dict:
+        chat_id = int(data.get('chat_id') or 0)
+        return {'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id,
+                         'type': 'private' if chat_id > 0 else 'group'}}
+
+    async def _file(self, request: web.Request) -> web.Response:
+        self.calls['download'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        # Разное содержимое, чтобы фото не отсеивались как дубликаты
+        body = self.photo + request.match_info['path'].encode()
+        return web.Response(body=body, content_type='image/jpeg')
+
+
+class FakeDiskClient:
+    """Заглушка yadisk.AsyncClient."""
+
+    latency = 0.0
+    uploads = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def check_token(self, *args, **kwargs) -> bool:
+        await asyncio.sleep(self.latency)
+        return True
+
+    async def upload(self, file, remote_path: str, **kwargs) -> None:
+        file.read()
+        FakeDiskClient.uploads += 1
+        await asyncio.sleep(self.latency)
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeWorksheet:
+    """Лист Google Таблицы, блокирующий поток на время запроса."""
+
+    def __init__(self, client: 'FakeSheetsClient'):
+        self.client = client
+
+    def append_rows(self, rows: list, **kwargs) -> None:
+        time.sleep(self.client.latency)
+        self.client.requests += 1
+        self.client.rows += len(rows)
+
+
+class FakeSpreadsheet:
+    def __init__(self, client: 'FakeSheetsClient'):
+        self.sheet1 = FakeWorksheet(client)
+
+
+class FakeSheetsClient:
+    """Заглушка клиента gspread."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.requests = 0
+        self.rows = 0
+
+    def open(self, name: str) -> FakeSpreadsheet:
+        return FakeSpreadsheet(self)
+
+
+class FakeSMTP:
+    """Заглушка smtplib.SMTP."""
+
+    latency = 0.0
+    connections = 0
+    messages = 0
+
+    def __init__(self, *args, **kwargs):
+        FakeSMTP.connections += 1
+
+    def ehlo(self, *args):
+        pass
+
+    def starttls(self, *args, **kwargs):
+        pass
+
+    def login(self, *args):
+        pass
+
+    def noop(self):
+        return 250, b'OK'
+
+    def sendmail(self, *args, **kwargs) -> dict:
+        time.sleep(self.latency)
+        FakeSMTP.messages += 1
+        return {}
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def install_stand_ins(args: argparse.Namespace) -> FakeSheetsClient:
+    """Подменяет клиенты внешних сервисов до импорта settings."""
+    import gspread
+    import yadisk
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    sheets = FakeSheetsClient(args.sheets_latency)
+    ServiceAccountCredentials.from_json_keyfile_name = classmethod(
+        lambda cls, *args, **kwargs: None)
+    gspread.authorize = lambda credentials: sheets
+    FakeDiskClient.latency = args.disk_latency
+    yadisk.AsyncClient = FakeDiskClient
+    FakeSMTP.latency = args.smtp_latency
+    smtplib.SMTP = FakeSMTP
+    return sheets
+
+
+def configure_environment(api_server: str, workdir: str) -> None:
+    """Задаёт переменные окружения бота для тестового запуска."""
+    os.makedirs(os.path.join(workdir, 'logs'), exist_ok=True)
+    os.chdir(workdir)
+    environment = {
+        'TELEGRAM_TOKEN': TOKEN,
+        'TELEGRAM_API_SERVER': api_server,
+        'DEV_TG_ID': '1',
+        'GROUP_ID': str(GROUP_ID),
+        'TIMEDELTA': '0',
+        'YA_DISK_FOLDER': 'load_test/kgm',
+        'YA_DISK_FOLDER_COMPLAINTS': 'load_test/complaints',
+        'GOOGLE_SHEET_NAME_LEFT': 'load_test_left',
+        'GOOGLE_SHEET_NAME_RIGHT': 'load_test_right',
+        'GOOGLE_SHEET_COMPLAINT_NAME': 'load_test_complaints',
+        'TARGET_EMAIL': 'load-test@example.com',
+        'EMAIL_FORWARD': '1',
+        'EMAIL': 'bot@example.com',
+        'METRICS_PORT': '0',
+    }
+    os.environ.update(environment)
+
+
+##############################################################################
+######################## Синтетические пользователи ##########################
+##############################################################################
+
+class Stats:
+    """Замеры задержек по сценариям и шагам."""
+
+    def __init__(self):
+        self.samples: dict[tuple, list[float]] = defaultdict(list)
+        self.errors: dict[tuple, int] = defaultdict(int)
+
+    def add(self, flow: str, step: str, seconds: float) -> None:
+        self.samples[flow, step].append(seconds)
+
+    def error(self, flow: str, step: str) -> None:
+        self.errors[flow, step] += 1
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль q по отсортированному списку (метод ближайшего ранга)."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class SyntheticUser:
+    """Пользователь, отправляющий боту обновления по сценарию."""
+
+    update_ids = count(1)
+    message_ids = count(1)
+
+    def __init__(self, dispatcher, stats: Stats, user_id: int, think: float,
+                 districts: list):
+        self.dispatcher = dispatcher
+        self.stats = stats
+        self.user = {'id': user_id, 'is_bot': False,
+                     'first_name': f'User{user_id}',
+                     'username': f'load_user_{user_id}'}
+        self.chat = {'id': user_id, 'type': 'private'}
+        self.think = think
+        self.districts = districts
+        self.photos = count(1)
+
+    def _message(self, **fields) -> dict:
+        return {'message_id': next(self.message_ids),
+                'date': int(time.time()), 'chat': self.chat,
+                'from': self.user, **fields}
+
+    def _update(self, kind: str, value: str | None) -> dict:
+        if kind == 'message':
+            return {'update_id': next(self.update_ids),
+                    'message': self._message(text=value)}
+        if kind == 'photo':
+            photo_id = f'photo-{self.user["id"]}-{next(self.photos)}'
+            return {'update_id': next(self.update_ids),
+                    'message': self._message(photo=[{
+                        'file_id': photo_id, 'file_unique_id': photo_id,
+                        'width': 1280, 'height': 960}])}
+        return {'update_id': next(self.update_ids),
+                'callback_query': {
+                    'id': str(next(self.update_ids)), 'from': self.user,
+                    'chat_instance': str(self.user['id']), 'data': value,
+                    'message': self._message(text='...')}}
+
+    async def run_flow(self, flow: str, n: int) -> bool:
+        """Проходит сценарий flow; возвращает False при ошибке."""
+        from aiogram import types
+
+        district = self.districts[n % len(self.districts)]
+        storage = self.dispatcher.storage
+        elapsed = 0.0
+        for step, kind, value, expected in FLOWS[flow]:
+            if value is not None:
+                value = value.format(n=n, district=district)
+            # Если бот предложил подсказки адресов, а своего адреса среди
+            # них нет, пользователь отправляет адрес ещё раз
+            attempts = 2 if step == 'address' else 1
+            for _ in range(attempts):
+                update = types.Update(**self._update(kind, value))
+                start = time.perf_counter()
+                try:
+                    # Как и при polling, каждое обновление обрабатывается в
+                    # своей задаче (aiogram кэширует состояние FSM в
+                    # contextvars) и проходит middleware уровня обновления
+                    await asyncio.create_task(
+                        self.dispatcher.updates_handler.notify(update))
+                except Exception as e:
+                    logging.error(f"{flow}/{step}: {e}")
+                    self.stats.error(flow, step)
+                    return False
+                seconds = time.perf_counter() - start
+                elapsed += seconds
+                self.stats.add(flow, step, seconds)
+                state = await storage.get_state(chat=self.chat['id'],
+                                                user=self.user['id'])
+                if state == expected:
+                    break
+            if state != expected:
+                logging.error(f"{flow}/{step}: состояние {state}, "
+                              f"ожидалось {expected}")
+                self.stats.error(flow, step)
+                await storage.reset_state(chat=self.chat['id'],
+                                          user=self.user['id'])
+                return False
+            if self.think:
+                await asyncio.sleep(self.think)
+        self.stats.add(flow, TOTAL, elapsed)
+        return True
+
+    async def run(self, rounds: int, delay: float) -> None:
+        from aiogram import Bot, Dispatcher
+
+        Bot.set_current(self.dispatcher.bot)
+        Dispatcher.set_current(self.dispatcher)
+        await asyncio.sleep(delay)
+        if not await self.run_flow(REGISTRATION, 0):
+            return
+        for n in range(rounds):
+            await self.run_flow(KGM, n)
+            await self.run_flow(COMPLAINT, n)
+
+
+def timed_step(stats: Stats, flow: str, step: str, func):
+    """Оборачивает шаг outbox замером времени."""
+
+    async def wrapper(payload: dict) -> None:
+        start = time.perf_counter()
+        try:
+            await func(payload)
+        except Exception:
+            stats.error(flow, step)
+            raise
+        stats.add(flow, step, time.perf_counter() - start)
+
+    return wrapper
+
+
+def count_pending_jobs(conn) -> int:
+    return conn.execute(
+        "SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+
+async def wait_outbox(database, timeout: float) -> int:
+    """Ждёт, пока фоновые воркеры обработают все задачи outbox."""
+    deadline = time.monotonic() + timeout
+    pending = await database.read(count_pending_jobs)
+    while pending and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+        pending = await database.read(count_pending_jobs)
+    return pending
+
+
+##############################################################################
+################################## Отчёт #####################################
+##############################################################################
+
+def build_report(stats: Stats, wall: dict[str, float],
+                 order: list[tuple]) -> list[dict]:
+    """Считает перцентили и пропускную способность по каждому шагу."""
+    report = []
+    keys = sorted(stats.samples, key=lambda key: (
+        order.index(key) if key in order else len(order), key))
+    for flow, step in keys:
+        values = sorted(stats.samples[flow, step])
+        duration = wall.get(flow.split(':')[0]) or wall['load']
+        report.append({
+            'flow': flow, 'step': step, 'count': len(values),
+            'errors': stats.errors.get((flow, step), 0),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000,
+            'per_second': len(values) / duration if duration else 0.0,
+        })
+    for (flow, step), errors in stats.errors.items():
+        if (flow, step) not in stats.samples:
+            report.append({'flow': flow, 'step': step, 'count': 0,
+                           'errors': errors, 'p50_ms': 0.0, 'p95_ms': 0.0,
+                           'p99_ms': 0.0, 'max_ms': 0.0, 'per_second': 0.0})
+    return report
+
+
+def print_report(report: list[dict]) -> None:
+    header = (f"{'сценарий':<18} {'шаг':<20} {'n':>7} {'ошиб':>5} "
+              f"{'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'max мс':>9} "
+              f"{'в сек':>8}")
+    print(header)
+    print('-' * len(header))
+    for row in report:
+        print(f"{row['flow']:<18} {row['step']:<20} {row['count']:>7} "
+              f"{row['errors']:>5} {row['p50_ms']:>9.1f} "
+              f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} "
+              f"{row['max_ms']:>9.1f} {row['per_second']:>8.1f}")
+
+
+##############################################################################
+################################## Запуск ####################################
+##############################################################################
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    fake_api = FakeBotAPI(args.api_latency, args.photo_size * 1024)
+    api_server = await fake_api.start()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bot_load_test_')
+    configure_environment(api_server, workdir)
+    sheets = install_stand_ins(args)
+    main = importlib.import_module('main')
+    logging.getLogger().setLevel(args.log_level)
+
+    stats = Stats()
+    order = [(flow, step[0]) for flow, steps in FLOWS.items()
+             for step in steps + ((TOTAL,),)]
+    for kind, steps in main.OUTBOX._steps.items():
+        for step in steps:
+            step.func = timed_step(stats, f'outbox:{kind}', step.name,
+                                   step.func)
+            order.append((f'outbox:{kind}', step.name))
+
+    dispatcher = main.dp
+    await main.on_startup(dispatcher)
+    users = [SyntheticUser(dispatcher, stats, FIRST_USER_ID + index,
+                           args.think, main.district_names)
+             for index in range(args.users)]
+    wall = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        user.run(args.rounds, args.ramp * index / max(args.users, 1))
+        for index, user in enumerate(users)))
+    wall['load'] = time.perf_counter() - start
+    pending = await wait_outbox(main.DATABASE, args.drain_timeout)
+    wall['outbox'] = time.perf_counter() - start
+    await main.on_shutdown(dispatcher)
+    await dispatcher.storage.close()
+    await dispatcher.storage.wait_closed()
+    session = await dispatcher.bot.get_session()
+    await session.close()
+    await fake_api.stop()
+
+    report = build_report(stats, wall, order)
+    print(f"\nПользователей: {args.users}, раундов: {args.rounds}, "
+          f"рабочий каталог: {workdir}")
+    print(f"Нагрузка: {wall['load']:.1f} с, с обработкой outbox: "
+          f"{wall['outbox']:.1f} с, не обработано задач: {pending}")
+    print(f"Bot API: {dict(fake_api.calls)}")
+    print(f"Яндекс.Диск: загрузок {FakeDiskClient.uploads}; "
+          f"Google Таблицы: запросов {sheets.requests}, строк {sheets.rows}; "
+          f"SMTP: соединений {FakeSMTP.connections}, "
+          f"писем {FakeSMTP.messages}\n")
+    print_report(report)
+    return report
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.
+                                     ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--users', type=int, default=50,
+                        help='количество одновременных пользователей')
+    parser.add_argument('--rounds', type=int, default=1,
+                        help='заявок КГМ и обращений на пользователя')
+    parser.add_argument('--ramp', type=float, default=0.0,
+                        help='за сколько секунд стартуют все пользователи')
+    parser.add_argument('--think', type=float, default=0.0,
+                        help='пауза пользователя между шагами, с')
+    parser.add_argument('--api-latency', type=float, default=0.02,
+                        help='задержка ответа Bot API, с')
+    parser.add_argument('--disk-latency', type=float, default=0.2,
+                        help='задержка загрузки на Яндекс.Диск, с')
+    parser.add_argument('--sheets-latency', type=float, default=0.3,
+                        help='задержка запроса к Google Таблицам, с')
+    parser.add_argument('--smtp-latency', type=float, default=0.1,
+                        help='задержка отправки письма, с')
+    parser.add_argument('--photo-size', type=int, default=200,
+                        help='размер фото, КБ')
+    parser.add_argument('--drain-timeout', type=float, default=120,
+                        help='сколько ждать обработки outbox, с')
+    parser.add_argument('--workdir',
+                        help='каталог для базы и логов (по умолчанию '
+                             'временный)')
+    parser.add_argument('--json', help='сохранить отчёт в JSON-файл')
+    parser.add_argument('--log-level', default='WARNING',
+                        help='уровень логирования бота')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    if arguments.json:
+        # Рабочий каталог меняется при запуске
+        arguments.json = os.path.abspath(arguments.json)
+    result = asyncio.run(run(arguments))
+    if arguments.json:
+        with open(arguments.json, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    if any(row['errors'] for row in result):
+        sys.exit(1)
@@ -0,0 +1,227 @@
+"""
+Асинхронная отправка почты.
+
+Письма складываются в очередь, а фоновая задача отправляет их через
+одно авторизованное SMTP-соединение, которое переиспользуется между
+письмами и переоткрывается после обрыва. Блокирующие вызовы smtplib
+выполняются в пуле потоков с лимитом бэкенда smtp.
+
+В режиме сводки письма одному адресату копятся digest_minutes минут
+и уходят одним письмом.
+"""
+import asyncio
+import logging
+import smtplib
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from executors import BlockingExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Mailer:
+    """Очередь писем с постоянным SMTP-соединением."""
+
+    def __init__(self, executor: BlockingExecutor, host: str, port: int,
+                 sender: str, password: str | None = None,
+                 starttls: bool = True, digest_minutes: float = 0,
+                 idle_timeout: float = 120, send_timeout: float = 120):
+        """
+        Args:
+            executor (BlockingExecutor): Пул потоков с лимитом бэкенда smtp.
+            host (str): Адрес SMTP-сервера.
+            port (int): Порт SMTP-сервера.
+            sender (str): Адрес отправителя, он же логин.
+            password (str): Пароль. Без пароля авторизация пропускается.
+            starttls (bool): Включать ли шифрование STARTTLS.
+            digest_minutes (float): Период сводки в минутах, 0 - письма
+                отправляются сразу.
+            idle_timeout (float): Через сколько секунд простоя закрывать
+                соединение.
+            send_timeout (float): Сколько секунд send ждёт отправки
+                письма в обычном режиме.
+        """
+        self.executor = executor
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.password = password
+        self.starttls = starttls
+        self.digest_minutes = digest_minutes
+        self.idle_timeout = idle_timeout
+        self.send_timeout = send_timeout
+        self._server: smtplib.SMTP | None = None
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Запускает фоновую отправку писем."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self) -> None:
+        """Отправляет накопленные письма и закрывает соединение."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        if pending:
+            await self._deliver(pending)
+        await self.executor.run('smtp', self._disconnect)
+
+    async def warm_up(self) -> None:
+        """Заранее открывает SMTP-соединение."""
+        if not self.digest_minutes:
+            await self.executor.run('smtp', self._connect)
+
+    async def send(self, message_text: str, target_email: str,
+                   subject: str | None = None) -> None:
+        """
+        Ставит письмо в очередь.
+
+        В обычном режиме ждёт фактической отправки и пробрасывает её
+        ошибку. В режиме сводки возвращается сразу после постановки
+        в очередь, а ошибки отправки сводки только пишутся в лог.
+
+        Raises:
+            asyncio.TimeoutError: Письмо не отправлено за send_timeout
+                секунд; тогда оно убирается из очереди.
+        """
+        if self._queue is None:
+            self.start()
+        if subject is None:
+            subject = (f"Новое обращение принято ботом "
+                       f"{datetime.now().strftime('%Y-%m-%d %H:%M')}")
+        if self.digest_minutes:
+            self._queue.put_nowait((target_email, subject, message_text,
+                                    None))
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((target_email, subject, message_text, future))
+        # При таймауте future отменяется, и письмо не будет отправлено
+        await asyncio.wait_for(future, self.send_timeout)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                await self._next_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Воркер не должен умирать: иначе send ждал бы до таймаута
+                logger.error(f"Ошибка почтового воркера: {e}")
+
+    async def _next_batch(self) -> None:
+        if self.digest_minutes:
+            await asyncio.sleep(self.digest_minutes * 60)
+            batch = []
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+        else:
+            try:
+                batch = [await asyncio.wait_for(self._queue.get(),
+                                                self.idle_timeout)]
+            except asyncio.TimeoutError:
+                await self.executor.run('smtp', self._disconnect)
+                return
+        if batch:
+            await self._deliver(batch)
+        if self.digest_minutes:
+            # До следующей сводки соединение не понадобится
+            await self.executor.run('smtp', self._disconnect)
+
+    async def _deliver(self, batch: list) -> None:
+        if self.digest_minutes:
+            batch = self._make_digests(batch)
+        else:
+            # Письма, которые уже не ждут (таймаут send), не отправляем
+            batch = [(target_email, subject, message_text, [future])
+                     for target_email, subject, message_text, future in batch
+                     if not future.done()]
+        for target_email, subject, message_text, futures in batch:
+            try:
+                await self.executor.run('smtp', self._send_sync,
+                                        target_email, subject, message_text)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке письма {target_email}: {e}")
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in futures:
+                    if not future.done():
+                        future.set_result(None)
+
+    def _make_digests(self, batch: list) -> list:
+        by_target: dict[str, list] = {}
+        for target_email, subject, message_text, future in batch:
+            by_target.setdefault(target_email, []).append(
+                (subject, message_text, future))
+        digests = []
+        for target_email, items in by_target.items():
+            text = '\n\n----------\n\n'.join(
+                f"{subject}\n\n{message_text}"
+                for subject, message_text, _ in items)
+            subject = (f"Сводка обращений ({len(items)}) "
+                       f"{datetime.now().strftime('%Y-%m-%d %H:%M')}")
+            digests.append((target_email, subject, text, []))
+        return digests
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._server is not None:
+            return self._server
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        server.ehlo()
+        if self.starttls:
+            # Защищаем соединение с помощью шифрования tls
+            server.starttls()
+            # Повторно идентифицируем себя как зашифрованное соединение
+            # перед аутентификацией.
+            server.ehlo()
+        if self.password:
+            server.login(self.sender, self.password)
+        self._server = server
+        return server
+
+    def _disconnect(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+    def _send_sync(self, target_email: str, subject: str,
+                   message_text: str) -> None:
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = target_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(message_text, _charset='utf-8'))
+        # Соединение могло быть закрыто сервером, пробуем один раз
+        # переподключиться
+        for attempt in range(2):
+            server = self._connect()
+            try:
+                server.sendmail(self.sender, target_email, msg.as_string())
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self._disconnect()
+                if attempt:
+                    raise
+            except smtplib.SMTPException:
+                # Ответ сервера с ошибкой не повторяем: письмо могло
+                # уже уйти, а соединение осталось рабочим
+                raise
+            except OSError:
+                # Таймаут и прочие сбои сокета: состояние соединения
+                # неизвестно, повтор может отправить письмо дважды
+                self._disconnect()
+                raise
@@ -1,35 +1,65 @@
+import asyncio
 import logging
 import os
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
 from random import choice
 
-from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram import Dispatcher, types
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from aiogram.dispatcher import FSMContext
-from aiogram.dispatcher.filters import Text, Command
-from aiogram.types import (InlineKeyboardButton, InlineKeyboardMarkup)
+from aiogram.dispatcher.filters import Command
 from aiogram.utils import executor
 from dotenv import load_dotenv
 
+from address_index import load_address_index, normalize_address
+from album_forwarder import AlbumForwarder
+from bot_limiter import ThrottledBot
 from FSM_Classes import RegistrationStates, KGMPickupStates, ComplaintFSM
-from api_functions import upload_and_get_link, upload_information_to_gsheets
+from metrics import ERRORS, REGISTRY, MetricsServer, gauge_lines
+from middlewares import MetricsMiddleware, ThrottlingMiddleware
+from outbox import Job, Step
+from photo_pipeline import PhotoArchiver
+from router import CallbackRouter
+from sharding import run_sharded, shard_index
+from export import (EXPORT_USAGE, TELEGRAM_DOCUMENT_LIMIT, export_requests,
+                    parse_export_command)
+from sqlite_storage import SQLiteStorage
+from stats import format_stats, period_starts
+from warmup import warm_up
+from webhook import run_webhook
 from bots_func import (get_main_menu, get_cancel, get_waste_type_keyboard,
-                       download_photo, get_district_name, get_coast_name,
+                       get_district_name, get_coast_name,
+                       get_address_keyboard,
                        is_valid_email, get_quality_complaint_keyboard,
                        get_no_collection_days_keyboard,
                        get_quality_issue_keyboard, get_cancel_keyboard,
                        get_confirmation_keyboard, get_no_comment_keyboard,
-                       get_contact_method_keyboard, get_registration_keyboard)
-from database_functions import (is_user_registered, register_user,
-                                save_kgm_request, get_user_by_id,
-                                save_quality_complaint)
-from settings import (text_message_answers, YANDEX_CLIENT, YA_DISK_FOLDER,
-                      DEV_TG_ID, GOOGLE_CLIENT, GOOGLE_SHEET_NAME,
-                      database_path, log_file, waste_types, district_names,
-                      districts_tz, TIMEDELTA, GOOGLE_SHEET_COMPLAINT_NAME,
-                      YA_DISK_FOLDER_COMPLAINTS, GROUP_ID)
-from standard_messages import today_sanpin
+                       get_contact_method_keyboard, get_registration_keyboard,
+                       REGISTRATION_CONFIRM_KEYBOARD)
+from settings import (text_message_answers, YANDEX_UPLOADER, YA_DISK_FOLDER,
+                      DEV_TG_ID, SHEET_WRITER, GOOGLE_SHEET_NAME, DATABASE,
+                      USER_CACHE, OUTBOX, EXECUTOR, log_file, waste_types,
+                      district_names, districts_tz, TIMEDELTA,
+                      GOOGLE_SHEET_COMPLAINT_NAME, YA_DISK_FOLDER_COMPLAINTS,
+                      GROUP_ID, PHOTO_SPOOL_THRESHOLD, MAILER, TARGET_EMAIL,
+                      EMAIL_FORWARD, FSM_FLUSH_INTERVAL, FSM_TTL_DAYS,
+                      BOT_MODE,
+                      PROCESS_BACKLOG, WEBHOOK_HOST, WEBHOOK_PATH,
+                      WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+                      SHARD_WORKERS, METRICS_HOST, METRICS_PORT,
+                      TELEGRAM_API_SERVER, STARTED_AT, WARM_UP_BACKENDS,
+                      WARM_UP_TIMEOUT, STAFF_IDS, EXCEL_JOURNAL,
+                      BOT_API_LIMITER, BOT_API_MAX_RETRIES,
+                      GROUP_ALBUM_WINDOW, THROTTLE_LIMIT, THROTTLE_WINDOW,
+                      THROTTLE_DELAY, ADDRESS_INDEX, ADDRESS_SUGGESTIONS)
+from standard_messages import (today_sanpin, KGM_CONFIRMATION, KGM_FORWARD,
+                               COMPLAINT_CONFIRMATION,
+                               COMPLAINT_EMAIL_CONFIRMATION,
+                               COMPLAINT_FORWARD)
 
 load_dotenv()
 
@@ -50,11 +80,47 @@ logger.info("Логи будут сохраняться в файл: %s", log_fi
 
 API_TOKEN = os.getenv('TELEGRAM_TOKEN')
 
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
+# Запросы к чатам проходят через ограничитель частоты Bot API
+bot = ThrottledBot(token=API_TOKEN,
+                   server=(TelegramAPIServer.from_base(TELEGRAM_API_SERVER)
+                           if TELEGRAM_API_SERVER else TELEGRAM_PRODUCTION),
+                   limiter=BOT_API_LIMITER, max_retries=BOT_API_MAX_RETRIES)
+# Черновики заявок сохраняются в SQLite и переживают перезапуск
+storage = SQLiteStorage(DATABASE, flush_interval=FSM_FLUSH_INTERVAL,
+                        ttl=FSM_TTL_DAYS * 24 * 3600)
 dp = Dispatcher(bot, storage=storage)
 
+# Антифлуд первым: лишние обновления не доходят до логирования и FSM
+if THROTTLE_LIMIT:
+    dp.middleware.setup(ThrottlingMiddleware(
+        THROTTLE_LIMIT, THROTTLE_WINDOW, delay=THROTTLE_DELAY))
 dp.middleware.setup(LoggingMiddleware())
+dp.middleware.setup(MetricsMiddleware())
+# Нажатия кнопок выбираются по состоянию и данным кнопки, а не перебором
+router = CallbackRouter()
+router.setup(dp)
+
+METRICS = MetricsServer()
+REGISTRY.add_collector(lambda: gauge_lines(
+    'bot_user_cache', 'Состояние кэша профилей пользователей',
+    USER_CACHE.stats()))
+REGISTRY.add_collector(lambda: gauge_lines(
+    'bot_api_limiter', 'Очередь ограничителя запросов Bot API',
+    BOT_API_LIMITER.stats()))
+
+PHOTO_ARCHIVER = PhotoArchiver(bot, YANDEX_UPLOADER, DATABASE,
+                               spool_threshold=PHOTO_SPOOL_THRESHOLD)
+# Заявки в группу сотрудников уходят альбомами, если задано окно
+GROUP_FORWARDER = AlbumForwarder(bot, window=GROUP_ALBUM_WINDOW)
+
+
+async def alert_dev(source: str, text: str) -> None:
+    """Сообщает разработчику об ошибке и учитывает её в метриках."""
+    ERRORS.inc(source=source)
+    try:
+        await bot.send_message(DEV_TG_ID, text)
+    except Exception as e:
+        logging.error(f"Не удалось отправить сообщение разработчику: {e}")
 
 
 ###############################################################################
@@ -67,7 +133,7 @@ async def send_welcome(message: types.Message):
     Отрабатывает команду start.
     """
     user_id = message.from_user.id
-    if is_user_registered(database_path, user_id):
+    if await DATABASE.is_user_registered(user_id):
         await message.reply("Добро пожаловать! "
                             "Я приму вашу заявку на вывоз КГМ \U0001F69B или обращения по качеству оказания услуг \U0001f514",
                             reply_markup=get_main_menu())
@@ -81,8 +147,60 @@ async def send_welcome(message: types.Message):
         )
 
 
-@dp.callback_query_handler(lambda callback: callback.data == 'cancel',
-                           state="*")
+@dp.message_handler(commands=['stats'], user_id=STAFF_IDS, state="*")
+async def send_stats(message: types.Message):
+    """
+    Отрабатывает команду stats для сотрудников.
+
+    Показывает количество заявок и обращений за сегодня, неделю и месяц
+    по сводной таблице, не прерывая заполнение заявки.
+    """
+    rows = await DATABASE.get_stats(period_starts(datetime.now(), TIMEDELTA))
+    await message.answer(format_stats(rows))
+
+
+@dp.message_handler(commands=['export'], user_id=STAFF_IDS, state="*")
+async def send_export(message: types.Message):
+    """
+    Отрабатывает команду export для сотрудников.
+
+    Выгружает заявки или обращения за период в XLSX или CSV и
+    отправляет файл документом.
+    """
+    today = (datetime.now() + timedelta(hours=TIMEDELTA)).date()
+    try:
+        params = parse_export_command(message.get_args(), district_names,
+                                      today)
+    except ValueError as e:
+        await message.answer(f"{e}\n\n{EXPORT_USAGE}")
+        return
+    filename = (f"{params['kind']}_{params['since']:%Y%m%d}_"
+                f"{params['until']:%Y%m%d}.{params['file_format']}")
+    cancel = threading.Event()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, filename)
+        try:
+            # При таймауте run дождётся, пока поток заметит отмену, и
+            # только потом каталог будет удалён
+            count = await EXECUTOR.run('export', export_requests,
+                                       DATABASE.db_path, path=path,
+                                       hours_offset=TIMEDELTA, cancel=cancel,
+                                       on_timeout=cancel.set, **params)
+        except asyncio.TimeoutError:
+            await message.answer(
+                "Выгрузка не уложилась во время. Сократите период или "
+                "выгрузите через python export.py на сервере.")
+            return
+        if os.path.getsize(path) > TELEGRAM_DOCUMENT_LIMIT:
+            await message.answer(
+                "Файл больше 50 МБ, Telegram его не примет. Сократите "
+                "период или выгрузите через python export.py на сервере.")
+            return
+        await message.answer_document(types.InputFile(path),
+                                      caption=f"Строк: {count}")
+
+
+@router.callback_query_handler(data='cancel', state="*")
 async def cmd_cancel(callback: types.CallbackQuery, state: FSMContext) -> None:
     """
     Отрабатывает команду cancel и завершает текущее состояние.
@@ -107,7 +225,7 @@ async def cmd_cancel(callback: types.CallbackQuery, state: FSMContext) -> None:
 ################# Машина состояний регистрация ################################
 ###############################################################################
 
-@dp.callback_query_handler(Text(equals="register"))
+@router.callback_query_handler(data="register")
 @dp.message_handler(Command("reg"))
 async def start_registration(event: types.CallbackQuery | types.Message):
     if isinstance(event, types.CallbackQuery):
@@ -121,7 +239,7 @@ async def start_registration(event: types.CallbackQuery | types.Message):
         logging.warning("Unknown event type")
         return
 
-    if is_user_registered(database_path, user_id):
+    if await DATABASE.is_user_registered(user_id):
         await message.answer("Вы уже зарегистрированы! "
                              "Я приму вашу заявку \U0001F69B",
                              reply_markup=get_main_menu())
@@ -196,20 +314,19 @@ async def get_workplace(message: types.Message, state: FSMContext):
     workplace = user_data['workplace']
 
     # Подтверждение данных перед регистрацией
-    keyboad = get_cancel()
-    keyboad.add(InlineKeyboardButton(text='ВСЕ ВЕРНО!', callback_data='Верно'))
     await message.answer(
         f"Проверьте информацию:\n"
         f"ФИО: {full_name}\n"
         f"Номер телефона: {phone_number}\n"
         f"Место работы: {workplace}\n\n"
-        f"Если все верно, нажмите 'ВСЕ ВЕРНО!'.", reply_markup=keyboad
+        f"Если все верно, нажмите 'ВСЕ ВЕРНО!'.",
+        reply_markup=REGISTRATION_CONFIRM_KEYBOARD
     )
     await RegistrationStates.next()
 
 
-@dp.callback_query_handler(lambda callback: callback.data == 'Верно',
-                           state=RegistrationStates.confirmation_application)
+@router.callback_query_handler(
+    data='Верно', state=RegistrationStates.confirmation_application)
 async def confirm_registration(callback_query: types.CallbackQuery,
                                state: FSMContext):
     user_id = callback_query.from_user.id
@@ -220,15 +337,14 @@ async def confirm_registration(callback_query: types.CallbackQuery,
     username = callback_query.from_user.username
 
     try:
-        register_user(database_path, user_id, full_name, phone_number,
-                      workplace,
-                      username)
+        await DATABASE.register_user(user_id, full_name, phone_number,
+                                     workplace, username)
     except Exception as e:
         logging.error(e)
-        await bot.send_message(DEV_TG_ID,
-                               f"Произошла ошибка при регистрации пользователя "
-                               f"{user_id}, {full_name}, {phone_number}, "
-                               f"{workplace}, {username}")
+        await alert_dev('registration',
+                        f"Произошла ошибка при регистрации пользователя "
+                        f"{user_id}, {full_name}, {phone_number}, "
+                        f"{workplace}, {username}")
 
     await callback_query.message.answer(
         "Вы успешно зарегистрированы и теперь можете пользоваться ботом!",
@@ -238,19 +354,105 @@ async def confirm_registration(callback_query: types.CallbackQuery,
     await callback_query.answer("Регистрация завершена!")
 
 
+##############################################################################
+####################### Подсказки адресов ####################################
+##############################################################################
+
+async def offer_addresses(message: types.Message, state: FSMContext,
+                          district: str | None = None,
+                          allow_typed: bool = True) -> bool:
+    """
+    Предлагает кнопками похожие адреса из прошлых заявок.
+
+    Подсказки не показываются, если такой адрес уже встречался или
+    пользователь отправил тот же адрес повторно после подсказок: тогда
+    он принимается как есть.
+
+    Args:
+        message (types.Message): Сообщение с адресом.
+        state (FSMContext): Состояние пользователя.
+        district (str): Район заявки, None - искать по всем районам.
+        allow_typed (bool): Можно ли оставить адрес как написано.
+
+    Returns:
+        bool: Подсказки отправлены, и адрес придёт нажатием кнопки или
+            новым сообщением.
+    """
+    if not ADDRESS_SUGGESTIONS:
+        return False
+    if allow_typed:
+        typed = (await state.get_data()).get('address_typed')
+        if typed is not None and (normalize_address(typed)
+                                  == normalize_address(message.text)):
+            return False
+        if ADDRESS_INDEX.is_known(message.text, district):
+            return False
+    addresses = ADDRESS_INDEX.lookup(message.text, district,
+                                     ADDRESS_SUGGESTIONS)
+    if not addresses:
+        return False
+    await state.update_data(
+        address_typed=message.text if allow_typed else None,
+        address_options=addresses)
+    if allow_typed:
+        text = ("Похожие адреса из прошлых заявок. Выберите подходящий, "
+                "а если вашего адреса среди них нет, отправьте его ещё раз:")
+    else:
+        text = ("Похожие адреса из прошлых заявок. Выберите подходящий "
+                "или напишите адрес полностью:")
+    await message.answer(
+        text,
+        reply_markup=get_address_keyboard(addresses, with_typed=allow_typed))
+    return True
+
+
+async def suggested_address(callback: types.CallbackQuery,
+                            state: FSMContext) -> str | None:
+    """
+    Возвращает адрес по нажатой подсказке.
+
+    Если подсказка устарела (например, пользователь уже ввёл другой
+    адрес), просит ввести адрес заново и возвращает None.
+    """
+    user_data = await state.get_data()
+    choice = callback.data.split(":")[1]
+    options = user_data.get('address_options') or []
+    if choice == 'typed':
+        address = user_data.get('address_typed')
+    elif choice.isdigit() and int(choice) < len(options):
+        address = options[int(choice)]
+    else:
+        address = None
+    if address is None:
+        await callback.message.answer(
+            "Подсказка устарела, введите адрес в формате \U00002757 Город, "
+            "Улица, Дом \U00002757:",
+            reply_markup=get_cancel())
+    return address
+
+
+async def save_address(state: FSMContext, address: str) -> None:
+    """Сохраняет адрес заявки и убирает из черновика подсказки."""
+    user_data = await state.get_data()
+    user_data.pop('address_typed', None)
+    user_data.pop('address_options', None)
+    user_data['address'] = address
+    await state.set_data(user_data)
+
+
 ##############################################################################
 ####################### Машина состояний заявка ##############################
 ##############################################################################
 
 @dp.message_handler(commands=['kgm_request'])
-@dp.callback_query_handler(lambda callback: callback.data == "kgm_request")
+@router.callback_query_handler(data="kgm_request")
 async def start_kgm_request(message: types.Message | types.CallbackQuery):
     """Начало процесса подачи заявки на вывоз отходов."""
     # Определяем источник (сообщение или callback)
     if isinstance(message, types.Message):
         # Обработчик для команды /kgm_request
         user_id = message.from_user.id
-        if is_user_registered(database_path, user_id):
+        if await DATABASE.is_user_registered(user_id):
             await message.answer(
                 text="Начнем! \nОтветным сообщением направляйте"
                      " мне нужную "
@@ -273,7 +475,7 @@ async def start_kgm_request(message: types.Message | types.CallbackQuery):
     elif isinstance(message, types.CallbackQuery):
         # Обработчик для callback
         user_id = message.from_user.id
-        if is_user_registered(database_path, user_id):
+        if await DATABASE.is_user_registered(user_id):
             await message.message.answer(
                 text="Начнем! \U0001F60E \nОтветным сообщением направляйте"
                      " мне нужную "
@@ -316,9 +518,8 @@ async def get_management_company(message: types.Message, state: FSMContext):
     await KGMPickupStates.waiting_for_district.set()
 
 
-@dp.callback_query_handler(
-    lambda callback: callback.data.startswith("district:"),
-    state=KGMPickupStates.waiting_for_district)
+@router.callback_query_handler(
+    prefix="district", state=KGMPickupStates.waiting_for_district)
 async def get_district(callback_query: types.CallbackQuery, state: FSMContext):
     district = callback_query.data.split(":")[1]
     await state.update_data(district=district)
@@ -332,8 +533,14 @@ async def get_district(callback_query: types.CallbackQuery, state: FSMContext):
 
 @dp.message_handler(lambda message: len(message.text) < 10,
                     state=KGMPickupStates.waiting_for_address)
-async def kgm_check_address(message: types.Message) -> None:
+async def kgm_check_address(message: types.Message,
+                            state: FSMContext) -> None:
     """Проверяет адрес введенный пользователем на количество символов."""
+    # По началу адреса можно выбрать полный адрес из прошлых заявок
+    user_data = await state.get_data()
+    if await offer_addresses(message, state, user_data.get('district'),
+                             allow_typed=False):
+        return
     await message.answer(
         'Введите правильный адрес в формате \n \U00002757 Город, Улица,'
         ' Дом \U00002757 \nЭто чрезвычайно важно для корректной '
@@ -343,15 +550,32 @@ async def kgm_check_address(message: types.Message) -> None:
 
 @dp.message_handler(state=KGMPickupStates.waiting_for_address)
 async def get_address(message: types.Message, state: FSMContext):
-    await state.update_data(address=message.text)
+    user_data = await state.get_data()
+    if await offer_addresses(message, state, user_data.get('district')):
+        return
+    await kgm_address_chosen(message, state, message.text)
+
+
+@router.callback_query_handler(
+    prefix="address", state=KGMPickupStates.waiting_for_address)
+async def kgm_address_suggested(callback_query: types.CallbackQuery,
+                                state: FSMContext):
+    address = await suggested_address(callback_query, state)
+    if address is not None:
+        await kgm_address_chosen(callback_query.message, state, address)
+    await callback_query.answer()
+
+
+async def kgm_address_chosen(message: types.Message, state: FSMContext,
+                             address: str) -> None:
+    await save_address(state, address)
     await message.answer("4/6 Выберите тип отходов:",
                          reply_markup=get_waste_type_keyboard(waste_types))
     await KGMPickupStates.waiting_for_waste_type.set()
 
 
-@dp.callback_query_handler(
-    lambda callback: callback.data.startswith("waste_type:"),
-    state=KGMPickupStates.waiting_for_waste_type)
+@router.callback_query_handler(
+    prefix="waste_type", state=KGMPickupStates.waiting_for_waste_type)
 async def get_waste_type(callback_query: types.CallbackQuery,
                          state: FSMContext):
     waste_type = callback_query.data.split(":")[1]
@@ -379,119 +603,42 @@ async def get_comment(message: types.Message, state: FSMContext):
 async def get_photo(message: types.Message, state: FSMContext):
     photo_file_id = message.photo[
         -1].file_id  # Получаем file_id для сохранения в БД
-    await state.update_data(photo=photo_file_id)
+    # file_unique_id нужен, чтобы не загружать повторное фото заново
+    await state.update_data(photo=photo_file_id,
+                            photo_unique_id=message.photo[-1].file_unique_id)
     await state.update_data(username=message.from_user.username)
 
     # Получаем все данные, которые собрали, для подтверждения
     user_data = await state.get_data()
-    confirmation_text = (
-        f"Проверьте введенные данные:\n"
-        f"\U000026A0 Район: {user_data['district']}\n"
-        f"\U00002764 Управляющая компания: {user_data['management_company']}\n"
-        f"\U00002757 Адрес дома: {user_data['address']}\n"
-        f"\U0001F5D1 Тип отходов: {user_data['waste_type']}\n\n"
-        f"\U0001F5E8 Комментарий: {user_data['comment']}\n\n"
-        "Если все верно, нажмите 'Подтвердить'."
-    )
-    confirmation_keyboard = InlineKeyboardMarkup()
-    confirmation_keyboard.add(
-        InlineKeyboardButton(text="Подтвердить",
-                             callback_data="confirm_data")).add(
-        InlineKeyboardButton(text="Отмена", callback_data="cancel"))
-    await message.answer_photo(photo=photo_file_id, caption=confirmation_text,
-                               reply_markup=confirmation_keyboard)
+    await message.answer_photo(photo=photo_file_id,
+                               caption=KGM_CONFIRMATION.render(user_data),
+                               reply_markup=await get_confirmation_keyboard())
     await KGMPickupStates.waiting_for_confirmation.set()
 
 
-@dp.callback_query_handler(lambda callback: callback.data == "confirm_data",
-                           state=KGMPickupStates.waiting_for_confirmation)
+@router.callback_query_handler(
+    data="confirm_data", state=KGMPickupStates.waiting_for_confirmation)
 async def confirm_data(callback_query: types.CallbackQuery, state: FSMContext):
     user_data = await state.get_data()
     user_id = callback_query.from_user.id
-    # Логика сохранения заявки в базу данных здесь
+    # Сохраняем заявку в outbox, остальное сделают фоновые воркеры
+    await enqueue_request('kgm', user_id, user_data)
     await callback_query.message.answer(
         "Спасибо! Ваша заявка принята \U0001F9D9",
         reply_markup=get_main_menu())
     await state.finish()
     await callback_query.answer()
-    # Пересылаем заявку в группу
-    forward_text = (
-        f"Получена заявка на вывоз КГМ:\n"
-        f"\U000026A0 Район: {user_data['district']}\n"
-        f"\U00002764 Управляющая компания: {user_data['management_company']}\n"
-        f"\U00002757 Адрес дома: {user_data['address']}\n"
-        f"\U0001F5D1 Тип отходов: {user_data['waste_type']}\n\n"
-        f"\U0001F5E8 Комментарий: {user_data['comment']}\n\n"
-    )
-
-    try:
-        await bot.send_photo(chat_id=GROUP_ID, photo=user_data['photo'],
-                             caption=forward_text)
-    except Exception as error:
-        logging.error(f"Ошибка при пересылке: {error}")
-        await bot.send_message(DEV_TG_ID,
-                               f"Произошла {error} ошибка при загрузке фото. Смотри логи.")
-
-    # Сохраняем фото на ЯДиск
-    link_ya_disk = False
-    try:
-        downloaded_file = await download_photo(user_data['photo'], bot)
-        link_ya_disk = upload_and_get_link(YANDEX_CLIENT, downloaded_file,
-                                           YA_DISK_FOLDER)
-    except Exception as e:
-        logging.error(f"Ошибка при загрузке файла на Яндекс.Диск: {e}")
-        await bot.send_message(DEV_TG_ID,
-                               "Произошла ошибка при загрузке фото. Смотри логи.")
-    # Получаем информацию о пользователе из базы данных
-    user_info = get_user_by_id(user_id, database_path)
-    # Получаем имя тех зоны
-    coast = get_coast_name(districts_tz, user_data['district'])
-    # Сохраняем заявку в ГТаблицу
-    g_data = [
-        (datetime.now() + timedelta(hours=TIMEDELTA)).strftime(
-            "%Y-%m-%d %H:%M:%S"),
-        'Телеграмм БОТ',
-        user_info['full_name'],
-        user_info['phone_number'],
-        user_data['management_company'],
-        user_data['address'],
-        user_data['district'],
-        user_data['waste_type'],
-        user_data['comment']
-    ]
-    if link_ya_disk:
-        g_data.append(link_ya_disk)
-    g_data.append(user_data['username'])
-    # Сохраняем в базу данных заявку
-    try:
-        save_kgm_request(database_path, *g_data[2:])
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении заявки в БД: {e}")
-        lost_data = ' '.join(g_data)
-        await bot.send_message(DEV_TG_ID,
-                               "Произошла ошибка при сохранении заявки в БД. "
-                               "Смотри логи." + lost_data)
-    try:
-        upload_information_to_gsheets(GOOGLE_CLIENT, GOOGLE_SHEET_NAME[coast],
-                                      g_data)
-    except Exception as e:
-        logging.error(f"Ошибка при загрузке файла на Гугл.Диск: {e}")
-        lost_data = ' '.join(g_data)
-        await bot.send_message(DEV_TG_ID,
-                               "Произошла ошибка при загрузке на GD. "
-                               "Смотри логи." + lost_data)
 
 
 ##############################################################################
 ####################### Машина состояний жалоба ##############################
 ################################################################################
 
-@dp.callback_query_handler(
-    lambda callback: callback.data == "quality_complaint", state="*")
+@router.callback_query_handler(data="quality_complaint", state="*")
 async def start_complaint_process(callback: types.CallbackQuery,
                                   state: FSMContext):
     user_id = callback.from_user.id
-    if is_user_registered(database_path, user_id):
+    if await DATABASE.is_user_registered(user_id):
         await callback.message.answer(
             text="Начнем! \nОтветным сообщением направляйте"
                  " мне нужную "
@@ -514,7 +661,7 @@ async def start_complaint_process(callback: types.CallbackQuery,
     await callback.answer()
 
 
-@dp.callback_query_handler(state=ComplaintFSM.waiting_complaint_type)
+@router.callback_query_handler(state=ComplaintFSM.waiting_complaint_type)
 async def complaint_type_chosen(callback: types.CallbackQuery,
                                 state: FSMContext):
     await state.update_data(complaint_type=callback.data)
@@ -531,7 +678,7 @@ async def complaint_type_chosen(callback: types.CallbackQuery,
         await callback.answer()
 
 
-@dp.callback_query_handler(state=ComplaintFSM.waiting_trouble)
+@router.callback_query_handler(state=ComplaintFSM.waiting_trouble)
 async def trouble_chosen(callback: types.CallbackQuery, state: FSMContext):
     if callback.data == "today":
         await callback.message.answer(today_sanpin,
@@ -550,8 +697,11 @@ async def trouble_chosen(callback: types.CallbackQuery, state: FSMContext):
 
 @dp.message_handler(lambda message: len(message.text) < 10,
                     state=ComplaintFSM.waiting_address)
-async def check_address(message: types.Message) -> None:
+async def check_address(message: types.Message, state: FSMContext) -> None:
     """Проверяет адрес введенный пользователем на количество символов."""
+    # Район обращения ещё не выбран, поэтому ищем по всем районам
+    if await offer_addresses(message, state, allow_typed=False):
+        return
     await message.answer(
         'Введите правильный адрес в формате \n \U00002757 Город, Улица,'
         ' Дом \U00002757 \nЭто чрезвычайно важно для корректной '
@@ -560,8 +710,25 @@ async def check_address(message: types.Message) -> None:
 
 
 @dp.message_handler(state=ComplaintFSM.waiting_address)
-async def trouble_chosen(message: types.Message, state: FSMContext):
-    await state.update_data(address=message.text)
+async def complaint_address_entered(message: types.Message, state: FSMContext):
+    if await offer_addresses(message, state):
+        return
+    await complaint_address_chosen(message, state, message.text)
+
+
+@router.callback_query_handler(prefix="address",
+                               state=ComplaintFSM.waiting_address)
+async def complaint_address_suggested(callback: types.CallbackQuery,
+                                      state: FSMContext):
+    address = await suggested_address(callback, state)
+    if address is not None:
+        await complaint_address_chosen(callback.message, state, address)
+    await callback.answer()
+
+
+async def complaint_address_chosen(message: types.Message, state: FSMContext,
+                                   address: str) -> None:
+    await save_address(state, address)
     await message.answer(
         "4/8 Введите название управляющей компании (УК, ТСЖ, ТСН)",
         reply_markup=get_cancel())
@@ -586,7 +753,7 @@ async def management_company_chosen(message: types.Message, state: FSMContext):
     await ComplaintFSM.waiting_for_district.set()
 
 
-@dp.callback_query_handler(state=ComplaintFSM.waiting_for_district)
+@router.callback_query_handler(state=ComplaintFSM.waiting_for_district)
 async def address_entered(callback: types.CallbackQuery, state: FSMContext):
     await state.update_data(district=callback.data.split(":")[1])
     await callback.message.answer("6/8 Отправьте фото с фиксацией проблемы",
@@ -598,7 +765,8 @@ async def address_entered(callback: types.CallbackQuery, state: FSMContext):
 @dp.message_handler(content_types=types.ContentType.PHOTO,
                     state=ComplaintFSM.waiting_photo)
 async def photo_uploaded(message: types.Message, state: FSMContext):
-    await state.update_data(photo=message.photo[-1].file_id)
+    await state.update_data(photo=message.photo[-1].file_id,
+                            photo_unique_id=message.photo[-1].file_unique_id)
     await message.answer("7/8 Добавьте комментарий с описанием проблемы",
                          reply_markup=await get_no_comment_keyboard())
     await ComplaintFSM.waiting_comment.set()
@@ -608,30 +776,26 @@ async def photo_uploaded(message: types.Message, state: FSMContext):
 @dp.message_handler(state=ComplaintFSM.waiting_comment)
 async def comment_entered(message: types.Message, state: FSMContext):
     await state.update_data(comment=message.text)
-    keyboard = await get_contact_method_keyboard()
-    if '@' in message.from_user.mention:
-        keyboard.inline_keyboard.insert(1, [InlineKeyboardButton("Телеграм",
-                                                                 callback_data="Телеграм")])
+    keyboard = await get_contact_method_keyboard(
+        with_telegram='@' in message.from_user.mention)
     await message.answer("8/8 Выберете способ обратной связи",
                          reply_markup=keyboard)
     await ComplaintFSM.waiting_contact_method.set()
 
 
 # Обработка комментария по кнопке
-@dp.callback_query_handler(state=ComplaintFSM.waiting_comment)
+@router.callback_query_handler(state=ComplaintFSM.waiting_comment)
 async def comment_clicked(callback: types.CallbackQuery, state: FSMContext):
     await state.update_data(comment=callback.data)
-    keyboard = await get_contact_method_keyboard()
-    if '@' in callback.from_user.mention:
-        keyboard.inline_keyboard.insert(1, [InlineKeyboardButton("Телеграм",
-                                                                callback_data="Телеграм")])
+    keyboard = await get_contact_method_keyboard(
+        with_telegram='@' in callback.from_user.mention)
     await callback.message.answer("8/8 Выберете способ обратной связи",
                                   reply_markup=keyboard)
     await ComplaintFSM.waiting_contact_method.set()
     await callback.answer()
 
 
-@dp.callback_query_handler(state=ComplaintFSM.waiting_contact_method)
+@router.callback_query_handler(state=ComplaintFSM.waiting_contact_method)
 async def contact_method_chosen(callback: types.CallbackQuery,
                                 state: FSMContext):
     if callback.data == "email":
@@ -643,17 +807,7 @@ async def contact_method_chosen(callback: types.CallbackQuery,
         await state.update_data(contact_method=callback.data)
         user_data = await state.get_data()
         photo_file_id = user_data.get('photo', 'photo missed')
-        confirmation_text = (
-            f"Проверьте введенные данные:\n"
-            f"\U0001F5D1 Тип обращения: {user_data.get('complaint_type', 'Не указано')}\n"
-            f"\U00002b50 Суть обращения: {user_data.get('trouble', 'Не указано')}\n"
-            f"\U000026A0 Район: {user_data.get('district', 'Не указан')}\n"
-            f"\U00002764 Управляющая компания: {user_data.get('management_company', 'Не указана')}\n"
-            f"\U00002757 Адрес дома: {user_data.get('address', 'Не указан')}\n"
-            f"\U0001F5E8 Комментарий: {user_data.get('comment', 'Отсутствует')}\n"
-            f"\U00002712 Способ обратной связи: {user_data.get('contact_method', 'Не выбран')}\n\n"
-            "Если все верно, нажмите 'Подтвердить'."
-        )
+        confirmation_text = COMPLAINT_CONFIRMATION.render(user_data)
         keyboard = await get_confirmation_keyboard()
 
         await callback.message.answer_photo(photo=photo_file_id,
@@ -670,23 +824,10 @@ async def email_entered(message: types.Message, state: FSMContext):
         await state.update_data(email=email)
         user_data = await state.get_data()
         photo_file_id = user_data.get('photo', 'photo missed')
-        confirmation_text = (
-            f"Проверьте введенные данные:\n"
-            f"\U0001F5D1 Тип обращения: {user_data.get('complaint_type', 'Не указано')}\n"
-            f"\U00002b50 Суть обращения: {user_data.get('trouble', 'Не указано')}\n"
-            f"\U000026A0 Район: {user_data.get('district', 'Не указан')}\n"
-            f"\U00002764 Управляющая компания: {user_data.get('management_company', 'Не указана')}\n"
-            f"\U00002757 Адрес дома: {user_data.get('address', 'Не указан')}\n"
-            f"\U0001F5E8 Комментарий: {user_data.get('comment', 'Отсутствует')}\n"
-            f"\U00002712 Способ обратной связи: "
-            f"{user_data.get('contact_method', 'Не выбран')}: {user_data.get('email', 'email не выбран')} \n\n"
-            "Если все верно, нажмите 'Подтвердить'."
-        )
-        keyboard = await get_confirmation_keyboard()
+        confirmation_text = COMPLAINT_EMAIL_CONFIRMATION.render(user_data)
         print(message.from_user.mention)
-        if '@' in message.from_user.mention:
-            keyboard.add(
-                InlineKeyboardButton("Телеграм", callback_data="Телеграм"))
+        keyboard = await get_confirmation_keyboard(
+            with_telegram='@' in message.from_user.mention)
 
         await message.answer_photo(photo=photo_file_id,
                                    caption=confirmation_text,
@@ -698,57 +839,157 @@ async def email_entered(message: types.Message, state: FSMContext):
             reply_markup=await get_cancel_keyboard())
 
 
-@dp.callback_query_handler(lambda callback: callback.data == "confirm_data",
-                           state=ComplaintFSM.waiting_for_confirmation)
-async def confirm_data(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query_handler(
+    data="confirm_data", state=ComplaintFSM.waiting_for_confirmation)
+async def confirm_complaint_data(callback: types.CallbackQuery,
+                                 state: FSMContext):
     user_data = await state.get_data()
     user_id = callback.from_user.id
-    # Логика сохранения заявки в базу данных здесь
+    # Сохраняем обращение в outbox, остальное сделают фоновые воркеры
+    await enqueue_request('complaint', user_id, user_data)
     await callback.message.answer(
         "Спасибо! Ваша заявка принята \U0001F9D9",
         reply_markup=get_main_menu())
     await state.finish()
     await callback.answer()
 
-    forward_text = (
-        f"Ботом получено обращение:\n"
-        f"\U0001F5D1 Тип обращения: {user_data.get('complaint_type', 'Не указано')}\n"
-        f"\U00002b50 Суть обращения: {user_data.get('trouble', 'Не указано')}\n"
-        f"\U000026A0 Район: {user_data.get('district', 'Не указан')}\n"
-        f"\U00002764 Управляющая компания: {user_data.get('management_company', 'Не указана')}\n"
-        f"\U00002757 Адрес дома: {user_data.get('address', 'Не указан')}\n"
-        f"\U0001F5E8 Комментарий: {user_data.get('comment', 'Отсутствует')}\n"
-        f"\U00002712 Способ обратной связи: "
-        f"{user_data.get('contact_method', 'Не выбран')}"
-    )
-    # Пересылаем обращение в группу сотрудников
-    try:
-        await bot.send_photo(chat_id=GROUP_ID, photo=user_data['photo'],
-                             caption=forward_text)
-    except Exception as error:
-        logging.error(f"Ошибка при пересылке: {error}")
-        await bot.send_message(DEV_TG_ID,
-                               f"Произошла {error} ошибка при загрузке фото. Смотри логи.")
-
-    # Сохраняем фото на ЯДиск
-    link_ya_disk = False
+
+##############################################################################
+################ Фоновая обработка подтвержденных заявок #####################
+##############################################################################
+
+async def enqueue_request(kind: str, user_id: int, user_data: dict) -> None:
+    """Сохраняет подтвержденную заявку в outbox."""
+    payload = {
+        'user_id': user_id,
+        'received_at': (datetime.now() + timedelta(hours=TIMEDELTA)).strftime(
+            "%Y-%m-%d %H:%M:%S"),
+        'user_data': user_data,
+    }
     try:
-        downloaded_file = await download_photo(user_data['photo'], bot)
-        link_ya_disk = upload_and_get_link(YANDEX_CLIENT, downloaded_file,
-                                           YA_DISK_FOLDER_COMPLAINTS)
+        await OUTBOX.enqueue(kind, payload)
     except Exception as e:
-        logging.error(f"Ошибка при загрузке файла на Яндекс.Диск: {e}")
-        await bot.send_message(DEV_TG_ID,
-                               "Произошла ошибка при загрузке фото. Смотри логи.")
+        logging.error(f"Ошибка при сохранении заявки в outbox: {e}")
+        lost_data = ' '.join(str(value) for value in user_data.values())
+        await alert_dev('outbox_enqueue',
+                        "Произошла ошибка при сохранении заявки в "
+                        "outbox. Смотри логи." + lost_data)
+
+
+async def notify_outbox_failure(job: Job, step: Step, error: Exception) -> None:
+    """Сообщает разработчику об исчерпании попыток шага outbox."""
+    lost_data = ' '.join(str(value) for value in job.payload['user_data'].values())
+    await alert_dev(f'{job.kind}_{step.name}',
+                    f"Произошла {error} ошибка на шаге {step.name} "
+                    f"заявки {job.id}. Смотри логи." + lost_data)
+
+
+# Сообщение длиннее 4096 символов Telegram не примет
+MESSAGE_TEXT_LIMIT = 3500
+
+
+async def notify_sheet_failure(sheet_name: str, rows: list,
+                               error: Exception) -> None:
+    """Сообщает разработчику о строках, не записанных в Google Таблицу."""
+    lost_data = '\n'.join(' '.join(str(value) for value in row)
+                          for row in rows)
+    await alert_dev('gsheets',
+                    f"Произошла {error} ошибка при записи в таблицу "
+                    f"{sheet_name}, строки удалены из очереди. Смотри "
+                    f"логи.\n" + lost_data[:MESSAGE_TEXT_LIMIT])
+
+
+async def archive_photo(payload: dict, disk_folder: str, kind: str) -> None:
+    """
+    Загружает фото заявки на Яндекс.Диск и запоминает ссылку.
+
+    Заявка к этому времени уже сохранена в БД, поэтому ссылка
+    дописывается в неё.
+    """
+    user_data = payload['user_data']
+    payload['photo_link'] = await PHOTO_ARCHIVER.archive(
+        user_data['photo'], disk_folder, user_data.get('photo_unique_id'))
+    await DATABASE.set_photo_link(kind, payload['job_id'],
+                                  payload['photo_link'])
+
+
+async def kgm_forward(payload: dict) -> None:
+    """Пересылает заявку в группу."""
+    user_data = payload['user_data']
+    await GROUP_FORWARDER.send_photo(GROUP_ID, user_data['photo'],
+                                     KGM_FORWARD.render(user_data))
+
+
+async def kgm_send_email(payload: dict) -> None:
+    """Отправляет заявку на почту, если это включено в настройках."""
+    if EMAIL_FORWARD and TARGET_EMAIL:
+        await MAILER.send(KGM_FORWARD.render(payload['user_data']),
+                          TARGET_EMAIL)
+
+
+async def kgm_archive_photo(payload: dict) -> None:
+    await archive_photo(payload, YA_DISK_FOLDER, 'kgm')
+
+
+async def kgm_row(payload: dict) -> list:
+    """Формирует строку заявки для БД и Google Таблицы."""
+    user_data = payload['user_data']
     # Получаем информацию о пользователе из базы данных
-    user_info = get_user_by_id(user_id, database_path)
+    user_info = await DATABASE.get_user_by_id(payload['user_id'])
+    return [
+        payload['received_at'],
+        'Телеграмм БОТ',
+        user_info['full_name'],
+        user_info['phone_number'],
+        user_data['management_company'],
+        user_data['address'],
+        user_data['district'],
+        user_data['waste_type'],
+        user_data['comment'],
+        payload.get('photo_link', ''),
+        user_data['username'],
+    ]
+
+
+async def kgm_save_to_db(payload: dict) -> None:
+    g_data = await kgm_row(payload)
+    await DATABASE.save_kgm_request(*g_data[2:], payload['job_id'])
+
+
+async def kgm_upload_to_gsheets(payload: dict) -> None:
+    g_data = await kgm_row(payload)
     # Получаем имя тех зоны
-    coast = get_coast_name(districts_tz, user_data['district'])
+    coast = get_coast_name(districts_tz, payload['user_data']['district'])
+    await SHEET_WRITER.append_row(GOOGLE_SHEET_NAME[coast], g_data)
 
-    # Сохраняем заявку в ГТаблицу
-    g_data = [
-        (datetime.now() + timedelta(hours=TIMEDELTA)).strftime(
-            "%Y-%m-%d %H:%M:%S"),
+
+async def complaint_forward(payload: dict) -> None:
+    """Пересылает обращение в группу сотрудников."""
+    user_data = payload['user_data']
+    await GROUP_FORWARDER.send_photo(GROUP_ID, user_data['photo'],
+                                     COMPLAINT_FORWARD.render(user_data))
+
+
+async def complaint_send_email(payload: dict) -> None:
+    """Отправляет обращение на почту, если это включено в настройках."""
+    if EMAIL_FORWARD and TARGET_EMAIL:
+        await MAILER.send(COMPLAINT_FORWARD.render(payload['user_data']),
+                          TARGET_EMAIL)
+
+
+async def complaint_archive_photo(payload: dict) -> None:
+    await archive_photo(payload, YA_DISK_FOLDER_COMPLAINTS, 'complaint')
+
+
+async def complaint_row(payload: dict) -> list:
+    """Формирует строку обращения для БД и Google Таблицы."""
+    user_data = payload['user_data']
+    # Получаем информацию о пользователе из базы данных
+    user_info = await DATABASE.get_user_by_id(payload['user_id'])
+    # Получаем имя тех зоны
+    coast = get_coast_name(districts_tz, user_data['district'])
+    return [
+        payload['received_at'],
         coast,
         'Телеграмм БОТ',
         user_info.get('full_name', 'Не указан'),
@@ -760,33 +1001,41 @@ async def confirm_data(callback: types.CallbackQuery, state: FSMContext):
         user_data.get('trouble', 'Не указано'),
         user_data.get('comment', 'Нет комментария'),
         user_data.get('contact_method', 'Не указан'),
-        user_data.get('email', 'Не указан')  # email перед photo_link
+        user_data.get('email', 'Не указан'),  # email перед photo_link
+        payload.get('photo_link', ''),
+        user_info.get('username', 'Не указан'),
     ]
 
-    if link_ya_disk:
-        g_data.append(link_ya_disk)  # Добавляем фото, если есть
 
-    g_data.append(user_info.get('username', 'Не указан'))
+async def complaint_save_to_db(payload: dict) -> None:
+    g_data = await complaint_row(payload)
+    await DATABASE.save_quality_complaint(*g_data[3:], payload['job_id'])
+
+
+async def complaint_upload_to_gsheets(payload: dict) -> None:
+    g_data = await complaint_row(payload)
+    await SHEET_WRITER.append_row(GOOGLE_SHEET_COMPLAINT_NAME, g_data)
 
-    # Сохраняем в базу данных жалобу
-    try:
-        save_quality_complaint(database_path, *g_data[3:])
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении жалобы в БД: {e}")
-        lost_data = ' '.join(g_data)
-        await bot.send_message(DEV_TG_ID,
-                               "Произошла ошибка при сохранении жалобы в БД. "
-                               "Смотри логи." + lost_data)
-    try:
-        upload_information_to_gsheets(GOOGLE_CLIENT,
-                                      GOOGLE_SHEET_COMPLAINT_NAME,
-                                      g_data)
-    except Exception as e:
-        logging.error(f"Ошибка при загрузке файла на Гугл.Диск: {e}")
-        lost_data = ' '.join(g_data)
-        await bot.send_message(DEV_TG_ID,
-                               "Произошла ошибка при загрузке на GD. "
-                               "Смотри логи." + lost_data)
+
+# Заявка сохраняется в БД первой: сбои Telegram и Яндекс.Диска не
+# задерживают её сохранение. Ссылка на фото дописывается в БД шагом
+# photo, а пересылка и фото при исчерпании попыток пропускаются.
+OUTBOX.register('kgm', [
+    Step('database', kgm_save_to_db),
+    Step('forward', kgm_forward, optional=True),
+    Step('photo', kgm_archive_photo, optional=True),
+    Step('gsheets', kgm_upload_to_gsheets),
+    Step('email', kgm_send_email, optional=True),
+])
+OUTBOX.register('complaint', [
+    Step('database', complaint_save_to_db),
+    Step('forward', complaint_forward, optional=True),
+    Step('photo', complaint_archive_photo, optional=True),
+    Step('gsheets', complaint_upload_to_gsheets),
+    Step('email', complaint_send_email, optional=True),
+])
+OUTBOX.on_failure = notify_outbox_failure
+SHEET_WRITER.on_failure = notify_sheet_failure
 
 
 ##############################################################################
@@ -804,5 +1053,86 @@ async def random_text_message_answer(message: types.Message) -> None:
     await message.reply(text=text, reply_markup=get_main_menu())
 
 
+async def warm_up_backends() -> None:
+    """Заранее подключается к внешним сервисам."""
+    sheet_names = [name for name in (*GOOGLE_SHEET_NAME.values(),
+                                     GOOGLE_SHEET_COMPLAINT_NAME) if name]
+    backends = {
+        'google': lambda: SHEET_WRITER.warm_up(sheet_names),
+        'yandex': YANDEX_UPLOADER.warm_up,
+    }
+    if EMAIL_FORWARD and TARGET_EMAIL:
+        backends['smtp'] = MAILER.warm_up
+    await warm_up(backends, WARM_UP_TIMEOUT)
+
+
+warm_up_task: asyncio.Task | None = None
+
+
+async def on_startup(dispatcher: Dispatcher) -> None:
+    """Открывает базу данных и запускает фоновые сервисы."""
+    global warm_up_task
+    started = time.monotonic()
+    await DATABASE.open()
+    drafts = await storage.load(shard_index(), max(SHARD_WORKERS, 1))
+    logger.info("Загружено незаконченных заявок: %s", drafts)
+    loaded = await DATABASE.warm_user_cache()
+    logger.info("Кэш пользователей прогрет: %s профилей", loaded)
+    # Индекс строится до запуска outbox: дальше его пополняют
+    # сохранённые заявки
+    addresses = await DATABASE.read(load_address_index, ADDRESS_INDEX)
+    logger.info("Индекс адресов построен: %s адресов", addresses)
+    MAILER.start()
+    OUTBOX.start()
+    if shard_index() == 0:
+        # Очередь строк и журнал Excel общие для всех процессов,
+        # поэтому их пишет один процесс
+        SHEET_WRITER.start()
+        EXCEL_JOURNAL.start()
+    if METRICS_PORT:
+        # У каждого процесса-обработчика свой порт метрик
+        await METRICS.start(METRICS_HOST,
+                            METRICS_PORT + shard_index())
+    if WARM_UP_BACKENDS:
+        # Внешние сервисы прогреваются в фоне: меню работает и без них
+        warm_up_task = asyncio.create_task(warm_up_backends())
+    now = time.monotonic()
+    logger.info("Бот запущен за %.2f с (on_startup %.2f с)",
+                now - STARTED_AT, now - started)
+
+
+async def on_shutdown(dispatcher: Dispatcher) -> None:
+    """Останавливает фоновые сервисы и закрывает соединения."""
+    logger.info("Статистика кэша пользователей: %s", USER_CACHE.stats())
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+    await METRICS.stop()
+    await OUTBOX.stop()
+    await GROUP_FORWARDER.close()
+    await EXCEL_JOURNAL.stop()
+    await MAILER.stop()
+    await SHEET_WRITER.close()
+    await YANDEX_UPLOADER.close()
+    await storage.close()
+    await DATABASE.close()
+    EXECUTOR.shutdown()
+
+
 if __name__ == '__main__':
-    executor.start_polling(dp, skip_updates=True)
+    if SHARD_WORKERS > 1:
+        webhook = None
+        if BOT_MODE == 'webhook':
+            webhook = {'url': WEBHOOK_HOST + WEBHOOK_PATH,
+                       'path': WEBHOOK_PATH, 'secret': WEBHOOK_SECRET,
+                       'host': WEBAPP_HOST, 'port': WEBAPP_PORT}
+        run_sharded(dp, SHARD_WORKERS, process_backlog=PROCESS_BACKLOG,
+                    webhook=webhook, on_startup=on_startup,
+                    on_shutdown=on_shutdown)
+    elif BOT_MODE == 'webhook':
+        run_webhook(dp, WEBHOOK_HOST + WEBHOOK_PATH, WEBHOOK_PATH,
+                    WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+                    process_backlog=PROCESS_BACKLOG, on_startup=on_startup,
+                    on_shutdown=on_shutdown)
+    else:
+        executor.start_polling(dp, skip_updates=not PROCESS_BACKLOG,
+                               on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,188 @@
+"""
+Метрики бота в формате Prometheus.
+
+Гистограммы задержек обработчиков aiogram и внешних вызовов, счётчики
+обновлений по типу и состоянию FSM и счётчик ошибок, о которых бот
+сообщает разработчику. Метрики отдаются aiohttp-сервером на /metrics.
+"""
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                   10, 30, 60)
+
+
+def _escape(value) -> str:
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Счётчик с метками."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels.get(name, '') for name in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} counter']
+        for key, value in self._values.items():
+            lines.append(
+                f'{self.name}{_format_labels(self.labels, key)} {value}')
+        return lines
+
+
+class Histogram:
+    """Гистограмма с метками и фиксированными границами корзин."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счётчики корзин, сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(name, '') for name in self.labels)
+        item = self._values.get(key)
+        if item is None:
+            item = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            item[0][index] += 1
+        item[1] += value
+        item[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Замеряет время выполнения блока."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса."""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: list[Callable[[], list[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], list[str]]) -> None:
+        """Добавляет функцию, которая возвращает готовые строки метрик."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error(f"Ошибка при сборе метрик: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.register(Histogram(
+    'bot_handler_duration_seconds',
+    'Время работы обработчиков aiogram', ('handler',)))
+BACKEND_LATENCY = REGISTRY.register(Histogram(
+    'bot_backend_duration_seconds',
+    'Время внешних вызовов', ('backend', 'operation')))
+UPDATES = REGISTRY.register(Counter(
+    'bot_updates_total', 'Полученные обновления по типу и состоянию FSM',
+    ('type', 'state')))
+BOT_API_QUEUE_WAIT = REGISTRY.register(Histogram(
+    'bot_api_queue_wait_seconds',
+    'Ожидание исходящих запросов Bot API в очереди ограничителя',
+    ('method', 'scope')))
+BOT_API_RETRY_AFTER = REGISTRY.register(Counter(
+    'bot_api_retry_after_total', 'Ответы 429 Too Many Requests от Bot API',
+    ('method',)))
+THROTTLED = REGISTRY.register(Counter(
+    'bot_throttled_updates_total',
+    'Обновления, отброшенные или задержанные антифлудом', ('action',)))
+ERRORS = REGISTRY.register(Counter(
+    'bot_errors_total', 'Ошибки, о которых сообщено разработчику',
+    ('source',)))
+
+
+def gauge_lines(name: str, documentation: str, values: dict) -> list[str]:
+    """Формирует строки метрики-датчика из словаря {метка: значение}."""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} gauge']
+    for label, value in values.items():
+        lines.append(f'{name}{{key="{_escape(label)}"}} {value}')
+    return lines
+
+
+class MetricsServer:
+    """aiohttp-сервер, отдающий метрики на /metrics."""
+
+    def __init__(self, registry: Registry = REGISTRY):
+        self.registry = registry
+        self._runner: web.AppRunner | None = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(),
+                            content_type='text/plain', charset='utf-8')
+
+    async def start(self, host: str, port: int) -> None:
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
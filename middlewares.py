@@ -0,0 +1,187 @@
+"""Middleware диспетчера aiogram."""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.handler import CancelHandler, current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from metrics import HANDLER_LATENCY, THROTTLED, UPDATES
+from router import ROUTED_HANDLER
+
+
+logger = logging.getLogger(__name__)
+
+UPDATE_TYPES = ('message', 'edited_message', 'callback_query',
+                'inline_query', 'my_chat_member', 'chat_member')
+
+
+def update_address(update: types.Update) -> tuple[int | None, int | None]:
+    """Возвращает (chat_id, user_id) обновления."""
+    if update.message:
+        return update.message.chat.id, update.message.from_user.id
+    if update.callback_query:
+        message = update.callback_query.message
+        return (message.chat.id if message else None,
+                update.callback_query.from_user.id)
+    return None, None
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Считает обновления и замеряет время работы обработчиков."""
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        update_type = next((key for key in UPDATE_TYPES
+                            if getattr(update, key, None)), 'other')
+        chat_id, user_id = update_address(update)
+        state = None
+        if user_id is not None:
+            state = await Dispatcher.get_current().storage.get_state(
+                chat=chat_id, user=user_id)
+        UPDATES.inc(type=update_type, state=state or 'none')
+
+    async def _start(self, data: dict) -> None:
+        handler = current_handler.get()
+        data['_metrics_handler'] = (getattr(handler, '__name__', 'unknown'),
+                                    time.perf_counter())
+
+    async def _finish(self, data: dict) -> None:
+        started = data.pop('_metrics_handler', None)
+        if started is not None:
+            name, start = started
+            # Нажатия кнопок выбирает CallbackRouter
+            handler = data.get(ROUTED_HANDLER)
+            if handler is not None:
+                name = handler.__name__
+            HANDLER_LATENCY.observe(time.perf_counter() - start, handler=name)
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        await self._start(data)
+
+    async def on_post_process_message(self, message: types.Message,
+                                      results: list, data: dict):
+        await self._finish(data)
+
+    async def on_process_callback_query(self, callback: types.CallbackQuery,
+                                        data: dict):
+        await self._start(data)
+
+    async def on_post_process_callback_query(self,
+                                             callback: types.CallbackQuery,
+                                             results: list, data: dict):
+        await self._finish(data)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Антифлуд: не больше limit обновлений от пользователя за window секунд.
+
+    Проверка идёт в on_pre_process_update, до логирования, чтения
+    состояния FSM и фильтров, поэтому лишние обновления почти ничего
+    не стоят. Middleware нужно подключать первым.
+
+    Используется счётчик скользящего окна: на пользователя хранятся
+    номер текущего окна и количества обновлений в текущем и прошлом
+    окне, а оценка равна прошлому количеству с весом оставшейся доли
+    окна плюс текущему. Пользователи без обновлений дольше двух окон
+    удаляются, всего хранится не больше max_users пользователей.
+    """
+
+    def __init__(self, limit: int = 20, window: float = 10,
+                 delay: float = 0, max_users: int = 100000,
+                 notice: str = "Слишком много сообщений. Подождите "
+                               "немного, и я снова буду отвечать."):
+        """
+        Args:
+            limit (int): Обновлений от пользователя за окно.
+            window (float): Длина окна, сек.
+            delay (float): Сколько секунд можно задержать лишнее
+                обновление, прежде чем отбросить; 0 - сразу отбрасывать.
+            max_users (int): Сколько пользователей хранить.
+            notice (str): Предупреждение, которое пользователь получает
+                один раз за каждую серию отброшенных обновлений.
+        """
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.delay = delay
+        self.max_users = max_users
+        self.notice = notice
+        # user_id -> [номер окна, прошлое окно, текущее окно, предупреждён]
+        self._users: OrderedDict[int, list] = OrderedDict()
+
+    def _evict(self, window_index: int) -> None:
+        users = self._users
+        while users:
+            user_id, entry = next(iter(users.items()))
+            # Окно старше прошлого уже не влияет на оценку
+            if entry[0] >= window_index - 1 and len(users) <= self.max_users:
+                break
+            users.popitem(last=False)
+
+    def hit(self, user_id: int, now: float | None = None) -> float:
+        """
+        Учитывает обновление пользователя.
+
+        Returns:
+            float: 0, если обновление укладывается в лимит, иначе
+                примерное время до освобождения места в окне, сек.
+        """
+        if now is None:
+            now = time.monotonic()
+        window_index = int(now // self.window)
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = [window_index, 0, 0, False]
+        else:
+            self._users.move_to_end(user_id)
+            if entry[0] != window_index:
+                previous = entry[2] if entry[0] == window_index - 1 else 0
+                entry[:3] = [window_index, previous, 0]
+        self._evict(window_index)
+        elapsed = now - window_index * self.window
+        _, previous, current, _ = entry
+        weight = 1 - elapsed / self.window
+        if previous * weight + current < self.limit:
+            entry[2] += 1
+            entry[3] = False
+            return 0.0
+        if current >= self.limit or not previous:
+            return self.window - elapsed
+        # Вес прошлого окна упадёт до (limit - current) / previous
+        free_at = self.window * (1 - (self.limit - current) / previous)
+        return max(free_at - elapsed, 0.001)
+
+    def _notify_once(self, user_id: int) -> bool:
+        entry = self._users.get(user_id)
+        if entry is None or entry[3]:
+            return False
+        entry[3] = True
+        return True
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        chat_id, user_id = update_address(update)
+        if user_id is None:
+            return
+        wait = self.hit(user_id)
+        if not wait:
+            return
+        if wait <= self.delay:
+            THROTTLED.inc(action='delay')
+            await asyncio.sleep(wait)
+            if not self.hit(user_id):
+                return
+        THROTTLED.inc(action='drop')
+        if self._notify_once(user_id):
+            logger.warning("Антифлуд: обновления пользователя %s "
+                           "отбрасываются", user_id)
+            try:
+                if update.callback_query:
+                    await update.callback_query.answer(self.notice)
+                elif chat_id is not None:
+                    await update.bot.send_message(chat_id, self.notice)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке предупреждения: {e}")
+        raise CancelHandler()
@@ -0,0 +1,324 @@
+"""
+Версионные миграции схемы базы данных.
+
+Каждая миграция имеет номер и применяется один раз, применённые номера
+записываются в таблицу schema_version. Новые изменения схемы добавляются
+в конец MIGRATIONS со следующим номером, уже выпущенные миграции
+не меняются.
+
+Первая миграция повторяет прежний init_db (CREATE TABLE IF NOT EXISTS),
+поэтому базы, созданные до появления миграций, проходят её без изменений.
+Таблицы, появившиеся позже (outbox, photo_index, fsm_storage и т.д.),
+создаются своими миграциями, в том числе при обновлении такой базы.
+"""
+import logging
+import sqlite3
+import time
+from typing import Callable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Настройки соединения: действуют только на время жизни соединения,
+# поэтому задаются при каждом подключении, а не миграцией
+CONNECTION_PRAGMAS = (
+    # В режиме WAL NORMAL не теряет целостность при сбое питания,
+    # но не делает fsync на каждый коммит
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 30000',
+    'PRAGMA temp_store = MEMORY',
+    # Отрицательное значение - размер кэша страниц в КиБ
+    'PRAGMA cache_size = -8000',
+)
+
+
+class Migration(NamedTuple):
+    """Шаг миграции схемы."""
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection], None]
+    # PRAGMA journal_mode нельзя менять внутри транзакции
+    transactional: bool = True
+
+
+def configure_connection(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Применяет к соединению CONNECTION_PRAGMAS."""
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _initial_schema(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            full_name TEXT,
+            phone_number TEXT,
+            workplace TEXT,
+            username TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS kgm_requests (
+            id INTEGER PRIMARY KEY,
+            timestamp INTEGER,
+            full_name TEXT,
+            phone_number TEXT,
+            management_company TEXT,
+            adress TEXT,
+            district TEXT,
+            waste_type TEXT,
+            comment TEXT,
+            photo_link TEXT,
+            username TEXT
+        )
+    ''')
+    # Таблица жалоб на качество услуг
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quality_complaints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER,
+            full_name TEXT,
+            phone_number TEXT,
+            management_company TEXT,
+            address TEXT,
+            district TEXT,
+            complaint_type TEXT,
+            trouble TEXT,
+            comment TEXT,
+            contact_method TEXT,
+            email TEXT,
+            photo_link TEXT,
+            username TEXT
+        )
+    ''')
+
+
+def _wal_journal(conn: sqlite3.Connection) -> None:
+    # Режим WAL сохраняется в файле базы: читатели больше не блокируют
+    # запись, а запись - чтение
+    mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+    if mode.lower() != 'wal':
+        raise sqlite3.OperationalError(
+            f"Не удалось включить WAL, режим журнала: {mode}")
+
+
+def _reporting_indexes(conn: sqlite3.Connection) -> None:
+    # Район идёт первым, чтобы индекс обслуживал и выборку по району
+    # за период, и выборку только по району
+    for table in ('kgm_requests', 'quality_complaints'):
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_timestamp '
+                     f'ON {table} (timestamp)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_district '
+                     f'ON {table} (district, timestamp)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_username '
+                     f'ON {table} (username)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_phone_number '
+                     f'ON {table} (phone_number)')
+    conn.execute('ANALYZE')
+
+
+def _stats_rollup(conn: sqlite3.Connection) -> None:
+    # Счётчики заявок по часам UTC для /stats
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_hourly (
+            hour INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, kind, dimension, value)
+        ) WITHOUT ROWID
+    ''')
+    # Заполняем сводку заявками, сохранёнными до миграции
+    for table, kind, dimensions in (
+            ('kgm_requests', 'kgm', ('district', 'waste_type')),
+            ('quality_complaints', 'complaint',
+             ('district', 'complaint_type', 'trouble'))):
+        for dimension in dimensions:
+            conn.execute(f'''
+                INSERT INTO stats_hourly (hour, kind, dimension, value, count)
+                SELECT timestamp / 3600, ?, ?,
+                       COALESCE(NULLIF({dimension}, ''), '—'), COUNT(*)
+                FROM {table} WHERE timestamp IS NOT NULL
+                GROUP BY 1, 4
+            ''', (kind, dimension))
+
+
+def _journal_progress(conn: sqlite3.Connection) -> None:
+    # Последняя строка каждого вида, записанная в журнал Excel
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS journal_progress (
+            kind TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+    ''')
+
+
+def _sheet_queue(conn: sqlite3.Connection) -> None:
+    # Строки, ожидающие отправки в Google Таблицы
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sheet_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sheet_name TEXT NOT NULL,
+            row TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+
+
+def _sheet_queue_retries(conn: sqlite3.Connection) -> None:
+    # Неудачные попытки отправки строки и время следующей попытки
+    conn.execute('ALTER TABLE sheet_queue '
+                 'ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE sheet_queue '
+                 'ADD COLUMN retry_at INTEGER NOT NULL DEFAULT 0')
+
+
+def _request_outbox_id(conn: sqlite3.Connection) -> None:
+    # Задача outbox, сохранившая заявку: повтор шага не создаёт дубль
+    for table in ('kgm_requests', 'quality_complaints'):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN outbox_id INTEGER')
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
+                     f'idx_{table}_outbox_id ON {table} (outbox_id)')
+
+
+def _outbox(conn: sqlite3.Connection) -> None:
+    # Очередь отложенных задач после подтверждения заявок
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            steps_done TEXT NOT NULL DEFAULT '[]',
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+
+
+def _photo_index(conn: sqlite3.Connection) -> None:
+    # Индекс уже загруженных на Яндекс.Диск фото
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS photo_index (
+            folder TEXT NOT NULL,
+            file_unique_id TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            remote_path TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            PRIMARY KEY (folder, file_unique_id)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_photo_index_hash
+        ON photo_index (folder, content_hash)
+    ''')
+
+
+def _fsm_storage(conn: sqlite3.Connection) -> None:
+    # Состояния машины состояний (незаконченные заявки)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            chat TEXT NOT NULL,
+            user TEXT NOT NULL,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            bucket TEXT NOT NULL DEFAULT '{}',
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (chat, user)
+        )
+    ''')
+
+
+MIGRATIONS = (
+    Migration(1, 'initial_schema', _initial_schema),
+    Migration(2, 'wal_journal', _wal_journal, transactional=False),
+    Migration(3, 'reporting_indexes', _reporting_indexes),
+    Migration(4, 'stats_rollup', _stats_rollup),
+    Migration(5, 'journal_progress', _journal_progress),
+    Migration(6, 'sheet_queue', _sheet_queue),
+    Migration(7, 'sheet_queue_retries', _sheet_queue_retries),
+    Migration(8, 'request_outbox_id', _request_outbox_id),
+    Migration(9, 'outbox', _outbox),
+    Migration(10, 'photo_index', _photo_index),
+    Migration(11, 'fsm_storage', _fsm_storage),
+)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Номер последней применённой миграции, 0 для новой базы."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at INTEGER NOT NULL
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def _record(conn: sqlite3.Connection, migration: Migration) -> None:
+    conn.execute(
+        'INSERT OR IGNORE INTO schema_version (version, name, applied_at) '
+        'VALUES (?, ?, ?)',
+        (migration.version, migration.name, int(time.time())))
+
+
+def migrate(conn: sqlite3.Connection,
+            migrations: tuple[Migration, ...] = MIGRATIONS) -> int:
+    """
+    Применяет к базе миграции, которые ещё не применены.
+
+    Каждая миграция выполняется в своей транзакции вместе с записью
+    в schema_version. Транзакция берёт блокировку записи сразу, поэтому
+    несколько процессов бота, стартующих одновременно, применяют каждую
+    миграцию один раз.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой.
+        migrations (tuple): Миграции по возрастанию номера.
+
+    Returns:
+        int: Версия схемы после миграции.
+
+    Raises:
+        RuntimeError: Схема базы новее, чем известные миграции.
+    """
+    isolation_level = conn.isolation_level
+    # Транзакциями управляем сами
+    conn.isolation_level = None
+    try:
+        version = schema_version(conn)
+        latest = migrations[-1].version if migrations else 0
+        if version > latest:
+            raise RuntimeError(
+                f"Версия схемы базы {version} новее известной {latest}")
+        for migration in migrations:
+            if migration.version <= version:
+                continue
+            if migration.transactional:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # Другой процесс мог применить миграцию, пока ждали
+                    # блокировку
+                    if schema_version(conn) >= migration.version:
+                        conn.execute('COMMIT')
+                        continue
+                    migration.apply(conn)
+                    _record(conn, migration)
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+            else:
+                migration.apply(conn)
+                _record(conn, migration)
+            version = migration.version
+            logger.info("Применена миграция %s: %s", migration.version,
+                        migration.name)
+        return schema_version(conn)
+    finally:
+        conn.isolation_level = isolation_level
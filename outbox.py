@@ -0,0 +1,276 @@
+"""
+Надёжная очередь побочных действий после подтверждения заявки.
+
+Обработчик подтверждения только записывает задачу в таблицу outbox,
+а фоновые воркеры выполняют её шаги (сохранение в БД, пересылка в
+группу, загрузка фото, выгрузка в Google Таблицы). Каждый выполненный шаг
+отмечается в базе, поэтому после перезапуска задача продолжается с
+первого невыполненного шага.
+
+Шаг может выполниться повторно, если процесс упал после шага, но до
+отметки о нём. Поэтому шаги получают id задачи в payload['job_id'] и
+используют его как ключ идемпотентности (так сохраняется заявка в БД).
+
+Пока шаг выполняется, воркер продлевает аренду задачи, поэтому долгий
+шаг (загрузка фото, ожидание пакета) не отдаётся второму воркеру.
+Выполненные задачи удаляются через keep_days дней, проваленные
+остаются для разбора.
+"""
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from async_database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+StepFunc = Callable[[dict], Awaitable[None]]
+
+
+@dataclass
+class Step:
+    """Шаг задачи outbox."""
+    name: str
+    func: StepFunc
+    # Необязательный шаг после исчерпания попыток пропускается,
+    # и задача продолжается со следующего шага.
+    optional: bool = False
+
+
+@dataclass
+class Job:
+    """Задача, взятая воркером из таблицы outbox."""
+    id: int
+    kind: str
+    payload: dict
+    steps_done: list
+    attempts: int
+
+
+def insert_job(conn, kind: str, payload: dict) -> int:
+    """Добавляет задачу в outbox и возвращает её id."""
+    now = time.time()
+    cursor = conn.execute(
+        'INSERT INTO outbox (kind, payload, next_attempt_at, created_at) '
+        'VALUES (?, ?, ?, ?)',
+        (kind, json.dumps(payload, ensure_ascii=False), now, int(now)))
+    return cursor.lastrowid
+
+
+def claim_job(conn, lease: float) -> Job | None:
+    """
+    Забирает первую готовую к выполнению задачу.
+
+    Задача «арендуется» сдвигом next_attempt_at на lease секунд, поэтому
+    её не возьмёт другой воркер, а после падения процесса она снова
+    станет доступна по истечении аренды.
+    """
+    now = time.time()
+    row = conn.execute(
+        "SELECT id, kind, payload, steps_done, attempts, next_attempt_at "
+        "FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+        "ORDER BY id LIMIT 1", (now,)).fetchone()
+    if row is None:
+        return None
+    claimed = conn.execute(
+        'UPDATE outbox SET next_attempt_at = ? '
+        'WHERE id = ? AND next_attempt_at = ?',
+        (now + lease, row[0], row[5])).rowcount
+    if not claimed:
+        return None
+    return Job(id=row[0], kind=row[1], payload=json.loads(row[2]),
+               steps_done=json.loads(row[3]), attempts=row[4])
+
+
+def save_progress(conn, job: Job, lease: float) -> None:
+    """Сохраняет выполненные шаги и продлевает аренду задачи."""
+    conn.execute(
+        'UPDATE outbox SET payload = ?, steps_done = ?, attempts = 0, '
+        'last_error = NULL, next_attempt_at = ? WHERE id = ?',
+        (json.dumps(job.payload, ensure_ascii=False),
+         json.dumps(job.steps_done), time.time() + lease, job.id))
+
+
+def extend_lease(conn, job_id: int, lease: float) -> None:
+    """Продлевает аренду выполняемой задачи."""
+    conn.execute(
+        "UPDATE outbox SET next_attempt_at = ? "
+        "WHERE id = ? AND status = 'pending'",
+        (time.time() + lease, job_id))
+
+
+def purge_jobs(conn, before: int) -> int:
+    """
+    Удаляет выполненные задачи, созданные раньше before.
+
+    Returns:
+        int: Количество удалённых задач.
+    """
+    return conn.execute(
+        "DELETE FROM outbox WHERE status = 'done' AND created_at < ?",
+        (before,)).rowcount
+
+
+def finish_job(conn, job_id: int, status: str) -> None:
+    """Отмечает задачу выполненной или окончательно проваленной."""
+    conn.execute('UPDATE outbox SET status = ? WHERE id = ?',
+                 (status, job_id))
+
+
+def reschedule_job(conn, job_id: int, attempts: int, delay: float,
+                   error: str) -> None:
+    """Откладывает задачу после неудачной попытки."""
+    conn.execute(
+        'UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? '
+        'WHERE id = ?', (attempts, time.time() + delay, error, job_id))
+
+
+class Outbox:
+    """Очередь задач с фоновыми воркерами и повторами с отсрочкой."""
+
+    def __init__(self, db: AsyncDatabase, workers: int = 2,
+                 max_attempts: int = 8, base_delay: float = 5,
+                 max_delay: float = 600, lease: float = 120,
+                 poll_interval: float = 5, keep_days: float = 7,
+                 purge_interval: float = 3600):
+        """
+        Args:
+            db (AsyncDatabase): База данных, в которой хранится outbox.
+            workers (int): Количество фоновых воркеров.
+            max_attempts (int): Количество попыток на один шаг.
+            base_delay (float): Задержка перед первым повтором, сек.
+            max_delay (float): Максимальная задержка между повторами, сек.
+            lease (float): Время аренды задачи воркером, сек. Пока шаг
+                выполняется, аренда продлевается каждые lease / 3 сек.
+            poll_interval (float): Период опроса таблицы, сек.
+            keep_days (float): Сколько дней хранить выполненные задачи.
+            purge_interval (float): Период удаления старых задач, сек.
+        """
+        self.db = db
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.keep_days = keep_days
+        self.purge_interval = purge_interval
+        # Вызывается при окончательном провале шага: (job, step, error)
+        self.on_failure: Callable[[Job, Step, Exception],
+                                  Awaitable[None]] | None = None
+        self._steps: dict[str, list[Step]] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def register(self, kind: str, steps: list[Step]) -> None:
+        """Регистрирует последовательность шагов для задач типа kind."""
+        self._steps[kind] = steps
+
+    async def enqueue(self, kind: str, payload: dict) -> int:
+        """
+        Сохраняет задачу в базе и будит воркеры.
+
+        Returns:
+            int: Идентификатор задачи.
+        """
+        if kind not in self._steps:
+            raise ValueError(f"Неизвестный тип задачи outbox: {kind}")
+        job_id = await self.db.write(insert_job, kind, payload)
+        self._wakeup.set()
+        return job_id
+
+    def start(self) -> None:
+        """Запускает фоновые воркеры."""
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+        self._tasks.append(asyncio.create_task(self._purger()))
+
+    async def stop(self) -> None:
+        """Останавливает воркеры. Незавершённые задачи продолжатся при
+        следующем запуске."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await self.db.write(claim_job, self.lease)
+                if job is not None:
+                    await self._process(job)
+                    continue
+            except Exception as e:
+                # Воркер не должен умирать: задача вернётся в очередь
+                # по истечении аренды
+                logger.error(f"Ошибка воркера outbox: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _purger(self) -> None:
+        while True:
+            try:
+                before = int(time.time() - self.keep_days * 24 * 3600)
+                purged = await self.db.write(purge_jobs, before)
+                if purged:
+                    logger.info("Удалено выполненных задач outbox: %s",
+                                purged)
+            except Exception as e:
+                logger.error(f"Ошибка при очистке outbox: {e}")
+            await asyncio.sleep(self.purge_interval)
+
+    async def _heartbeat(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.db.write(extend_lease, job_id, self.lease)
+            except Exception as e:
+                logger.error(f"Не удалось продлить аренду задачи outbox "
+                             f"{job_id}: {e}")
+
+    async def _process(self, job: Job) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            await self._run_steps(job)
+        finally:
+            heartbeat.cancel()
+
+    async def _run_steps(self, job: Job) -> None:
+        steps = self._steps.get(job.kind)
+        if steps is None:
+            logger.error(f"Нет шагов для задачи outbox {job.id} ({job.kind})")
+            await self.db.write(finish_job, job.id, 'failed')
+            return
+        job.payload['job_id'] = job.id
+        for step in steps:
+            if step.name in job.steps_done:
+                continue
+            try:
+                await step.func(job.payload)
+            except Exception as e:
+                attempts = job.attempts + 1
+                logger.error(f"Шаг {step.name} задачи outbox {job.id} "
+                             f"(попытка {attempts}): {e}")
+                if attempts < self.max_attempts:
+                    await self.db.write(reschedule_job, job.id, attempts,
+                                        self._backoff(attempts), repr(e))
+                    return
+                if self.on_failure is not None:
+                    await self.on_failure(job, step, e)
+                if not step.optional:
+                    await self.db.write(finish_job, job.id, 'failed')
+                    return
+            job.steps_done.append(step.name)
+            job.attempts = 0
+            await self.db.write(save_progress, job, self.lease)
+        await self.db.write(finish_job, job.id, 'done')
@@ -0,0 +1,155 @@
+"""
+Потоковая передача фото из Telegram на Яндекс.Диск.
+
+Файл скачивается кусками во временный буфер, который держится в памяти
+только до порога spool_threshold, а дальше сбрасывается на диск. Так
+память на одну загрузку ограничена порогом независимо от размера фото.
+
+Уже загруженные фото запоминаются в таблице photo_index по
+file_unique_id Telegram и по хэшу содержимого, поэтому повторное фото
+стоит одного запроса к базе вместо скачивания и загрузки.
+"""
+import hashlib
+import io
+import tempfile
+import time
+
+from async_database import AsyncDatabase
+from metrics import BACKEND_LATENCY
+from yandex_uploader import YandexUploader
+
+
+def find_photo_by_unique_id(conn, folder: str,
+                            file_unique_id: str) -> str | None:
+    """Ищет путь к фото в папке по file_unique_id Telegram."""
+    row = conn.execute(
+        'SELECT remote_path FROM photo_index '
+        'WHERE folder = ? AND file_unique_id = ?',
+        (folder, file_unique_id)).fetchone()
+    return row[0] if row else None
+
+
+def find_photo_by_hash(conn, folder: str, content_hash: str) -> str | None:
+    """Ищет путь к фото в папке по хэшу содержимого."""
+    row = conn.execute(
+        'SELECT remote_path FROM photo_index '
+        'WHERE folder = ? AND content_hash = ? LIMIT 1',
+        (folder, content_hash)).fetchone()
+    return row[0] if row else None
+
+
+def insert_photo(conn, folder: str, file_unique_id: str, content_hash: str,
+                 remote_path: str) -> None:
+    """Запоминает загруженное фото."""
+    conn.execute(
+        'INSERT OR IGNORE INTO photo_index (folder, file_unique_id, '
+        'content_hash, remote_path, created_at) VALUES (?, ?, ?, ?, ?)',
+        (folder, file_unique_id, content_hash, remote_path, int(time.time())))
+
+
+class HashingWriter(io.RawIOBase):
+    """
+    Файловый объект, который пишет в buffer и считает sha256 записанного.
+
+    Наследуется от io.RawIOBase, потому что aiogram пишет только
+    в наследников io.IOBase, а SpooledTemporaryFile до Python 3.11
+    им не является.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+        self._hash = hashlib.sha256()
+        self._released = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._hash.update(data)
+        return self.buffer.write(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.buffer.seek(offset, whence)
+
+    def flush(self) -> None:
+        if not self._released:
+            self.buffer.flush()
+
+    def close(self) -> None:
+        # Буфер закрывает тот, кто его создал: close и __del__ обёртки
+        # не должны его трогать, даже если он уже закрыт
+        self._released = True
+        super().close()
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+class PhotoArchiver:
+    """Переносит фото заявок из Telegram на Яндекс.Диск."""
+
+    def __init__(self, bot, uploader: YandexUploader, db: AsyncDatabase,
+                 spool_threshold: int = 1024 * 1024,
+                 chunk_size: int = 64 * 1024):
+        """
+        Args:
+            bot: Экземпляр aiogram.Bot.
+            uploader (YandexUploader): Загрузчик на Яндекс.Диск.
+            db (AsyncDatabase): База данных с таблицей photo_index.
+            spool_threshold (int): Размер в байтах, после которого файл
+                сбрасывается из памяти во временный файл.
+            chunk_size (int): Размер куска при скачивании, байт.
+        """
+        self.bot = bot
+        self.uploader = uploader
+        self.db = db
+        self.spool_threshold = spool_threshold
+        self.chunk_size = chunk_size
+
+    async def download_to(self, file_id: str, destination) -> None:
+        """Скачивает файл Telegram кусками в файловый объект destination."""
+        with BACKEND_LATENCY.time(backend='telegram', operation='get_file'):
+            file = await self.bot.get_file(file_id)
+        with BACKEND_LATENCY.time(backend='telegram',
+                                  operation='download_file'):
+            await self.bot.download_file(file.file_path,
+                                         destination=destination,
+                                         chunk_size=self.chunk_size,
+                                         seek=True)
+
+    async def archive(self, file_id: str, disk_folder: str,
+                      file_unique_id: str | None = None) -> str:
+        """
+        Загружает фото Telegram в папку Яндекс.Диска.
+
+        Если это фото уже загружалось в ту же папку, возвращает
+        существующий путь.
+
+        Args:
+            file_id (str): file_id фото в Telegram.
+            disk_folder (str): Папка на Яндекс.Диске.
+            file_unique_id (str): file_unique_id фото в Telegram.
+
+        Returns:
+            str: Путь к сохранённому файлу на Яндекс.Диске.
+        """
+        if file_unique_id:
+            remote_path = await self.db.read(find_photo_by_unique_id,
+                                             disk_folder, file_unique_id)
+            if remote_path:
+                return remote_path
+        with tempfile.SpooledTemporaryFile(
+                max_size=self.spool_threshold) as buffer:
+            writer = HashingWriter(buffer)
+            await self.download_to(file_id, writer)
+            content_hash = writer.hexdigest()
+            remote_path = await self.db.read(find_photo_by_hash, disk_folder,
+                                             content_hash)
+            if remote_path is None:
+                buffer.seek(0)
+                remote_path = await self.uploader.upload(buffer, disk_folder)
+        await self.db.write(insert_photo, disk_folder,
+                            file_unique_id or f'sha256:{content_hash}',
+                            content_hash, remote_path)
+        return remote_path
@@ -0,0 +1,72 @@
+"""
+Готовые к отправке клавиатуры и шаблоны сообщений.
+
+Статические клавиатуры собираются и сериализуются в JSON один раз при
+импорте, а не на каждое обновление. Шаблоны подтверждений и пересылок
+разбираются один раз, при отправке только подставляются поля заявки.
+"""
+from string import Formatter
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.payload import prepare_arg
+
+
+class FrozenKeyboard(str):
+    """
+    Inline-клавиатура, уже сериализованная в JSON.
+
+    Строку aiogram передаёт в reply_markup как есть, поэтому клавиатура
+    не собирается и не сериализуется заново при каждой отправке.
+    Неизменяема: для другого набора кнопок создаётся новая клавиатура.
+    """
+
+    def __new__(cls, *rows: tuple[tuple[str, str], ...]):
+        """
+        Args:
+            *rows: Ряды кнопок, каждый - кортеж пар (текст, callback_data).
+        """
+        markup = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=text, callback_data=data)
+             for text, data in row]
+            for row in rows])
+        keyboard = super().__new__(cls, prepare_arg(markup))
+        keyboard.rows = tuple(tuple(row) for row in rows)
+        return keyboard
+
+    @classmethod
+    def column(cls, *buttons: tuple[str, str]) -> 'FrozenKeyboard':
+        """Клавиатура с одной кнопкой в каждом ряду."""
+        return cls(*((button,) for button in buttons))
+
+    def with_rows(self, *rows: tuple[tuple[str, str], ...],
+                  at: int | None = None) -> 'FrozenKeyboard':
+        """Возвращает новую клавиатуру с рядами rows, вставленными в at."""
+        current = list(self.rows)
+        if at is None:
+            at = len(current)
+        current[at:at] = rows
+        return FrozenKeyboard(*current)
+
+
+class MessageTemplate:
+    """Шаблон сообщения с полями заявки в формате str.format."""
+
+    def __init__(self, text: str, defaults: dict | None = None):
+        """
+        Args:
+            text (str): Текст с полями вида {district}.
+            defaults (dict): Значения полей, которых нет в данных заявки.
+                Поле без значения по умолчанию обязательно.
+        """
+        self.text = text
+        self.defaults = defaults or {}
+        self.fields = tuple(dict.fromkeys(
+            name for _, name, _, _ in Formatter().parse(text) if name))
+
+    def render(self, data: dict) -> str:
+        """Подставляет поля из data в шаблон."""
+        defaults = self.defaults
+        return self.text.format_map({
+            name: data.get(name, defaults[name]) if name in defaults
+            else data[name]
+            for name in self.fields})
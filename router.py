@@ -0,0 +1,132 @@
+"""
+Индексированный маршрутизатор нажатий inline-кнопок.
+
+aiogram перебирает обработчики callback-запросов по порядку и для
+каждого проверяет фильтр состояния и фильтр данных кнопки, поэтому
+стоимость нажатия растёт с числом сценариев. Маршрутизатор регистрирует
+в диспетчере один обработчик и выбирает нужный по словарям, ключ
+которых - состояние FSM и данные кнопки (точное значение или префикс
+до двоеточия).
+
+Порядок выбора: точные данные кнопки для текущего состояния, точные
+данные для любого состояния, префикс для текущего состояния, префикс
+для любого состояния, любая кнопка в текущем состоянии, любая кнопка
+в любом состоянии.
+"""
+import inspect
+import logging
+from typing import Awaitable, Callable
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.dispatcher.handler import (SkipHandler, ctx_data,
+                                        current_handler)
+
+logger = logging.getLogger(__name__)
+
+ANY_STATE = '*'
+PREFIX_SEPARATOR = ':'
+# Ключ в данных обработки, под которым лежит выбранный обработчик
+ROUTED_HANDLER = 'routed_handler'
+
+Handler = Callable[..., Awaitable]
+
+
+def state_name(state) -> str | None:
+    """Приводит State, StatesGroup или строку к имени состояния."""
+    if isinstance(state, State):
+        return state.state
+    if inspect.isclass(state) and issubclass(state, StatesGroup):
+        raise ValueError("Укажите конкретное состояние, а не группу")
+    return state
+
+
+def data_prefix(data: str | None) -> str | None:
+    """Префикс данных кнопки до двоеточия (district:Ленинский -> district)."""
+    if data and PREFIX_SEPARATOR in data:
+        return data.split(PREFIX_SEPARATOR, 1)[0]
+    return None
+
+
+class CallbackRouter:
+    """Выбирает обработчик нажатия по состоянию FSM и данным кнопки."""
+
+    def __init__(self):
+        # (состояние, данные) -> (обработчик, нужен ли аргумент state)
+        self._exact: dict[tuple, tuple[Handler, bool]] = {}
+        self._prefix: dict[tuple, tuple[Handler, bool]] = {}
+        self._any: dict[str | None, tuple[Handler, bool]] = {}
+
+    def register(self, handler: Handler, *, data: str | None = None,
+                 prefix: str | None = None, state=None) -> None:
+        """
+        Регистрирует обработчик.
+
+        Args:
+            handler: Корутина (callback) или (callback, state).
+            data (str): Точное значение данных кнопки.
+            prefix (str): Префикс данных кнопки до двоеточия.
+            state: Состояние FSM, '*' - любое, None - без состояния.
+        """
+        if data is not None and prefix is not None:
+            raise ValueError("Укажите data или prefix, но не оба")
+        if prefix is not None and prefix.endswith(PREFIX_SEPARATOR):
+            prefix = prefix[:-len(PREFIX_SEPARATOR)]
+        state = state_name(state)
+        entry = (handler, 'state' in inspect.signature(handler).parameters)
+        if data is not None:
+            index, key = self._exact, (state, data)
+        elif prefix is not None:
+            index, key = self._prefix, (state, prefix)
+        else:
+            index, key = self._any, state
+        if key in index:
+            # Как и в цепочке фильтров, срабатывает зарегистрированный первым
+            logger.warning("Обработчик %s перекрыт %s для %s",
+                           handler.__name__, index[key][0].__name__, key)
+            return
+        index[key] = entry
+
+    def callback_query_handler(self, *, data: str | None = None,
+                               prefix: str | None = None, state=None):
+        """Декоратор, аналог dp.callback_query_handler."""
+
+        def decorator(handler: Handler) -> Handler:
+            self.register(handler, data=data, prefix=prefix, state=state)
+            return handler
+
+        return decorator
+
+    def resolve(self, state: str | None, data: str | None
+                ) -> tuple[Handler, bool] | None:
+        """Находит обработчик для состояния и данных кнопки."""
+        exact = self._exact
+        entry = (exact.get((state, data))
+                 or exact.get((ANY_STATE, data)))
+        if entry is None:
+            prefix = data_prefix(data)
+            if prefix is not None:
+                entry = (self._prefix.get((state, prefix))
+                         or self._prefix.get((ANY_STATE, prefix)))
+        if entry is None:
+            entry = self._any.get(state) or self._any.get(ANY_STATE)
+        return entry
+
+    async def _dispatch(self, callback: types.CallbackQuery,
+                        state: FSMContext):
+        entry = self.resolve(await state.get_state(), callback.data)
+        if entry is None:
+            raise SkipHandler()
+        handler, wants_state = entry
+        # Middleware видят настоящий обработчик, а не маршрутизатор
+        current_handler.set(handler)
+        ctx_data.get()[ROUTED_HANDLER] = handler
+        if wants_state:
+            return await handler(callback, state=state)
+        return await handler(callback)
+
+    def setup(self, dispatcher: Dispatcher) -> None:
+        """Регистрирует маршрутизатор в диспетчере."""
+        dispatcher.register_callback_query_handler(self._dispatch,
+                                                   state=ANY_STATE)
@@ -0,0 +1,127 @@
+"""
+Сравнение цепочки фильтров aiogram и CallbackRouter.
+
+В диспетчер регистрируются flows сценариев по steps шагов, в каждом
+шаге - обработчик нажатия с фильтром состояния и данных кнопки, как
+в main.py. Затем через dp.process_update прогоняются нажатия на шаги
+в случайном порядке, обработчики ничего не делают, поэтому замеряется
+только выбор обработчика.
+
+Пример:
+    python router_benchmark.py --flows 3 --flows 30 --updates 5000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.filters.state import State
+
+from router import CallbackRouter
+
+USER_ID = 1
+
+
+def make_states(flows: int, steps: int) -> list[list[str]]:
+    return [[State(f'step{step}', f'Flow{flow}').state
+             for step in range(steps)] for flow in range(flows)]
+
+
+async def noop(callback: types.CallbackQuery, state=None):
+    pass
+
+
+def setup_filters(dp: Dispatcher, states: list[list[str]]) -> None:
+    for flow in states:
+        for step, state in enumerate(flow):
+            data = f'choice{step}'
+            dp.register_callback_query_handler(
+                noop, lambda callback, data=data: callback.data == data,
+                state=state)
+            # Кнопки со справочником, как district:... в main.py
+            dp.register_callback_query_handler(
+                noop, lambda callback: callback.data.startswith('item:'),
+                state=state)
+
+
+def setup_router(dp: Dispatcher, states: list[list[str]]) -> None:
+    router = CallbackRouter()
+    for flow in states:
+        for step, state in enumerate(flow):
+            router.register(noop, data=f'choice{step}', state=state)
+            router.register(noop, prefix='item', state=state)
+    router.setup(dp)
+
+
+def make_update(update_id: int, data: str) -> types.Update:
+    user = {'id': USER_ID, 'is_bot': False, 'first_name': 'bench'}
+    return types.Update(**{
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id), 'from': user, 'chat_instance': '1',
+            'data': data,
+            'message': {'message_id': 1, 'date': 0, 'text': '-',
+                        'chat': {'id': USER_ID, 'type': 'private'}}}})
+
+
+async def measure(setup, states: list[list[str]], updates: int,
+                  seed: int) -> list[float]:
+    bot = Bot(token='1:benchmark')
+    dp = Dispatcher(bot, storage=MemoryStorage())
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    setup(dp, states)
+    rng = random.Random(seed)
+    steps = [(state, step) for flow in states
+             for step, state in enumerate(flow)]
+    timings = []
+    try:
+        for update_id in range(updates):
+            state, step = rng.choice(steps)
+            data = rng.choice((f'choice{step}', 'item:Ленинский'))
+            await dp.storage.set_state(chat=USER_ID, user=USER_ID,
+                                       state=state)
+            update = make_update(update_id, data)
+            start = time.perf_counter()
+            # Отдельная задача на обновление, как в executor aiogram
+            await asyncio.create_task(dp.process_update(update))
+            timings.append(time.perf_counter() - start)
+    finally:
+        await dp.storage.close()
+        await (await bot.get_session()).close()
+    return timings
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f'{"сценариев":>10} {"обработчиков":>13} {"способ":>8} '
+          f'{"p50, мкс":>9} {"p95, мкс":>9} {"p99, мкс":>9}')
+    for flows in args.flows:
+        states = make_states(flows, args.steps)
+        handlers = flows * args.steps * 2
+        for name, setup in (('filters', setup_filters),
+                            ('router', setup_router)):
+            timings = await measure(setup, states, args.updates, args.seed)
+            print(f'{flows:>10} {handlers:>13} {name:>8} '
+                  + ' '.join(f'{percentile(timings, q) * 1e6:>9.1f}'
+                             for q in (0.5, 0.95, 0.99)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--flows', type=int, action='append',
+                        help='Число сценариев, можно указать несколько раз')
+    parser.add_argument('--steps', type=int, default=6,
+                        help='Шагов в сценарии')
+    parser.add_argument('--updates', type=int, default=3000,
+                        help='Нажатий на каждый замер')
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args()
+    arguments.flows = arguments.flows or [3, 10, 30]
+    asyncio.run(main(arguments))
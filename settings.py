@@ -1,38 +1,184 @@
 import os
-import yadisk
+import time
 
 from oauth2client.service_account import ServiceAccountCredentials
 from dotenv import load_dotenv
-from gspread import authorize
+from gspread import Client as GClient, authorize
 
-from database_functions import init_db
+from address_index import AddressIndex
+from async_database import AsyncDatabase
+from bot_limiter import BotRateLimiter
+from excel_journal import ExcelJournal
+from executors import BackendLimit, BlockingExecutor
+from gsheets_writer import SheetWriter
+from mailer import Mailer
+from outbox import Outbox
+from user_cache import UserCache
+from yandex_uploader import YandexUploader
 
 load_dotenv()
 
+# Отсчёт времени запуска бота
+STARTED_AT = time.monotonic()
+
 # Настройка логирования
 log_folder = 'logs'
 log_file = os.path.join(log_folder, 'bot.log')
 
-database_path = init_db('database', 'users.db')
+# Таблицы создаются при открытии базы в on_startup
+database_path = os.path.join('database', 'users.db')
+DB_READERS = int(os.getenv('DB_READERS', 3))
+
+# Лимиты одновременных вызовов и таймауты блокирующих бэкендов
+BACKEND_LIMITS = {
+    'yandex': BackendLimit(int(os.getenv('YANDEX_CONCURRENCY', 4)),
+                           float(os.getenv('YANDEX_TIMEOUT', 120))),
+    'google': BackendLimit(int(os.getenv('GOOGLE_CONCURRENCY', 2)),
+                           float(os.getenv('GOOGLE_TIMEOUT', 60))),
+    'smtp': BackendLimit(int(os.getenv('SMTP_CONCURRENCY', 1)),
+                         float(os.getenv('SMTP_TIMEOUT', 60))),
+    # Писатель и все читатели могут работать одновременно
+    'sqlite': BackendLimit(DB_READERS + 1,
+                           float(os.getenv('SQLITE_TIMEOUT', 30))),
+    # Выгрузки /export по одной, у каждой своё соединение с базой
+    'export': BackendLimit(1, float(os.getenv('EXPORT_TIMEOUT', 600))),
+    # Файлы журнала Excel пишет один поток
+    'excel': BackendLimit(1, float(os.getenv('EXCEL_JOURNAL_TIMEOUT', 120))),
+}
+EXECUTOR = BlockingExecutor(BACKEND_LIMITS)
+
+# Кэш профилей зарегистрированных пользователей
+USER_CACHE = UserCache(maxsize=int(os.getenv('USER_CACHE_SIZE', 10000)),
+                       ttl=float(os.getenv('USER_CACHE_TTL', 3600)))
+# Адреса прошлых заявок для подсказок; ADDRESS_SUGGESTIONS - сколько
+# адресов предлагать кнопками (0 отключает подсказки)
+ADDRESS_INDEX = AddressIndex()
+ADDRESS_SUGGESTIONS = int(os.getenv('ADDRESS_SUGGESTIONS', 5))
+# Пул соединений: один писатель и DB_READERS читателей
+DATABASE = AsyncDatabase(database_path, DB_READERS, user_cache=USER_CACHE,
+                         executor=EXECUTOR, address_index=ADDRESS_INDEX)
+# Хранилище FSM: период записи изменений (сек) и срок жизни черновиков
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', 2))
+FSM_TTL_DAYS = float(os.getenv('FSM_TTL_DAYS', 7))
+# Антифлуд: не больше THROTTLE_LIMIT обновлений от пользователя за
+# THROTTLE_WINDOW секунд (0 отключает); лишние задерживаются не дольше
+# THROTTLE_DELAY секунд, остальные отбрасываются
+THROTTLE_LIMIT = int(os.getenv('THROTTLE_LIMIT', 20))
+THROTTLE_WINDOW = float(os.getenv('THROTTLE_WINDOW', 10))
+THROTTLE_DELAY = float(os.getenv('THROTTLE_DELAY', 0))
+
+# Окно сбора заявок в альбомы для группы GROUP_ID, сек; 0 - отправлять
+# каждую заявку сразу отдельным сообщением
+GROUP_ALBUM_WINDOW = float(os.getenv('GROUP_ALBUM_WINDOW', 0))
+# Фоновая обработка подтвержденных заявок. Воркер ждёт отправки альбома,
+# поэтому с окном альбомов воркеров нужно не меньше, чем фото в альбоме
+OUTBOX = Outbox(DATABASE,
+                workers=int(os.getenv('OUTBOX_WORKERS',
+                                      10 if GROUP_ALBUM_WINDOW else 2)),
+                max_attempts=int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8)),
+                keep_days=float(os.getenv('OUTBOX_KEEP_DAYS', 7)))
 
-# Создаем клиент яндекса
-YANDEX_CLIENT = yadisk.Client(token=os.getenv('YA_DISK_TOKEN'))
+# Создаем загрузчик на Яндекс.Диск, число одновременных загрузок
+# задается YANDEX_CONCURRENCY
+YANDEX_UPLOADER = YandexUploader(os.getenv('YA_DISK_TOKEN'), EXECUTOR)
 YA_DISK_FOLDER = os.getenv('YA_DISK_FOLDER')
 YA_DISK_FOLDER_COMPLAINTS=os.getenv('YA_DISK_FOLDER_COMPLAINTS')
+# Фото больше порога (байт) при передаче сбрасываются во временный файл
+PHOTO_SPOOL_THRESHOLD = int(os.getenv('PHOTO_SPOOL_THRESHOLD', 1024 * 1024))
 
-# Устанавливаем соединение с API Google
+# Соединение с API Google устанавливается при первой записи в таблицу
 scope = ['https://spreadsheets.google.com/feeds',
          'https://www.googleapis.com/auth/drive']
-credentials = ServiceAccountCredentials.from_json_keyfile_name(
-    os.getenv('GSHEETS_KEY'), scope)
-GOOGLE_CLIENT = authorize(credentials)
+
+
+def make_google_client() -> GClient:
+    """Загружает ключ сервисного аккаунта и авторизует клиент gspread."""
+    credentials = ServiceAccountCredentials.from_json_keyfile_name(
+        os.getenv('GSHEETS_KEY'), scope)
+    return authorize(credentials)
+
+
 GOOGLE_SHEET_NAME_LEFT = os.getenv('GOOGLE_SHEET_NAME_LEFT')
 GOOGLE_SHEET_NAME_RIGHT = os.getenv('GOOGLE_SHEET_NAME_RIGHT')
 GOOGLE_SHEET_NAME = {'left': GOOGLE_SHEET_NAME_LEFT,
                      'right': GOOGLE_SHEET_NAME_RIGHT}
 GOOGLE_SHEET_COMPLAINT_NAME = os.getenv('GOOGLE_SHEET_COMPLAINT_NAME')
+# Пакетная запись строк в таблицы с учетом квоты Sheets API
+SHEET_WRITER = SheetWriter(
+    make_google_client, EXECUTOR, DATABASE,
+    batch_size=int(os.getenv('GSHEETS_BATCH_SIZE', 20)),
+    flush_interval=float(os.getenv('GSHEETS_FLUSH_INTERVAL', 5)),
+    requests_per_minute=int(os.getenv('GSHEETS_REQUESTS_PER_MINUTE', 50)),
+    max_attempts=int(os.getenv('GSHEETS_MAX_ATTEMPTS', 10)))
+
+# Локальный журнал заявок в XLSX: файл на месяц, новая часть после
+# EXCEL_JOURNAL_MAX_ROWS строк или EXCEL_JOURNAL_MAX_MB мегабайт
+EXCEL_JOURNAL = ExcelJournal(
+    DATABASE, os.getenv('EXCEL_JOURNAL_FOLDER', 'journal'), EXECUTOR,
+    batch_size=int(os.getenv('EXCEL_JOURNAL_BATCH_SIZE', 500)),
+    flush_interval=float(os.getenv('EXCEL_JOURNAL_FLUSH_INTERVAL', 10)),
+    max_rows=int(os.getenv('EXCEL_JOURNAL_MAX_ROWS', 1000)),
+    max_bytes=int(float(os.getenv('EXCEL_JOURNAL_MAX_MB', 1)) * 1024 * 1024),
+    hours_offset=int(os.getenv('TIMEDELTA', 0)))
+
+# Почта: одно SMTP-соединение на все письма, EMAIL_DIGEST_MINUTES > 0
+# включает отправку сводкой. Заявки уходят на TARGET_EMAIL, только если
+# EMAIL_FORWARD=1
+TARGET_EMAIL = os.getenv('TARGET_EMAIL')
+EMAIL_FORWARD = os.getenv('EMAIL_FORWARD', '0') == '1'
+MAILER = Mailer(EXECUTOR,
+                host=os.getenv('SMTP_HOST', 'smtp.yandex.ru'),
+                port=int(os.getenv('SMTP_PORT', 587)),
+                sender=os.getenv('EMAIL'),
+                password=os.getenv('PASSWORD_EMAIL'),
+                starttls=os.getenv('SMTP_STARTTLS', '1') == '1',
+                digest_minutes=float(os.getenv('EMAIL_DIGEST_MINUTES', 0)),
+                send_timeout=float(os.getenv('EMAIL_SEND_TIMEOUT', 120)))
+
+# Адрес собственного сервера Bot API (например, локального telegram-bot-api);
+# по умолчанию используется api.telegram.org
+TELEGRAM_API_SERVER = os.getenv('TELEGRAM_API_SERVER')
+
+# Количество процессов-обработчиков, 1 - всё в одном процессе
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', 1))
+
+# Ограничения исходящих запросов к Bot API: сообщений в секунду на бота
+# и в личный чат, в минуту в группу; дольше BOT_API_MAX_WAIT секунд
+# запрос в очереди не ждёт. Общий лимит и лимит группы делятся между
+# SHARD_WORKERS процессами
+BOT_API_LIMITER = BotRateLimiter(
+    global_rate=float(os.getenv('BOT_API_GLOBAL_RATE', 30)),
+    chat_rate=float(os.getenv('BOT_API_CHAT_RATE', 1)),
+    chat_burst=float(os.getenv('BOT_API_CHAT_BURST', 3)),
+    group_per_minute=float(os.getenv('BOT_API_GROUP_PER_MINUTE', 20)),
+    max_wait=float(os.getenv('BOT_API_MAX_WAIT', 60)),
+    shards=max(SHARD_WORKERS, 1))
+BOT_API_MAX_RETRIES = int(os.getenv('BOT_API_MAX_RETRIES', 3))
+
+# Прогрев Google Таблиц, Яндекс.Диска и почты при запуске (в фоне,
+# не задерживает приём обновлений) и таймаут прогрева каждого сервиса
+WARM_UP_BACKENDS = os.getenv('WARM_UP_BACKENDS', '1') == '1'
+WARM_UP_TIMEOUT = float(os.getenv('WARM_UP_TIMEOUT', 30))
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Обрабатывать обновления, накопившиеся за время перезапуска
+PROCESS_BACKLOG = os.getenv('PROCESS_BACKLOG', '0') == '1'
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST')  # например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', 8080))
+
+# Метрики Prometheus на /metrics; 0 отключает сервер. При SHARD_WORKERS > 1
+# процесс-обработчик с номером N слушает порт METRICS_PORT + N.
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
 
 DEV_TG_ID = os.getenv('DEV_TG_ID')
+# Telegram id сотрудников через запятую, им доступна команда /stats
+STAFF_IDS = {int(user_id) for user_id in os.getenv('STAFF_IDS', '').split(',')
+             if user_id.strip()}
 TIMEDELTA = int(os.getenv('TIMEDELTA'))
 GROUP_ID=os.getenv('GROUP_ID')
 
@@ -0,0 +1,155 @@
+"""
+Распределение обновлений по нескольким процессам.
+
+Родительский процесс получает обновления (long polling или вебхук) и
+раскладывает их по очередям дочерних процессов по остатку от деления
+id пользователя. В каждом дочернем процессе работает тот же Dispatcher
+из main.py, поэтому диалог одного пользователя всегда обрабатывается
+одним процессом и по порядку.
+
+Дочерние процессы создаются через fork (Linux), чтобы не импортировать
+main.py повторно: к моменту fork соединения с базой и сессии ещё не
+открыты, их открывает on_startup уже в каждом процессе.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+from typing import Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from webhook import UpdateProcessor, make_app, update_user_id
+
+logger = logging.getLogger(__name__)
+
+Hook = Callable[[Dispatcher], Awaitable[None]]
+
+
+def shard_index() -> int:
+    """Номер текущего процесса-обработчика, 0 без шардов."""
+    return int(os.getenv('SHARD_INDEX', 0))
+
+
+def shard_for(payload: dict, workers: int) -> int:
+    """Номер процесса, который обрабатывает обновление."""
+    return (update_user_id(payload) or 0) % workers
+
+
+async def _worker_loop(dispatcher: Dispatcher, queue, on_startup: Hook | None,
+                       on_shutdown: Hook | None) -> None:
+    if on_startup is not None:
+        await on_startup(dispatcher)
+    processor = UpdateProcessor(dispatcher)
+    loop = asyncio.get_running_loop()
+    while True:
+        payload = await loop.run_in_executor(None, queue.get)
+        if payload is None:
+            break
+        processor.feed(payload)
+    await processor.wait_closed()
+    if on_shutdown is not None:
+        await on_shutdown(dispatcher)
+    await dispatcher.storage.close()
+    await dispatcher.bot.close()
+
+
+def _worker_main(index: int, dispatcher: Dispatcher, queue,
+                 on_startup: Hook | None, on_shutdown: Hook | None) -> None:
+    # Останавливается по None из очереди, а не по Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # По номеру процесса on_startup выбирает, например, порт метрик
+    os.environ['SHARD_INDEX'] = str(index)
+    logger.info("Процесс-обработчик %s запущен", index)
+    asyncio.run(_worker_loop(dispatcher, queue, on_startup, on_shutdown))
+    logger.info("Процесс-обработчик %s остановлен", index)
+
+
+async def _poll_updates(bot: Bot, feed: Callable[[dict], None],
+                        process_backlog: bool) -> None:
+    await bot.delete_webhook(drop_pending_updates=not process_backlog)
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=20)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при получении обновлений: {e}")
+            await asyncio.sleep(5)
+            continue
+        for update in updates:
+            offset = update.update_id + 1
+            feed(update.to_python())
+
+
+async def _serve_webhook(bot: Bot, feed: Callable[[dict], None],
+                         webhook: dict, process_backlog: bool) -> None:
+    app = make_app(webhook['path'], webhook['secret'], feed)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, webhook['host'], webhook['port'])
+    await site.start()
+    await bot.set_webhook(webhook['url'], secret_token=webhook['secret'],
+                          drop_pending_updates=not process_backlog)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_sharded(dispatcher: Dispatcher, workers: int,
+                process_backlog: bool = False, webhook: dict | None = None,
+                on_startup: Hook | None = None,
+                on_shutdown: Hook | None = None) -> None:
+    """
+    Запускает приём обновлений и workers процессов-обработчиков.
+
+    Args:
+        dispatcher (Dispatcher): Диспетчер бота.
+        workers (int): Количество процессов-обработчиков.
+        process_backlog (bool): Обработать накопившиеся обновления.
+        webhook (dict): Параметры вебхука (url, path, secret, host, port).
+            Без них обновления получаются через long polling.
+        on_startup (Hook): Вызывается в каждом процессе при запуске.
+        on_shutdown (Hook): Вызывается в каждом процессе при остановке.
+    """
+    context = multiprocessing.get_context('fork')
+    queues = [context.Queue() for _ in range(workers)]
+    processes = [
+        context.Process(target=_worker_main, name=f'bot-worker-{index}',
+                        args=(index, dispatcher, queue, on_startup,
+                              on_shutdown))
+        for index, queue in enumerate(queues)]
+    for process in processes:
+        process.start()
+    # docker stop посылает SIGTERM, останавливаемся так же, как по Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    def feed(payload: dict) -> None:
+        queues[shard_for(payload, workers)].put(payload)
+
+    bot = dispatcher.bot
+    if webhook:
+        receiver = _serve_webhook(bot, feed, webhook, process_backlog)
+    else:
+        receiver = _poll_updates(bot, feed, process_backlog)
+
+    async def receive() -> None:
+        try:
+            await receiver
+        finally:
+            await bot.close()
+
+    try:
+        asyncio.run(receive())
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Остановка приёма обновлений")
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join()
@@ -0,0 +1,245 @@
+"""
+Хранилище машины состояний aiogram в SQLite.
+
+Все состояния держатся в памяти, как в MemoryStorage, поэтому чтение
+не обращается к базе. Изменённые записи помечаются и периодически
+записываются в таблицу fsm_storage одной транзакцией. При запуске
+записи загружаются обратно, так что незаконченные заявки переживают
+перезапуск. Пустые записи удаляются сразу, а брошенные черновики -
+по истечении ttl.
+
+При нескольких процессах-обработчиках каждый загружает только записи
+своих пользователей (тот же остаток от деления id, что и в
+sharding.shard_for), а устаревшие записи в базе удаляет процесс 0.
+"""
+import asyncio
+import copy
+import json
+import logging
+import time
+import typing
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from async_database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+Record = dict[str, typing.Any]
+
+
+def load_records(conn, min_updated_at: float, shard: int = 0,
+                 shards: int = 1) -> list[tuple]:
+    """Читает не устаревшие записи пользователей процесса shard."""
+    return conn.execute(
+        'SELECT chat, user, state, data, bucket, updated_at '
+        'FROM fsm_storage WHERE updated_at >= ? '
+        'AND CAST(user AS INTEGER) % ? = ?',
+        (min_updated_at, shards, shard)).fetchall()
+
+
+def save_records(conn, records: list[tuple]) -> None:
+    """
+    Сохраняет записи (chat, user, record). Запись None удаляется.
+    """
+    for chat, user, record in records:
+        if record is None:
+            conn.execute('DELETE FROM fsm_storage WHERE chat = ? AND user = ?',
+                         (chat, user))
+            continue
+        conn.execute(
+            'INSERT OR REPLACE INTO fsm_storage '
+            '(chat, user, state, data, bucket, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (chat, user, record['state'],
+             json.dumps(record['data'], ensure_ascii=False),
+             json.dumps(record['bucket'], ensure_ascii=False),
+             int(record['updated_at'])))
+
+
+def delete_expired(conn, min_updated_at: float) -> int:
+    """Удаляет устаревшие записи и возвращает их количество."""
+    return conn.execute('DELETE FROM fsm_storage WHERE updated_at < ?',
+                        (min_updated_at,)).rowcount
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний с кэшем в памяти и отложенной записью."""
+
+    def __init__(self, db: AsyncDatabase, flush_interval: float = 2.0,
+                 ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            db (AsyncDatabase): База данных с таблицей fsm_storage.
+            flush_interval (float): Период записи изменений в базу, сек.
+            ttl (float): Время жизни незаконченной записи, сек.
+        """
+        self.db = db
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.data: dict[tuple[str, str], Record] = {}
+        self._dirty: set[tuple[str, str]] = set()
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+
+    async def load(self, shard: int = 0, shards: int = 1) -> int:
+        """
+        Загружает сохранённые записи и запускает фоновую запись.
+
+        Args:
+            shard (int): Номер процесса-обработчика.
+            shards (int): Количество процессов-обработчиков.
+
+        Returns:
+            int: Количество загруженных записей.
+        """
+        min_updated_at = time.time() - self.ttl
+        if shard == 0:
+            await self.db.write(delete_expired, min_updated_at)
+        rows = await self.db.read(load_records, min_updated_at, shard,
+                                  shards)
+        for chat, user, state, data, bucket, updated_at in rows:
+            self.data[(chat, user)] = {
+                'state': state,
+                'data': json.loads(data),
+                'bucket': json.loads(bucket),
+                'updated_at': updated_at,
+            }
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+        return len(rows)
+
+    async def flush(self) -> None:
+        """Записывает все изменённые записи в базу."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            records = [(chat, user, copy.deepcopy(self.data.get((chat, user))))
+                       for chat, user in dirty]
+            try:
+                await self.db.write(save_records, records)
+            except Exception:
+                # Вернём ключи, чтобы записать их в следующий раз
+                self._dirty |= dirty
+                raise
+
+    async def _flush_loop(self) -> None:
+        last_purge = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_purge > 3600:
+                    last_purge = time.monotonic()
+                    self._purge_expired()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении состояний FSM: {e}")
+
+    def _purge_expired(self) -> None:
+        # В памяти только записи пользователей этого процесса
+        min_updated_at = time.time() - self.ttl
+        for key, record in list(self.data.items()):
+            if record['updated_at'] < min_updated_at:
+                del self.data[key]
+                self._dirty.add(key)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def wait_closed(self) -> None:
+        pass
+
+    def _address(self, chat, user) -> tuple[str, str]:
+        chat, user = self.check_address(chat=chat, user=user)
+        return str(chat), str(user)
+
+    def _record(self, key: tuple[str, str]) -> Record:
+        record = self.data.get(key)
+        if record is None:
+            record = self.data[key] = {'state': None, 'data': {},
+                                       'bucket': {}, 'updated_at': 0}
+        return record
+
+    def _touch(self, key: tuple[str, str]) -> None:
+        record = self.data.get(key)
+        if record is not None:
+            if (record['state'] is None and not record['data']
+                    and not record['bucket']):
+                del self.data[key]
+            else:
+                record['updated_at'] = time.time()
+        self._dirty.add(key)
+
+    async def get_state(self, *, chat=None, user=None,
+                        default: typing.Optional[str] = None
+                        ) -> typing.Optional[str]:
+        record = self.data.get(self._address(chat, user))
+        if record is None or record['state'] is None:
+            return self.resolve_state(default)
+        return record['state']
+
+    async def get_data(self, *, chat=None, user=None,
+                       default: typing.Optional[typing.Dict] = None
+                       ) -> typing.Dict:
+        record = self.data.get(self._address(chat, user))
+        if record is None:
+            return copy.deepcopy(default or {})
+        return copy.deepcopy(record['data'])
+
+    async def set_state(self, *, chat=None, user=None,
+                        state: typing.Optional[typing.AnyStr] = None):
+        key = self._address(chat, user)
+        self._record(key)['state'] = self.resolve_state(state)
+        self._touch(key)
+
+    async def set_data(self, *, chat=None, user=None,
+                       data: typing.Dict = None):
+        key = self._address(chat, user)
+        self._record(key)['data'] = copy.deepcopy(data or {})
+        self._touch(key)
+
+    async def update_data(self, *, chat=None, user=None,
+                          data: typing.Dict = None, **kwargs):
+        if data is None:
+            data = {}
+        key = self._address(chat, user)
+        self._record(key)['data'].update(data, **kwargs)
+        self._touch(key)
+
+    async def reset_state(self, *, chat=None, user=None,
+                          with_data: typing.Optional[bool] = True):
+        key = self._address(chat, user)
+        record = self._record(key)
+        record['state'] = None
+        if with_data:
+            record['data'] = {}
+        self._touch(key)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        record = self.data.get(self._address(chat, user))
+        if record is None:
+            return copy.deepcopy(default or {})
+        return copy.deepcopy(record['bucket'])
+
+    async def set_bucket(self, *, chat=None, user=None,
+                         bucket: typing.Dict = None):
+        key = self._address(chat, user)
+        self._record(key)['bucket'] = copy.deepcopy(bucket or {})
+        self._touch(key)
+
+    async def update_bucket(self, *, chat=None, user=None,
+                            bucket: typing.Dict = None, **kwargs):
+        if bucket is None:
+            bucket = {}
+        key = self._address(chat, user)
+        self._record(key)['bucket'].update(bucket, **kwargs)
+        self._touch(key)
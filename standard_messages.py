@@ -1 +1,47 @@
-today_sanpin = 'В соответствии с п. 15 СанПиН 2.1.3684-21 "Хозяйствующий субъект, осуществляющий деятельность по сбору и транспортированию КГО (ТКО), обеспечивает вывоз их по установленному им графику с 7 до 23 часов." \n\n Спецтехника \U0001F69B работает на маршрутах, пожалуйста ожидайте \U0001F64F'
\ No newline at end of file
+from rendering import MessageTemplate
+
+today_sanpin = 'В соответствии с п. 15 СанПиН 2.1.3684-21 "Хозяйствующий субъект, осуществляющий деятельность по сбору и транспортированию КГО (ТКО), обеспечивает вывоз их по установленному им графику с 7 до 23 часов." \n\n Спецтехника \U0001F69B работает на маршрутах, пожалуйста ожидайте \U0001F64F'
+
+
+# Шаблоны заявки на вывоз КГМ
+KGM_FIELDS = (
+    "\U000026A0 Район: {district}\n"
+    "\U00002764 Управляющая компания: {management_company}\n"
+    "\U00002757 Адрес дома: {address}\n"
+    "\U0001F5D1 Тип отходов: {waste_type}\n\n"
+    "\U0001F5E8 Комментарий: {comment}\n\n"
+)
+KGM_CONFIRMATION = MessageTemplate(
+    "Проверьте введенные данные:\n" + KGM_FIELDS
+    + "Если все верно, нажмите 'Подтвердить'.")
+KGM_FORWARD = MessageTemplate("Получена заявка на вывоз КГМ:\n" + KGM_FIELDS)
+
+# Шаблоны обращения по качеству услуг
+COMPLAINT_DEFAULTS = {
+    'complaint_type': 'Не указано',
+    'trouble': 'Не указано',
+    'district': 'Не указан',
+    'management_company': 'Не указана',
+    'address': 'Не указан',
+    'comment': 'Отсутствует',
+    'contact_method': 'Не выбран',
+    'email': 'email не выбран',
+}
+COMPLAINT_FIELDS = (
+    "\U0001F5D1 Тип обращения: {complaint_type}\n"
+    "\U00002b50 Суть обращения: {trouble}\n"
+    "\U000026A0 Район: {district}\n"
+    "\U00002764 Управляющая компания: {management_company}\n"
+    "\U00002757 Адрес дома: {address}\n"
+    "\U0001F5E8 Комментарий: {comment}\n"
+    "\U00002712 Способ обратной связи: {contact_method}"
+)
+COMPLAINT_CONFIRMATION = MessageTemplate(
+    "Проверьте введенные данные:\n" + COMPLAINT_FIELDS
+    + "\n\nЕсли все верно, нажмите 'Подтвердить'.", COMPLAINT_DEFAULTS)
+COMPLAINT_EMAIL_CONFIRMATION = MessageTemplate(
+    "Проверьте введенные данные:\n" + COMPLAINT_FIELDS
+    + ": {email} \n\nЕсли все верно, нажмите 'Подтвердить'.",
+    COMPLAINT_DEFAULTS)
+COMPLAINT_FORWARD = MessageTemplate(
+    "Ботом получено обращение:\n" + COMPLAINT_FIELDS, COMPLAINT_DEFAULTS)
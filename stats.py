@@ -0,0 +1,137 @@
+"""
+Статистика заявок по сводным таблицам.
+
+Каждая сохранённая заявка увеличивает счётчики в таблице stats_hourly
+в той же транзакции, что и вставка в kgm_requests или
+quality_complaints. Счётчики хранятся по часам UTC, поэтому границы
+суток в любом часовом поясе (TIMEDELTA) совпадают с границами часов,
+а запрос /stats читает не больше нескольких сотен строк сводки вместо
+всей истории заявок.
+"""
+import sqlite3
+from datetime import date, datetime, time, timedelta
+
+# Разрезы статистики по видам заявок
+ROLLUP_DIMENSIONS = {
+    'kgm': ('district', 'waste_type'),
+    'complaint': ('district', 'complaint_type', 'trouble'),
+}
+KIND_TITLES = {
+    'kgm': 'Заявки на вывоз КГМ',
+    'complaint': 'Обращения по качеству',
+}
+DIMENSION_TITLES = {
+    'district': 'По районам',
+    'waste_type': 'По типу отходов',
+    'complaint_type': 'По типу обращения',
+    'trouble': 'По проблеме',
+}
+PERIOD_TITLES = ('сегодня', 'неделя', 'месяц')
+# Подпись для пустого значения разреза
+EMPTY_VALUE = '—'
+
+
+def add_to_rollup(conn: sqlite3.Connection, kind: str, timestamp: int,
+                  values: dict) -> None:
+    """
+    Учитывает заявку в сводной таблице.
+
+    Вызывается в транзакции вставки заявки, чтобы сводка не расходилась
+    с исходными таблицами.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с открытой транзакцией.
+        kind (str): Вид заявки, ключ ROLLUP_DIMENSIONS.
+        timestamp (int): Время заявки в формате UNIX.
+        values (dict): Значения разрезов заявки.
+    """
+    hour = timestamp // 3600
+    conn.executemany(
+        'INSERT INTO stats_hourly (hour, kind, dimension, value, count) '
+        'VALUES (?, ?, ?, ?, 1) '
+        'ON CONFLICT (hour, kind, dimension, value) '
+        'DO UPDATE SET count = count + 1',
+        [(hour, kind, dimension, values.get(dimension) or EMPTY_VALUE)
+         for dimension in ROLLUP_DIMENSIONS[kind]])
+
+
+def fetch_rollup(conn: sqlite3.Connection,
+                 starts: tuple[int, ...]) -> list[tuple]:
+    """
+    Суммирует сводку за несколько периодов одним запросом.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой.
+        starts (tuple): Начала периодов в формате UNIX.
+
+    Returns:
+        list: Строки (kind, dimension, value, count1, count2, ...),
+            по одному счётчику на период.
+    """
+    hours = [start // 3600 for start in starts]
+    sums = ', '.join('SUM(CASE WHEN hour >= ? THEN count ELSE 0 END)'
+                     for _ in hours)
+    return conn.execute(
+        f'SELECT kind, dimension, value, {sums} FROM stats_hourly '
+        f'WHERE hour >= ? GROUP BY kind, dimension, value',
+        (*hours, min(hours))).fetchall()
+
+
+def day_start(day: date, hours_offset: int = 0) -> int:
+    """
+    Начало суток по местному времени в формате UNIX.
+
+    Args:
+        day (date): Местная дата.
+        hours_offset (int): Сдвиг местного времени относительно
+            времени сервера, часов (TIMEDELTA).
+    """
+    return int((datetime.combine(day, time())
+                - timedelta(hours=hours_offset)).timestamp())
+
+
+def period_starts(now: datetime, hours_offset: int = 0) -> tuple[int, ...]:
+    """
+    Начала текущих суток, недели (с понедельника) и месяца.
+
+    Args:
+        now (datetime): Текущее время сервера.
+        hours_offset (int): Сдвиг местного времени относительно
+            времени сервера, часов (TIMEDELTA).
+
+    Returns:
+        tuple: Начала периодов в формате UNIX.
+    """
+    today = (now + timedelta(hours=hours_offset)).date()
+    days = (today, today - timedelta(days=today.weekday()),
+            today.replace(day=1))
+    return tuple(day_start(day, hours_offset) for day in days)
+
+
+def format_stats(rows: list[tuple]) -> str:
+    """Собирает текст ответа /stats из строк fetch_rollup."""
+    grouped = {}
+    for kind, dimension, value, *counts in rows:
+        grouped.setdefault(kind, {}).setdefault(dimension, []).append(
+            (value, counts))
+    lines = [f'Статистика заявок ({" / ".join(PERIOD_TITLES)})']
+    for kind, dimensions in ROLLUP_DIMENSIONS.items():
+        values = grouped.get(kind, {})
+        # Район есть у каждой заявки, поэтому его сумма - итог по виду
+        totals = [sum(column) for column in zip(
+            *(counts for _, counts in values.get('district', ())))]
+        lines.append('')
+        lines.append(f'{KIND_TITLES[kind]}: '
+                     f'{" / ".join(map(str, totals or [0] * 3))}')
+        for dimension in dimensions:
+            items = [(value, counts)
+                     for value, counts in values.get(dimension, ())
+                     if any(counts)]
+            if not items:
+                continue
+            lines.append(f'{DIMENSION_TITLES[dimension]}:')
+            # Сначала самые частые за месяц
+            items.sort(key=lambda item: (-item[1][-1], item[0]))
+            lines.extend(f'  {value}: {" / ".join(map(str, counts))}'
+                         for value, counts in items)
+    return '\n'.join(lines)
@@ -0,0 +1,177 @@
+"""
+Тесты пакетной записи в Google Таблицы с заглушкой клиента gspread.
+"""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from gspread.exceptions import APIError
+
+from async_database import AsyncDatabase
+from executors import BackendLimit, BlockingExecutor
+from gsheets_writer import SheetWriter, fetch_queued_rows
+
+
+class FakeResponse:
+    """Ответ Sheets API с ошибкой."""
+
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.text = ''
+
+    def json(self) -> dict:
+        return {'error': {'code': self.status_code, 'message': 'quota',
+                          'status': 'RESOURCE_EXHAUSTED'}}
+
+
+class FakeWorksheet:
+    def __init__(self, client: 'FakeClient', name: str):
+        self.client = client
+        self.name = name
+
+    def append_rows(self, rows: list, **kwargs) -> None:
+        self.client.requests.append(('append_rows', self.name, len(rows)))
+        if self.client.quota_errors:
+            self.client.quota_errors -= 1
+            raise APIError(FakeResponse(429))
+        self.client.rows.setdefault(self.name, []).extend(rows)
+
+
+class FakeSpreadsheet:
+    def __init__(self, client: 'FakeClient', name: str):
+        self.client = client
+        self.name = name
+
+    @property
+    def sheet1(self) -> FakeWorksheet:
+        self.client.requests.append(('sheet1', self.name))
+        return FakeWorksheet(self.client, self.name)
+
+
+class FakeClient:
+    """Заглушка gspread.Client, которая записывает все запросы."""
+
+    def __init__(self, quota_errors: int = 0, broken: tuple = ()):
+        self.quota_errors = quota_errors
+        self.broken = broken
+        self.requests: list[tuple] = []
+        self.rows: dict[str, list] = {}
+
+    def open(self, name: str) -> FakeSpreadsheet:
+        self.requests.append(('open', name))
+        if name in self.broken:
+            raise APIError(FakeResponse(404))
+        return FakeSpreadsheet(self, name)
+
+    def appends(self) -> list[tuple]:
+        return [request for request in self.requests
+                if request[0] == 'append_rows']
+
+
+class SheetWriterTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.executor = BlockingExecutor({
+            'sqlite': BackendLimit(2, 30), 'google': BackendLimit(1, 30)})
+        self.db = AsyncDatabase(os.path.join(self.folder.name, 'test.db'),
+                                readers=1, executor=self.executor)
+        await self.db.open()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.executor.shutdown()
+        self.folder.cleanup()
+
+    def make_writer(self, client: FakeClient, **kwargs) -> SheetWriter:
+        return SheetWriter(lambda: client, self.executor, self.db, **kwargs)
+
+    async def test_rows_are_sent_in_one_request_per_sheet(self):
+        client = FakeClient()
+        writer = self.make_writer(client, batch_size=100,
+                                  flush_interval=60)
+        started = time.monotonic()
+        for number in range(45):
+            await writer.append_row('left' if number % 3 else 'right',
+                                    [number, 'Адрес'])
+        # Шаг outbox не ждёт отправки пакета
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(client.requests, [])
+
+        self.assertEqual(await writer.flush(), 45)
+        self.assertEqual(sorted(client.appends()),
+                         [('append_rows', 'left', 30),
+                          ('append_rows', 'right', 15)])
+        self.assertEqual(client.rows['right'][:2], [[0, 'Адрес'],
+                                                    [3, 'Адрес']])
+        self.assertEqual(await self.db.read(fetch_queued_rows, 10), [])
+
+        # Лист закэширован: open и sheet1 больше не вызываются
+        await writer.append_row('left', [45, 'Адрес'])
+        await writer.flush()
+        self.assertEqual(len(client.requests), 4 + 3)
+
+    async def test_full_batch_is_sent_by_background_task(self):
+        client = FakeClient()
+        writer = self.make_writer(client, batch_size=10, flush_interval=60)
+        writer.start()
+        try:
+            for number in range(10):
+                await writer.append_row('left', [number])
+            for _ in range(100):
+                if client.appends():
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            await writer.close()
+        self.assertEqual(client.appends(), [('append_rows', 'left', 10)])
+
+    async def test_quota_error_pauses_and_keeps_rows(self):
+        client = FakeClient(quota_errors=1)
+        writer = self.make_writer(client, quota_pause=0.5)
+        for number in range(5):
+            await writer.append_row('left', [number])
+
+        with self.assertRaises(APIError):
+            await writer.flush()
+        self.assertEqual(len(await self.db.read(fetch_queued_rows, 10)), 5)
+
+        started = time.monotonic()
+        self.assertEqual(await writer.flush(), 5)
+        # Повтор ждёт окончания паузы после 429
+        self.assertGreaterEqual(time.monotonic() - started, 0.4)
+        self.assertEqual(client.rows['left'], [[n] for n in range(5)])
+        self.assertEqual(len(client.appends()), 2)
+
+    async def test_failing_sheet_does_not_block_others(self):
+        client = FakeClient(broken=('broken',))
+        writer = self.make_writer(client, max_rows=4, max_attempts=2,
+                                  retry_delay=0)
+        failures = []
+
+        async def on_failure(sheet_name, rows, error):
+            failures.append((sheet_name, rows))
+
+        writer.on_failure = on_failure
+        for number in range(6):
+            await writer.append_row('broken', [number])
+        for number in range(3):
+            await writer.append_row('left', [number])
+
+        # Строки исправной таблицы за первыми max_rows всё равно уходят
+        self.assertEqual(await writer.flush(), 3)
+        self.assertEqual(client.rows['left'], [[n] for n in range(3)])
+        self.assertEqual(len(await self.db.read(fetch_queued_rows, 10)), 6)
+        self.assertEqual(failures, [])
+
+        # После max_attempts строки передаются в on_failure и удаляются
+        self.assertEqual(await writer.flush(), 0)
+        self.assertEqual(failures, [('broken', [[0], [1], [2], [3]]),
+                                    ('broken', [[4], [5]])])
+        self.assertEqual(await self.db.read(fetch_queued_rows, 10), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Тесты почтового сервиса с заглушкой SMTP-сервера.
+"""
+import asyncio
+import smtplib
+import time
+import unittest
+from unittest import mock
+
+from executors import BackendLimit, BlockingExecutor
+from mailer import Mailer
+
+
+class FakeSMTP:
+    """Заглушка smtplib.SMTP, которая записывает соединения и письма."""
+
+    connections = 0
+    closed = 0
+    messages: list[tuple] = []
+    # Следующие sendmail падают с этой ошибкой
+    failures: list[Exception] = []
+    delay = 0.0
+
+    def __init__(self, host: str, port: int, timeout: float = None):
+        FakeSMTP.connections += 1
+
+    def ehlo(self):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, user: str, password: str):
+        pass
+
+    def sendmail(self, sender: str, target: str, message: str):
+        time.sleep(self.delay)
+        if FakeSMTP.failures:
+            raise FakeSMTP.failures.pop(0)
+        FakeSMTP.messages.append((target, message))
+
+    def quit(self):
+        FakeSMTP.closed += 1
+
+    def close(self):
+        FakeSMTP.closed += 1
+
+
+class MailerTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        FakeSMTP.connections = 0
+        FakeSMTP.closed = 0
+        FakeSMTP.messages = []
+        FakeSMTP.failures = []
+        FakeSMTP.delay = 0.0
+        patcher = mock.patch('mailer.smtplib.SMTP', FakeSMTP)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.executor = BlockingExecutor({'smtp': BackendLimit(1, 5)})
+        self.addCleanup(self.executor.shutdown)
+
+    def make_mailer(self, **kwargs) -> Mailer:
+        return Mailer(self.executor, 'smtp.example.com', 587,
+                      'bot@example.com', password='secret', **kwargs)
+
+    async def test_connection_is_reused(self):
+        mailer = self.make_mailer()
+        mailer.start()
+        for number in range(3):
+            await mailer.send(f'Письмо {number}', 'staff@example.com')
+        await mailer.stop()
+        self.assertEqual(len(FakeSMTP.messages), 3)
+        self.assertEqual(FakeSMTP.connections, 1)
+
+    async def test_reconnects_after_disconnect(self):
+        FakeSMTP.failures = [smtplib.SMTPServerDisconnected('closed')]
+        mailer = self.make_mailer()
+        mailer.start()
+        await mailer.send('Письмо', 'staff@example.com')
+        await mailer.stop()
+        self.assertEqual(len(FakeSMTP.messages), 1)
+        self.assertEqual(FakeSMTP.connections, 2)
+        # Старое соединение закрыто, новое - при остановке
+        self.assertEqual(FakeSMTP.closed, 2)
+
+    async def test_reconnects_after_connection_reset(self):
+        FakeSMTP.failures = [ConnectionResetError('reset')]
+        mailer = self.make_mailer()
+        mailer.start()
+        await mailer.send('Письмо', 'staff@example.com')
+        await mailer.stop()
+        self.assertEqual(len(FakeSMTP.messages), 1)
+        self.assertEqual(FakeSMTP.connections, 2)
+
+    async def test_send_error_is_raised_to_caller(self):
+        FakeSMTP.failures = [smtplib.SMTPRecipientsRefused({})]
+        mailer = self.make_mailer()
+        mailer.start()
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            await mailer.send('Письмо', 'wrong@example.com')
+        await mailer.send('Письмо', 'staff@example.com')
+        await mailer.stop()
+        # Отказ сервера не повторяется, соединение используется дальше
+        self.assertEqual(len(FakeSMTP.messages), 1)
+        self.assertEqual(FakeSMTP.connections, 1)
+
+    async def test_worker_survives_disconnect_error(self):
+        mailer = self.make_mailer(idle_timeout=0.05)
+        with mock.patch.object(Mailer, '_disconnect',
+                               side_effect=RuntimeError('timeout')):
+            mailer.start()
+            await asyncio.sleep(0.2)
+            self.assertFalse(mailer._task.done())
+        await mailer.send('Письмо', 'staff@example.com')
+        await mailer.stop()
+        self.assertEqual(len(FakeSMTP.messages), 1)
+
+    async def test_send_times_out_and_letter_is_dropped(self):
+        FakeSMTP.delay = 0.3
+        mailer = self.make_mailer(send_timeout=0.1)
+        mailer.start()
+        with self.assertRaises(asyncio.TimeoutError):
+            await mailer.send('Первое', 'staff@example.com')
+        # Второе письмо ждёт в очереди, пока отправляется первое
+        with self.assertRaises(asyncio.TimeoutError):
+            await mailer.send('Второе', 'staff@example.com')
+        await asyncio.sleep(0.5)
+        await mailer.stop()
+        # Первое уже отправлялось, второе убрано из очереди по таймауту
+        self.assertEqual(len(FakeSMTP.messages), 1)
+
+    async def test_digest_errors_are_logged(self):
+        FakeSMTP.failures = [smtplib.SMTPDataError(554, 'rejected')]
+        mailer = self.make_mailer(digest_minutes=0.001)
+        mailer.start()
+        with self.assertLogs('mailer', 'ERROR'):
+            await mailer.send('Первое', 'staff@example.com')
+            await mailer.send('Второе', 'staff@example.com')
+            await asyncio.sleep(0.3)
+        self.assertFalse(mailer._task.done())
+        await mailer.send('Третье', 'staff@example.com')
+        await mailer.stop()
+        self.assertEqual(len(FakeSMTP.messages), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Кэш профилей зарегистрированных пользователей.
+
+Ограничен по размеру (вытеснение LRU) и по времени жизни записи.
+"""
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """LRU-кэш профилей пользователей с TTL и счётчиками попаданий."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600):
+        """
+        Args:
+            maxsize (int): Максимальное количество профилей в кэше.
+            ttl (float): Время жизни записи в секундах.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, user_id: int) -> dict | None:
+        """Возвращает профиль из кэша или None, если его нет или он устарел."""
+        item = self._data.get(user_id)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[user_id]
+            self.misses += 1
+            return None
+        self._data.move_to_end(user_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, user_id: int, profile: dict) -> None:
+        """Сохраняет профиль, вытесняя самые давно использованные записи."""
+        self._data[user_id] = (time.monotonic() + self.ttl, profile)
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Удаляет профиль из кэша."""
+        self._data.pop(user_id, None)
+
+    def stats(self) -> dict:
+        """Возвращает счётчики кэша для подбора его размера."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,51 @@
+"""
+Прогрев внешних сервисов при запуске.
+
+Клиенты Google Таблиц, Яндекс.Диска и почты создаются при первом
+обращении, поэтому бот запускается и отвечает на меню, даже если
+какой-то сервис недоступен. Прогрев выполняет первые обращения заранее
+и параллельно, чтобы их не ждала первая заявка. Ошибки прогрева только
+логируются: шаги outbox повторят обращение позже.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+async def _warm_up_one(name: str, func: Callable[[], Awaitable],
+                       timeout: float) -> float | None:
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(func(), timeout)
+    except Exception as e:
+        logger.warning("Сервис %s недоступен при запуске: %r", name, e)
+        return None
+    elapsed = time.perf_counter() - start
+    logger.info("Сервис %s готов за %.2f с", name, elapsed)
+    return elapsed
+
+
+async def warm_up(backends: dict[str, Callable[[], Awaitable]],
+                  timeout: float = 30) -> dict[str, float | None]:
+    """
+    Параллельно прогревает сервисы.
+
+    Args:
+        backends (dict): Имя сервиса -> функция, возвращающая корутину
+            прогрева.
+        timeout (float): Сколько ждать каждый сервис, сек.
+
+    Returns:
+        dict: Имя сервиса -> время прогрева в секундах или None,
+            если сервис недоступен.
+    """
+    start = time.perf_counter()
+    names = list(backends)
+    results = await asyncio.gather(*(
+        _warm_up_one(name, backends[name], timeout) for name in names))
+    logger.info("Прогрев сервисов занял %.2f с",
+                time.perf_counter() - start)
+    return dict(zip(names, results))
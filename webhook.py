@@ -0,0 +1,142 @@
+"""
+Работа бота через вебхук вместо long polling.
+
+aiohttp-сервер проверяет секретный токен Telegram, сразу отвечает 200
+и обрабатывает обновление в отдельной задаче. Обновления одного
+пользователя обрабатываются строго по очереди, чтобы не нарушался
+порядок шагов машины состояний.
+"""
+import asyncio
+import hmac
+import logging
+from typing import Awaitable, Callable
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+Hook = Callable[[Dispatcher], Awaitable[None]]
+
+
+def update_user_id(payload: dict) -> int | None:
+    """Возвращает id пользователя или чата, от которого пришло обновление."""
+    for key, value in payload.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        sender = value.get('from') or value.get('user')
+        if sender:
+            return sender.get('id')
+        chat = value.get('chat') or value.get('message', {}).get('chat')
+        if chat:
+            return chat.get('id')
+    return None
+
+
+class UpdateProcessor:
+    """Обрабатывает сырые обновления, сохраняя порядок для пользователя."""
+
+    def __init__(self, dispatcher: Dispatcher):
+        self.dispatcher = dispatcher
+        # id пользователя -> [блокировка, число ожидающих обновлений]
+        self._locks: dict[int | None, list] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def feed(self, payload: dict) -> None:
+        """Ставит обновление в обработку и сразу возвращает управление."""
+        task = asyncio.create_task(self._process(payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, payload: dict) -> None:
+        user_id = update_user_id(payload)
+        entry = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                Bot.set_current(self.dispatcher.bot)
+                Dispatcher.set_current(self.dispatcher)
+                # Через updates_handler, как в polling aiogram: иначе
+                # не вызываются middleware уровня обновления
+                await self.dispatcher.updates_handler.notify(
+                    types.Update(**payload))
+        except Exception as e:
+            logger.exception(f"Ошибка при обработке обновления: {e}")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user_id]
+
+    async def wait_closed(self) -> None:
+        """Дожидается обработки уже принятых обновлений."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def make_app(path: str, secret: str | None, feed: Callable[[dict], None]
+             ) -> web.Application:
+    """Создаёт aiohttp-приложение, принимающее обновления на path."""
+
+    async def handle(request: web.Request) -> web.Response:
+        if secret and not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, ''), secret):
+            logger.warning("Вебхук: неверный секретный токен от %s",
+                           request.remote)
+            return web.Response(status=403)
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        feed(payload)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
+
+
+def run_webhook(dispatcher: Dispatcher, webhook_url: str, path: str,
+                secret: str | None, host: str, port: int,
+                process_backlog: bool = False,
+                on_startup: Hook | None = None,
+                on_shutdown: Hook | None = None) -> None:
+    """
+    Запускает бота в режиме вебхука.
+
+    Args:
+        dispatcher (Dispatcher): Диспетчер бота.
+        webhook_url (str): Публичный адрес вебхука для Telegram.
+        path (str): Путь, на котором сервер принимает обновления.
+        secret (str): Секретный токен, который Telegram передаёт
+            в заголовке каждого запроса.
+        host (str): Адрес, на котором слушает сервер.
+        port (int): Порт сервера.
+        process_backlog (bool): Обработать обновления, накопившиеся
+            за время перезапуска, вместо того чтобы их сбросить.
+        on_startup (Hook): Вызывается после запуска сервера.
+        on_shutdown (Hook): Вызывается при остановке сервера.
+    """
+    processor = UpdateProcessor(dispatcher)
+    app = make_app(path, secret, processor.feed)
+
+    async def startup(_app: web.Application) -> None:
+        if on_startup is not None:
+            await on_startup(dispatcher)
+        await dispatcher.bot.set_webhook(
+            webhook_url, secret_token=secret,
+            drop_pending_updates=not process_backlog)
+        logger.info("Вебхук установлен: %s", webhook_url)
+
+    async def shutdown(_app: web.Application) -> None:
+        await processor.wait_closed()
+        if on_shutdown is not None:
+            await on_shutdown(dispatcher)
+        await dispatcher.storage.close()
+        await dispatcher.storage.wait_closed()
+        await dispatcher.bot.close()
+
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    web.run_app(app, host=host, port=port)
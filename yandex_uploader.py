@@ -0,0 +1,75 @@
+"""
+Асинхронная загрузка файлов на Яндекс.Диск.
+
+Один yadisk.AsyncClient с HTTP-сессией живёт всё время работы бота.
+Количество одновременных загрузок и таймаут задаются лимитом бэкенда
+yandex в BlockingExecutor.
+"""
+import logging
+import uuid
+from datetime import datetime
+from typing import BinaryIO
+
+import yadisk
+
+from executors import BlockingExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def make_remote_name(extension: str = '.jpg') -> str:
+    """Формирует уникальное имя файла: время загрузки и случайный uuid."""
+    return f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex}{extension}"
+
+
+class YandexUploader:
+    """Загрузчик файлов на Яндекс.Диск с постоянной сессией."""
+
+    def __init__(self, token: str, executor: BlockingExecutor):
+        """
+        Args:
+            token (str): OAuth-токен Яндекс.Диска.
+            executor (BlockingExecutor): Источник лимита и таймаута
+                бэкенда yandex.
+        """
+        self._token = token
+        self._executor = executor
+        self._client: yadisk.AsyncClient | None = None
+
+    @property
+    def client(self) -> yadisk.AsyncClient:
+        """Клиент создаётся при первом обращении и переиспользуется."""
+        if self._client is None:
+            self._client = yadisk.AsyncClient(token=self._token,
+                                              session='aiohttp')
+        return self._client
+
+    async def upload(self, file: bytes | BinaryIO, disk_folder: str) -> str:
+        """
+        Загружает файл в папку disk_folder.
+
+        Args:
+            file: Путь к файлу или файловый объект.
+            disk_folder (str): Папка на Яндекс.Диске.
+
+        Returns:
+            str: Путь к загруженному файлу на Яндекс.Диске.
+        """
+        remote_path = f'/{disk_folder.strip("/")}/{make_remote_name()}'
+        await self._executor.run_coroutine(
+            'yandex', self.client.upload(file, remote_path, overwrite=False))
+        logger.info("Файл загружен на Яндекс.Диск: %s", remote_path)
+        return remote_path
+
+    async def warm_up(self) -> None:
+        """Создаёт клиент и проверяет токен."""
+        valid = await self._executor.run_coroutine(
+            'yandex', self.client.check_token())
+        if not valid:
+            raise ValueError("Недействительный токен Яндекс.Диска")
+
+    async def close(self) -> None:
+        """Закрывает HTTP-сессию клиента."""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None